@@ -1,7 +1,7 @@
 import os
 from functools import lru_cache
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 import logging
 
 from dotenv import load_dotenv, dotenv_values
@@ -38,22 +38,50 @@ def _read_env(name: str, default: Optional[str] = None) -> Optional[str]:
     cleaned = str(val).strip()
     return cleaned if cleaned else default
 
+def _read_bool(name: str, default: bool = False) -> bool:
+    """Baca variabel boolean (1/true/yes/on) dari environment."""
+    val = _read_env(name)
+    if val is None:
+        return default
+    return val.lower() in {"1", "true", "yes", "on"}
+
 class Settings:
     def __init__(self) -> None:
         # Pemuatan Variabel dari Environment atau .env
         self.gemini_api_key: str = _read_env("GEMINI_API_KEY") or ""
+        # Pool key milik server (dipisah koma). GEMINI_API_KEY ikut masuk pool.
+        pool_keys = [k.strip() for k in (_read_env("GEMINI_API_KEYS") or "").split(",")]
+        self.gemini_api_keys: List[str] = list(
+            dict.fromkeys(k for k in [self.gemini_api_key, *pool_keys] if k)
+        )
         
         # --- UPGRADE: Default ke Gemini 2.0 Flash Experimental ---
         self.gemini_model: str = _read_env("GEMINI_MODEL") or "gemini-2.5-flash"
         
+        # Root API Gemini (tanpa versi). Bisa diarahkan ke mock lokal, mis. http://127.0.0.1:8765
+        self.gemini_api_root: str = (
+            _read_env("GEMINI_API_ROOT") or "https://generativelanguage.googleapis.com"
+        ).rstrip("/")
+
         # URL API Google yang benar
         self.gemini_base_url: str = _read_env(
             "GEMINI_BASE_URL",
-            "https://generativelanguage.googleapis.com/v1beta/models", 
-        ) or "https://generativelanguage.googleapis.com/v1beta/models"
+            f"{self.gemini_api_root}/v1beta/models",
+        ) or f"{self.gemini_api_root}/v1beta/models"
+
+        # Context caching Gemini untuk teks persona (cachedContents); mati = selalu inline.
+        self.gemini_context_cache: bool = _read_bool("GEMINI_CONTEXT_CACHE", False)
+        self.gemini_context_cache_ttl: float = float(_read_env("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+        # Persona lebih pendek dari ini tidak dicache (Gemini punya minimum token sendiri per model).
+        self.gemini_context_cache_min_chars: int = int(_read_env("GEMINI_CONTEXT_CACHE_MIN_CHARS", "2000"))
         
         # Angka
         self.request_timeout: float = float(_read_env("REQUEST_TIMEOUT", "45"))
+        # Budget total per request (detik): tahap pra-generasi, seluruh rantai fallback model,
+        # dan fallback emosi Gemini. Stream yang sudah jalan tidak diputus. Klien boleh minta
+        # lebih pendek/panjang lewat header X-Request-Timeout, dibatasi REQUEST_DEADLINE_MAX.
+        self.request_deadline: float = float(_read_env("REQUEST_DEADLINE", "60"))
+        self.request_deadline_max: float = float(_read_env("REQUEST_DEADLINE_MAX", "120"))
         self.max_retries: int = int(_read_env("MAX_RETRIES", "3"))
         self.backoff_factor: float = float(_read_env("BACKOFF_FACTOR", "1.6"))
         
@@ -62,8 +90,143 @@ class Settings:
             _read_env("MEMORY_DB_PATH", "/code/memory.db")
         )
 
+        # Model SentenceTransformer untuk memori/emosi/intent. Kalau berbeda dari model yang
+        # tercatat di metadata indeks, indeks lama tetap dipakai sambil dimigrasi di background.
+        self.embedding_model: str = _read_env("EMBEDDING_MODEL", "all-MiniLM-L6-v2") or "all-MiniLM-L6-v2"
+        # Jumlah memori per batch encode saat rebuild/migrasi indeks.
+        self.memory_migration_batch: int = int(_read_env("MEMORY_MIGRATION_BATCH", "256"))
+        # Setelah model gagal dimuat (mis. unduhan HF gagal), jeda sebelum mencoba lagi; berlipat
+        # tiap kegagalan beruntun. Selama jeda, emosi/intent langsung pakai leksikon saja.
+        self.embedding_load_backoff: float = float(_read_env("EMBEDDING_LOAD_BACKOFF", "30"))
+
+        # String faiss.index_factory untuk indeks memori (mis. "Flat", "HNSW32", "IVF1024,Flat").
+        self.memory_index_factory: str = _read_env("MEMORY_INDEX_FACTORY", "Flat") or "Flat"
+        # Muat model embedding + indeks di background setelah startup (default: saat dipakai pertama)
+        self.memory_preload: bool = _read_bool("MEMORY_PRELOAD", False)
+
+        # --- KONTEKS PERCAKAPAN (HISTORY COMPACTION) ---
+        # Batas estimasi token untuk riwayat yang dikirim apa adanya ke Gemini.
+        self.history_token_budget: int = int(_read_env("HISTORY_TOKEN_BUDGET", "6000"))
+        # Batas token untuk ringkasan giliran lama (rolling summary).
+        self.summary_token_budget: int = int(_read_env("SUMMARY_TOKEN_BUDGET", "400"))
+        self.summary_enabled: bool = _read_bool("HISTORY_SUMMARY_ENABLED", True)
+        self.summary_cache_items: int = int(_read_env("SUMMARY_CACHE_ITEMS", "256"))
+        # Ringkasan baru diminta setelah ekor yang belum diringkas sepanjang ini (pesan atau token),
+        # bukan tiap giliran; satu pembaruan berjalan per percakapan.
+        self.summary_refresh_min_messages: int = int(_read_env("SUMMARY_REFRESH_MIN_MESSAGES", "6"))
+        self.summary_refresh_min_tokens: int = int(_read_env("SUMMARY_REFRESH_MIN_TOKENS", "400"))
+
+        # --- KLASIFIKASI EMOSI AVATAR ---
+        # Di bawah ambang ini, klasifikasi lokal dianggap ragu dan Gemini dipakai sebagai fallback.
+        self.emotion_confidence_threshold: float = float(
+            _read_env("EMOTION_CONFIDENCE_THRESHOLD", "0.5")
+        )
+        self.emotion_local_embeddings: bool = _read_bool("EMOTION_LOCAL_EMBEDDINGS", True)
+        self.emotion_cache_items: int = int(_read_env("EMOTION_CACHE_ITEMS", "1024"))
+
+        # --- ROUTER INTENT (WEB / MEMORI / OBROLAN) ---
+        # Pencarian web dijalankan kalau probabilitas intent "web" mencapai ambang ini.
+        self.intent_web_threshold: float = float(_read_env("INTENT_WEB_THRESHOLD", "0.4"))
+        self.intent_local_embeddings: bool = _read_bool("INTENT_LOCAL_EMBEDDINGS", True)
+        self.intent_cache_items: int = int(_read_env("INTENT_CACHE_ITEMS", "1024"))
+        self.intent_budget: float = float(_read_env("INTENT_BUDGET", "0.5"))
+
+        # --- ADMISSION CONTROL ---
+        self.admission_global_limit: int = int(_read_env("ADMISSION_GLOBAL_LIMIT", "32"))
+        self.admission_per_key_limit: int = int(_read_env("ADMISSION_PER_KEY_LIMIT", "4"))
+        self.admission_max_queue: int = int(_read_env("ADMISSION_MAX_QUEUE", "64"))
+        self.admission_queue_timeout: float = float(_read_env("ADMISSION_QUEUE_TIMEOUT", "10"))
+
+        # --- KEY POOL (limit per key per model, turun saat 429 dan pulih sampai KEY_POOL_RPM) ---
+        # 0 = tanpa batas lokal: key hanya diistirahatkan setelah 429/Retry-After dari Gemini.
+        # Isi dengan kuota key (mis. 15 untuk free tier) supaya limit terhindar sebelum request dikirim.
+        self.key_pool_rpm: float = float(_read_env("KEY_POOL_RPM", "0"))
+        self.key_pool_burst: float = float(_read_env("KEY_POOL_BURST", "5"))
+        self.key_pool_max_wait: float = float(_read_env("KEY_POOL_MAX_WAIT", "5"))
+
+        # --- CACHE RESPONS (L1 RAM + L2 SQLITE OPSIONAL) ---
+        self.response_cache_max_bytes: int = int(_read_env("RESPONSE_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+        self.response_cache_ttl: float = float(_read_env("RESPONSE_CACHE_TTL", "3600"))
+        cache_db = _read_env("RESPONSE_CACHE_DB_PATH")
+        self.response_cache_db_path: Optional[Path] = Path(cache_db) if cache_db else None
+        self.response_cache_l2_max_bytes: int = int(
+            _read_env("RESPONSE_CACHE_L2_MAX_BYTES", str(64 * 1024 * 1024))
+        )
+
+        # --- CACHE SEMANTIK (OBROLAN RINGAN, OPSIONAL) ---
+        self.semantic_cache: bool = _read_bool("SEMANTIC_CACHE", False)
+        # Kemiripan kosinus minimum antara pesan baru dan pesan yang jawabannya di-cache.
+        self.semantic_cache_threshold: float = float(_read_env("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+        self.semantic_cache_ttl: float = float(_read_env("SEMANTIC_CACHE_TTL", "3600"))
+        # Entri per persona; yang paling lama tidak kena dibuang lebih dulu.
+        self.semantic_cache_max_entries: int = int(_read_env("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+        # Pesan lebih panjang dari ini tidak dicari/di-cache (jarang sekadar parafrase).
+        self.semantic_cache_max_chars: int = int(_read_env("SEMANTIC_CACHE_MAX_CHARS", "120"))
+        # Giliran sebelum pesan terakhir yang harus identik supaya jawaban boleh dipakai ulang.
+        self.semantic_cache_context_turns: int = int(_read_env("SEMANTIC_CACHE_CONTEXT_TURNS", "1"))
+
+        # --- ENDPOINT ADMIN (PROFIL CPU, TRACEMALLOC, TASK ASYNCIO) ---
+        # Mati secara default; kalau aktif, tiap request wajib membawa X-Admin-Token yang cocok.
+        self.admin_endpoints: bool = _read_bool("ADMIN_ENDPOINTS", False)
+        self.admin_token: Optional[str] = _read_env("ADMIN_TOKEN")
+        # Batas durasi satu profil CPU (detik) dan interval sampling default (ms).
+        self.profile_max_seconds: float = float(_read_env("PROFILE_MAX_SECONDS", "60"))
+        self.profile_interval_ms: float = float(_read_env("PROFILE_INTERVAL_MS", "10"))
+
+        # --- STREAMING SSE (BACKPRESSURE & DETEKSI DISCONNECT) ---
+        # Antrean frame per koneksi; kalau penuh, producer ikut menunggu klien.
+        self.stream_queue_maxsize: int = int(_read_env("STREAM_QUEUE_MAXSIZE", "32"))
+        # Seberapa jauh upstream boleh mendahului pembaca tercepat (dalam chunk token).
+        self.stream_max_lag: int = int(_read_env("STREAM_MAX_LAG", "64"))
+        self.disconnect_poll_interval: float = float(_read_env("DISCONNECT_POLL_INTERVAL", "0.5"))
+        self.stream_heartbeat_interval: float = float(_read_env("STREAM_HEARTBEAT_INTERVAL", "15"))
+        # Delta token digabung per jendela waktu (ms) atau per jumlah karakter; 0 = satu frame per delta.
+        self.stream_coalesce_window_ms: float = float(_read_env("STREAM_COALESCE_WINDOW_MS", "20"))
+        self.stream_coalesce_max_chars: int = int(_read_env("STREAM_COALESCE_MAX_CHARS", "512"))
+        # Stream yang putus bisa disambung via Last-Event-ID; generasi ditunggu selama masa tenggang.
+        self.stream_resume_grace: float = float(_read_env("STREAM_RESUME_GRACE", "10"))
+        self.stream_resume_ttl: float = float(_read_env("STREAM_RESUME_TTL", "300"))
+        self.stream_resume_max_streams: int = int(_read_env("STREAM_RESUME_MAX_STREAMS", "256"))
+        # Batas buffer replay per stream (byte frame SSE); frame tertua dibuang, 0 = tanpa batas
+        self.stream_resume_buffer_bytes: int = int(_read_env("STREAM_RESUME_BUFFER_BYTES", "131072"))
+
+        # --- EXECUTOR THREAD BERNAMA ---
+        # Pool terpisah per jenis kerja blocking: CPU/embedding, SQLite, dan jaringan blocking.
+        self.executor_embedding_workers: int = int(_read_env("EXECUTOR_EMBEDDING_WORKERS", "2"))
+        self.executor_sqlite_workers: int = int(_read_env("EXECUTOR_SQLITE_WORKERS", "4"))
+        self.executor_network_workers: int = int(_read_env("EXECUTOR_NETWORK_WORKERS", "8"))
+        # Thread intra-op torch; 0 = jumlah core dibagi worker embedding.
+        self.torch_num_threads: int = int(_read_env("TORCH_NUM_THREADS", "0"))
+
+        # --- UPLOAD GAMBAR (/chat/upload) ---
+        self.image_upload_max_bytes: int = int(_read_env("IMAGE_UPLOAD_MAX_BYTES", str(10 * 1024 * 1024)))
+        # Di atas ukuran ini, spool gambar pindah dari RAM ke file sementara.
+        self.image_spool_max_bytes: int = int(_read_env("IMAGE_SPOOL_MAX_BYTES", str(1024 * 1024)))
+
+        # --- PIPELINE PRA-GENERASI ---
+        # Memori, pencarian web, gambar, dan warm-up koneksi jalan paralel di bawah satu deadline (detik).
+        self.pregen_deadline: float = float(_read_env("PREGEN_DEADLINE", "3"))
+        self.pregen_memory_budget: float = float(_read_env("PREGEN_MEMORY_BUDGET", "1"))
+        self.pregen_search_budget: float = float(_read_env("PREGEN_SEARCH_BUDGET", "2.5"))
+        self.upstream_warmup: bool = _read_bool("UPSTREAM_WARMUP", True)
+
+        # --- TRACING (SPAN PER REQUEST) ---
+        # Satu baris log JSON per request /chat; hanya yang >= TRACE_LOG_MIN_MS yang ditulis.
+        self.trace_log_enabled: bool = _read_bool("TRACE_LOG", True)
+        self.trace_log_min_ms: float = float(_read_env("TRACE_LOG_MIN_MS", "0"))
+
+        # --- LOGGING ---
+        # Log ditulis lewat antrean ke thread terpisah; format "json" atau "text".
+        self.log_level: str = (_read_env("LOG_LEVEL", "INFO") or "INFO").upper()
+        self.log_format: str = (_read_env("LOG_FORMAT", "json") or "json").lower()
+        self.log_queue_size: int = int(_read_env("LOG_QUEUE_SIZE", "10000"))
+        # Sampling per logger untuk log < WARNING, mis. "app.main=0.1,app.services.cache=0.05"
+        self.log_sample: str = _read_env("LOG_SAMPLE", "") or ""
+        # Batas log < WARNING per logger per detik (0 = tanpa batas)
+        self.log_rate_limit: float = float(_read_env("LOG_RATE_LIMIT", "100"))
+
         # --- VALIDASI DIMATIKAN (SOLUSI ERROR) ---
-        if not self.gemini_api_key:
+        if not self.gemini_api_keys:
             logger.warning("⚠️ Server berjalan tanpa API Key ENV. Menunggu Key dari Frontend.")
 
 @lru_cache(maxsize=1)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Deadline per request yang ikut terbawa ke semua tahap di bawahnya.
+Tanpa ini setiap percobaan ke Gemini mendapat REQUEST_TIMEOUT penuh (5 model
+untuk chat, 4 untuk emosi), jadi satu request bisa menggantung bermenit-menit
+padahal kliennya sudah lama menyerah. Deadline disimpan di contextvar (seperti
+trace aktif), jadi terbawa ke task dan thread executor yang dibuat dari request
+itu; tiap tahap cukup memanggil `time_left(batas_tahap)`.
+"""
+
+import contextvars
+import math
+import time
+from typing import Optional
+
+from .config import get_settings
+from .metrics import DEADLINE_EXCEEDED
+
+DEADLINE_HEADER = "X-Request-Timeout"
+
+
+class DeadlineExceeded(TimeoutError):
+    """Budget waktu request sudah habis sebelum tahap berikutnya bisa dimulai."""
+
+    def __init__(self, stage: str) -> None:
+        super().__init__(f"Batas waktu request habis sebelum tahap '{stage}'.")
+        self.stage = stage
+
+
+class Deadline:
+    __slots__ = ("budget", "expires_at")
+
+    def __init__(self, budget: float) -> None:
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+
+_current_deadline: "contextvars.ContextVar[Optional[Deadline]]" = contextvars.ContextVar(
+    "current_deadline", default=None
+)
+
+
+def resolve_budget(header_value: Optional[str]) -> float:
+    """
+    Budget dari header klien (detik), dibatasi REQUEST_DEADLINE_MAX. Nilai yang
+    bukan angka, NaN/inf, atau <= 0 diabaikan: pakai REQUEST_DEADLINE.
+    """
+    settings = get_settings()
+    budget = settings.request_deadline
+    if header_value:
+        try:
+            requested = float(header_value)
+        except ValueError:
+            requested = math.nan
+        # NaN lolos min/max, dan deadline NaN membuat tahap pertama langsung DeadlineExceeded
+        if math.isfinite(requested) and requested > 0:
+            budget = requested
+    return min(max(budget, 1.0), settings.request_deadline_max)
+
+
+def start_deadline(budget: float) -> Deadline:
+    """Pasang deadline untuk request (task) ini dan semua yang diturunkan darinya."""
+    deadline = Deadline(budget)
+    _current_deadline.set(deadline)
+    return deadline
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+def time_left(cap: float, stage: str = "upstream") -> float:
+    """
+    Timeout untuk satu tahap: `cap`, dipotong sisa budget request. Kalau budget
+    sudah habis, langsung DeadlineExceeded daripada mencoba tahap yang pasti telat.
+    """
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return cap
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        DEADLINE_EXCEEDED.inc(stage=stage)
+        raise DeadlineExceeded(stage)
+    return min(cap, remaining)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Executor thread bernama per jenis pekerjaan blocking.
+asyncio.to_thread memakai satu default executor bersama, jadi encode torch
+yang CPU-bound berebut slot dengan tunggu I/O (SQLite, DuckDuckGo). Di sini
+setiap jenis punya pool sendiri dengan ukuran yang bisa diatur, plus metrik
+kedalaman antrean dan lama menunggu, supaya satu jenis tidak menelantarkan
+yang lain:
+
+- embedding: kerja CPU (encode SentenceTransformer, FAISS, klasifikasi, decode gambar)
+- sqlite:    akses database lokal (cache L2, reset memori)
+- network:   klien jaringan blocking (pencarian DuckDuckGo)
+
+Contextvar (trace aktif) ikut dibawa ke thread, sama seperti asyncio.to_thread.
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, TypeVar
+
+from .config import get_settings
+from .metrics import EXECUTOR_ACTIVE, EXECUTOR_QUEUE_DEPTH, EXECUTOR_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+EXECUTOR_NAMES = ("embedding", "sqlite", "network")
+
+
+class NamedExecutor:
+    def __init__(self, name: str, max_workers: int) -> None:
+        self.name = name
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"linda-{name}")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+
+    def _started(self, submitted: float) -> None:
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+        EXECUTOR_QUEUE_DEPTH.dec(executor=self.name)
+        EXECUTOR_ACTIVE.inc(executor=self.name)
+        EXECUTOR_WAIT_SECONDS.observe(time.perf_counter() - submitted, executor=self.name)
+
+    def _finished(self) -> None:
+        with self._lock:
+            self.active -= 1
+            self.completed += 1
+        EXECUTOR_ACTIVE.dec(executor=self.name)
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        """Pengganti `asyncio.to_thread(func, *args)` di pool ini."""
+        context = contextvars.copy_context()
+        submitted = time.perf_counter()
+
+        def call() -> T:
+            self._started(submitted)
+            try:
+                return context.run(func, *args)
+            finally:
+                self._finished()
+
+        with self._lock:
+            self.queued += 1
+        EXECUTOR_QUEUE_DEPTH.inc(executor=self.name)
+        future = self._pool.submit(call)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # Belum sempat jalan: keluarkan dari antrean supaya metrik tetap akurat
+            if future.cancel():
+                with self._lock:
+                    self.queued -= 1
+                EXECUTOR_QUEUE_DEPTH.dec(executor=self.name)
+            raise
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "queued": self.queued,
+                "active": self.active,
+                "completed": self.completed,
+            }
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def torch_threads() -> int:
+    """Thread intra-op torch: dibagi rata antar worker embedding supaya core tidak kelebihan beban."""
+    settings = get_settings()
+    if settings.torch_num_threads > 0:
+        return settings.torch_num_threads
+    return max(1, (os.cpu_count() or 1) // max(1, settings.executor_embedding_workers))
+
+
+_executors: Dict[str, NamedExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name: str) -> NamedExecutor:
+    """Executor bernama tunggal per proses (embedding, sqlite, network)."""
+    executor = _executors.get(name)
+    if executor is not None:
+        return executor
+    if name not in EXECUTOR_NAMES:
+        raise ValueError(f"Executor tidak dikenal: {name}")
+    with _executors_lock:
+        if name not in _executors:
+            workers = getattr(get_settings(), f"executor_{name}_workers")
+            logger.info("Executor '%s' dibuat dengan %d worker.", name, workers)
+            _executors[name] = NamedExecutor(name, workers)
+    return _executors[name]
+
+
+async def run_in(name: str, func: Callable[..., T], *args: Any) -> T:
+    """`await run_in("embedding", search_memory, query, 3)`."""
+    return await get_executor(name).run(func, *args)
+
+
+def executor_stats() -> Dict[str, Dict[str, int]]:
+    return {name: executor.stats() for name, executor in _executors.items()}
+
+
+def shutdown_executors() -> None:
+    """Matikan semua executor (saat shutdown); pemanggilan berikutnya membuat yang baru."""
+    with _executors_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown()
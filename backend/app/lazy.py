@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Facade impor malas untuk dependensi berat (faiss, numpy, sentence_transformers, PIL).
+Modul baru benar-benar diimpor saat atributnya pertama kali dipakai, jadi
+startup aplikasi tidak ikut menanggung torch/transformers kalau fitur memori
+atau gambar tidak pernah dipakai.
+"""
+
+import importlib
+import logging
+import threading
+import time
+from types import ModuleType
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LazyModule:
+    """Pengganti `import x` yang menunda impor sampai `x.atribut` pertama diakses."""
+
+    def __init__(self, name: str) -> None:
+        self._name = name
+        self._module: Optional[ModuleType] = None
+        self._lock = threading.Lock()
+
+    def load(self) -> ModuleType:
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    started = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    logger.info("Impor malas '%s' selesai dalam %.2f detik.", self._name, time.perf_counter() - started)
+                    self._module = module
+        return self._module
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self.load(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<LazyModule {self._name!r} ({state})>"
+
+
+def lazy_import(name: str) -> Any:
+    """`np = lazy_import("numpy")` lalu pakai `np.array(...)` seperti biasa."""
+    return LazyModule(name)
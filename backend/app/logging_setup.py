@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline logging non-blocking.
+Handler di thread pemanggil (event loop) hanya memfilter lalu memasukkan record
+ke antrean; penulisan ke stdout dikerjakan QueueListener di thread sendiri.
+Kalau stdout lambat dan antrean penuh, record dibuang (dan dihitung), bukan
+menahan event loop. Log < WARNING bisa di-sampling dan dibatasi per logger,
+dan tiap baris membawa request_id dari trace yang sedang aktif.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from .config import Settings, get_settings
+from .metrics import LOG_RECORDS_DROPPED
+from .tracing import current_trace
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional[logging.Handler] = None
+
+UVICORN_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """`"app.main=0.1,app.services.cache=0.05"` -> {nama logger: peluang disimpan}."""
+    rates: Dict[str, float] = {}
+    for item in spec.split(","):
+        name, _, rate = item.partition("=")
+        if name.strip() and rate.strip():
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class RequestIdFilter(logging.Filter):
+    """Tempelkan request_id trace aktif (atau "-") ke setiap record."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        trace = current_trace()
+        record.request_id = trace.request_id if trace is not None else "-"
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Sampling + rate limit per logger untuk record di bawah WARNING.
+    WARNING ke atas selalu lolos. Aman dipanggil dari banyak thread.
+    """
+
+    def __init__(self, sample_rates: Dict[str, float], rate_limit: float) -> None:
+        super().__init__()
+        self.sample_rates = sample_rates
+        self.rate_limit = rate_limit
+        # logger -> (token tersisa, waktu isi ulang terakhir)
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def _sample_rate(self, name: str) -> float:
+        # Aturan paling spesifik menang: "app.services" berlaku juga untuk "app.services.cache"
+        while name:
+            rate = self.sample_rates.get(name)
+            if rate is not None:
+                return rate
+            name = name.rpartition(".")[0]
+        return 1.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._sample_rate(record.name)
+        if rate < 1.0 and random.random() >= rate:
+            LOG_RECORDS_DROPPED.inc(reason="sampled")
+            return False
+        if self.rate_limit <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(record.name, (self.rate_limit, now))
+            tokens = min(self.rate_limit, tokens + (now - updated) * self.rate_limit)
+            allowed = tokens >= 1.0
+            self._buckets[record.name] = (tokens - 1.0 if allowed else tokens, now)
+        if not allowed:
+            LOG_RECORDS_DROPPED.inc(reason="rate_limited")
+        return allowed
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler yang tidak pernah menunggu: antrean penuh = record dibuang."""
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc(reason="queue_full")
+
+
+class JsonFormatter(logging.Formatter):
+    """Satu objek JSON per baris."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "msg": record.getMessage(),
+        }
+        trace = getattr(record, "trace", None)
+        if trace is not None:
+            # Objek bersarang, bukan string JSON di dalam "msg"
+            data["trace"] = trace
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Format klasik; record trace (field `trace`) ditempel sebagai JSON di akhir baris."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        trace = getattr(record, "trace", None)
+        if trace is not None:
+            line = f"{line} {json.dumps(trace, ensure_ascii=False, default=str)}"
+        return line
+
+
+def configure_logging(settings: Optional[Settings] = None) -> None:
+    """Pasang handler antrean di root logger (idempoten) dan mulai thread penulis."""
+    global _listener, _handler
+    settings = settings or get_settings()
+    shutdown_logging()
+
+    output = logging.StreamHandler(sys.stdout)
+    if settings.log_format == "text":
+        output.setFormatter(TextFormatter(TEXT_FORMAT))
+    else:
+        output.setFormatter(JsonFormatter())
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=max(1, settings.log_queue_size))
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(parse_sample_rates(settings.log_sample), settings.log_rate_limit))
+    handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    root.setLevel(settings.log_level)
+    root.addHandler(handler)
+    # Log uvicorn (termasuk access log per request) ikut lewat antrean yang sama
+    for name in UVICORN_LOGGERS:
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+    _handler = handler
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+@atexit.register
+def shutdown_logging() -> None:
+    """Lepas handler antrean dan tulis sisa antrean (otomatis saat proses keluar)."""
+    global _listener, _handler
+    if _handler is not None:
+        logging.getLogger().removeHandler(_handler)
+        _handler = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
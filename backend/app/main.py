@@ -7,39 +7,85 @@ mengelola persona, dan menangani logika streaming obrolan.
 
 # Impor dari pustaka standar
 import asyncio
-import contextlib
 import logging
 import os
 import json
 import random 
-from collections import OrderedDict
+import secrets
+import time
+import uuid
 from typing import AsyncGenerator, List, Optional, Dict, Literal, Any
 
 # Impor dari pustaka pihak ketiga
 import httpx
-from fastapi import FastAPI, HTTPException, Header, Body
+from fastapi import Depends, FastAPI, HTTPException, Header, Body, Query, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel 
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, ValidationError
+from starlette.datastructures import UploadFile
 
 # Impor dari modul lokal aplikasi
 from .config import get_settings
+from .deadline import DEADLINE_HEADER, DeadlineExceeded, current_deadline, resolve_budget, start_deadline
+from .executors import executor_stats, run_in, shutdown_executors
+from .logging_setup import configure_logging
+from .profiling import ProfilerBusy, get_allocation_tracker, get_profiler, task_counts
+from .metrics import (
+    CHAT_REQUESTS,
+    CHAT_TIME_TO_FIRST_TOKEN,
+    CHAT_TOKENS_PER_SECOND,
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    EMOTION_SECONDS,
+    REGISTRY,
+    SSE_OPEN_CONNECTIONS,
+    monitor_event_loop_lag,
+)
 from .schemas import ChatRequest, MemorySearch, MemoryUpsert, Message, EmotionIn, EmotionOut
-from .services.llm import call_gemini_stream, prepare_system_prompt
-from .services.memory import init_memory_system, search_memory, upsert_memory, clear_memory_system
+from .tracing import Trace, mark, span, start_trace
+from .services.admission import AdmissionRejected, Priority, Ticket, admitted, get_admission_controller, key_id
+from .services.cache import build_cache_key, get_response_cache
+from .services.context import clear_summary_cache, compact_history, estimate_tokens
+from .services.emotion import resolve_emotion
+from .services.images import ImageInput, ImageTooLarge, InvalidUpload, read_upload_form
+from .services.llm import (
+    call_gemini_stream,
+    fetch_search_context,
+    prepare_system_prompt,
+)
+from .services.memory import (
+    clear_memory_system,
+    init_memory_system,
+    memory_stats,
+    preload_memory_system,
+    search_memory,
+    upsert_memory,
+)
+from .services.intent import route_intent, route_lexical
+from .services.pipeline import StageGraph
+from .services.prompt_cache import get_prompt_cache
+from .services.semantic_cache import SemanticProbe, get_semantic_cache, semantic_context_key
+from .services.streams import (
+    Broadcast,
+    ReplayExpired,
+    ResumableStream,
+    TokenCoalescer,
+    get_heartbeat_hub,
+    get_single_flight,
+    get_stream_registry,
+    get_stream_stats,
+)
+from .services.upstream import close_upstream_client, warm_upstream
 
 # --- Konfigurasi Dasar ---
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-)
+# Log lewat antrean (thread terpisah), JSON terstruktur + request_id; lihat logging_setup
+configure_logging()
 logger = logging.getLogger(__name__)
 
 
 # --- Pengaturan Aplikasi ---
 class AppSettings:
     """Menampung konfigurasi tingkat aplikasi."""
-    MAX_CACHE_ITEMS: int = 30
     DEFAULT_PERSONA: str = "ceria"
     TSUNDERE_TYPING_DELAY: float = 0.35
 
@@ -53,10 +99,6 @@ app = FastAPI(
     description="Sebuah API chatbot cerdas berbasis persona yang didukung oleh Google Gemini.",
 )
 
-# --- Cache Dalam Memori ---
-_response_cache: "OrderedDict[tuple[str, str, str], str]" = OrderedDict()
-
-
 # --- Middleware CORS (Cross-Origin Resource Sharing) ---
 app.add_middleware(
     CORSMiddleware,
@@ -64,6 +106,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
     allow_credentials=True,
+    # Dibaca frontend untuk menyambung stream /chat yang putus
+    expose_headers=["X-Stream-Id", "X-Request-Id", "Server-Timing"],
 )
 
 
@@ -190,28 +234,9 @@ PERSONAS: Dict[str, str] = {
 #                           FUNGSI BANTU (HELPER)
 # ==============================================================================
 
-def _cache_get(key: tuple[str, str, str]) -> Optional[str]:
-    """Mendapatkan respons dari cache."""
-    cached = _response_cache.get(key)
-    if cached is not None:
-        _response_cache.move_to_end(key)
-        logger.info("Cache HIT untuk kunci: %s", key[1][:50])
-    else:
-        logger.info("Cache MISS untuk kunci: %s", key[1][:50])
-    return cached
-
-
-def _cache_put(key: tuple[str, str, str], value: str) -> None:
-    """Menyimpan respons ke cache."""
-    if not value:
-        return
-    if key in _response_cache:
-        _response_cache.move_to_end(key)
-    _response_cache[key] = value
-    logger.info("Menyimpan respons ke cache untuk kunci: %s", key[1][:50])
-    while len(_response_cache) > settings.MAX_CACHE_ITEMS:
-        oldest_key = _response_cache.popitem(last=False)
-        logger.info("Cache penuh, mengeluarkan kunci lama: %s", oldest_key[0][1][:50])
+# Penanda internal antrean SSE: klien sudah putus, hentikan generator
+_STREAM_CLOSED = ""
+RESUME_EXPIRED_DETAIL = "Bagian jawaban ini sudah tidak tersimpan. Kirim ulang pesannya ya."
 
 
 def _chunk_text(text: str, chunk_size: int = 120) -> List[str]:
@@ -264,6 +289,18 @@ def _extract_last_user_message(messages: List[Message]) -> Optional[Message]:
 # ==============================================================================
 
 
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected) -> JSONResponse:
+    """Server kelebihan beban: tolak cepat dengan 429 + Retry-After."""
+    logger.warning("Request %s ditolak admission control: %s", request.url.path, exc.reason)
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Server lagi sibuk banget, coba lagi sebentar ya."},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+
 @app.on_event("startup")
 def on_startup() -> None:
     """Menginisialisasi sistem memori (DB + Vector Index) saat aplikasi dimulai."""
@@ -272,6 +309,41 @@ def on_startup() -> None:
     logger.info("Sistem memori berhasil diinisialisasi.")
 
 
+@app.on_event("startup")
+async def start_memory_preload() -> None:
+    """
+    Model embedding (torch) tidak dimuat saat startup supaya cold start cepat.
+    Dengan MEMORY_PRELOAD=true, model + indeks dipanaskan di background tanpa menahan startup.
+    """
+    if get_settings().memory_preload:
+        app.state.memory_preload_task = asyncio.create_task(run_in("embedding", preload_memory_system))
+
+
+@app.on_event("startup")
+async def start_loop_lag_monitor() -> None:
+    """Mengukur keterlambatan event loop untuk /metrics."""
+    app.state.loop_lag_task = asyncio.create_task(monitor_event_loop_lag())
+
+
+@app.on_event("shutdown")
+async def stop_loop_lag_monitor() -> None:
+    task = getattr(app.state, "loop_lag_task", None)
+    if task is not None:
+        task.cancel()
+
+
+@app.on_event("shutdown")
+async def close_upstream() -> None:
+    """Tutup pool koneksi Gemini bersama."""
+    await close_upstream_client()
+
+
+@app.on_event("shutdown")
+def stop_executors() -> None:
+    """Matikan executor thread bernama (embedding, sqlite, network)."""
+    shutdown_executors()
+
+
 @app.get("/health", tags=["Utilitas"])
 async def health_check() -> Dict[str, str]:
     """Endpoint sederhana untuk memastikan bahwa API sedang berjalan."""
@@ -283,15 +355,112 @@ async def health_check() -> Dict[str, str]:
 async def reset_session_memory():
     """Endpoint untuk mereset seluruh memori (database & vector index) dan cache."""
     try:
-        await asyncio.to_thread(clear_memory_system) 
-        _response_cache.clear()
+        async with admitted(Priority.BULK_WRITE):
+            await run_in("sqlite", clear_memory_system)
+        await get_response_cache().clear()
+        semantic_cache = get_semantic_cache()
+        if semantic_cache is not None:
+            semantic_cache.clear()
+        clear_summary_cache()
         logger.info("Sistem memori (DB & Index) dan cache obrolan BERHASIL direset.")
         return {"message": "Sesi obrolan dan memori berhasil direset."}
+    except AdmissionRejected:
+        raise
     except Exception as e:
         logger.error("Gagal mereset sistem memori: %s", e)
         raise HTTPException(status_code=500, detail="Gagal mereset sistem memori.")
 
 
+@app.get("/cache/stats", tags=["Utilitas"])
+async def cache_stats() -> Dict[str, Any]:
+    """Statistik cache respons (hit ratio, ukuran byte, eviction)."""
+    prompt_cache = get_prompt_cache()
+    semantic_cache = get_semantic_cache()
+    return {
+        **get_response_cache().stats(),
+        "single_flight": get_single_flight().stats(),
+        "streams": {**get_stream_stats().snapshot(), **get_stream_registry().stats()},
+        "executors": executor_stats(),
+        "prompt_cache": prompt_cache.stats() if prompt_cache else None,
+        "memory": memory_stats(),
+        "semantic": semantic_cache.stats() if semantic_cache else None,
+    }
+
+
+@app.get("/metrics", tags=["Utilitas"])
+async def metrics_endpoint() -> Response:
+    """Metrik pipeline dalam format eksposisi teks Prometheus."""
+    return Response(content=REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+# ==============================================================================
+#                   ADMIN: PROFIL CPU, ALOKASI, TASK ASYNCIO
+# ==============================================================================
+
+def require_admin(x_admin_token: Optional[str] = Header(None, alias="X-Admin-Token")) -> None:
+    """Endpoint admin hanya ada kalau ADMIN_ENDPOINTS aktif dan ADMIN_TOKEN diset."""
+    admin_settings = get_settings()
+    if not admin_settings.admin_endpoints or not admin_settings.admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token.encode(), admin_settings.admin_token.encode()):
+        raise HTTPException(status_code=403, detail="Token admin tidak valid.")
+
+
+@app.get("/admin/profile/cpu", tags=["Admin"], dependencies=[Depends(require_admin)])
+async def admin_cpu_profile(
+    seconds: float = Query(10.0, gt=0),
+    interval_ms: Optional[float] = Query(None, gt=0),
+) -> Response:
+    """
+    Profil CPU sampling semua thread selama `seconds`, dalam format folded stacks
+    (buka di speedscope.app atau `flamegraph.pl`).
+    """
+    admin_settings = get_settings()
+    if seconds > admin_settings.profile_max_seconds:
+        raise HTTPException(status_code=400, detail=f"Maksimal {admin_settings.profile_max_seconds:g} detik.")
+    interval = (interval_ms or admin_settings.profile_interval_ms) / 1000
+    try:
+        folded = await get_profiler().profile(seconds, interval)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return Response(
+        content=folded, media_type="text/plain; charset=utf-8",
+        headers={"Content-Disposition": 'attachment; filename="cpu-profile.folded"'},
+    )
+
+
+# Snapshot dan compare_to tracemalloc bisa makan ratusan ms sampai detik di heap besar,
+# jadi handler allocations sengaja `def` biasa: dijalankan di threadpool, bukan di event loop
+@app.post("/admin/allocations/start", tags=["Admin"], dependencies=[Depends(require_admin)])
+def admin_allocations_start(frames: int = Query(10, ge=1, le=100)) -> Dict[str, Any]:
+    """Nyalakan tracemalloc (kalau belum) dan jadikan kondisi sekarang baseline."""
+    return get_allocation_tracker().start(frames)
+
+
+@app.get("/admin/allocations", tags=["Admin"], dependencies=[Depends(require_admin)])
+def admin_allocations_diff(
+    limit: int = Query(25, ge=1, le=500),
+    group_by: Literal["lineno", "filename", "traceback"] = "lineno",
+) -> Dict[str, Any]:
+    """Lokasi alokasi dengan pertumbuhan terbesar sejak baseline."""
+    try:
+        return get_allocation_tracker().diff(limit, group_by)
+    except LookupError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.delete("/admin/allocations", tags=["Admin"], dependencies=[Depends(require_admin)])
+def admin_allocations_stop() -> Dict[str, Any]:
+    """Matikan tracemalloc supaya alokasi kembali ke kecepatan normal."""
+    return get_allocation_tracker().stop()
+
+
+@app.get("/admin/tasks", tags=["Admin"], dependencies=[Depends(require_admin)])
+async def admin_tasks() -> Dict[str, Any]:
+    """Jumlah task asyncio yang masih hidup per coroutine."""
+    return task_counts()
+
+
 @app.post("/api/validate-api-key", tags=["Utilitas"])
 async def validate_api_key(
     user_api_key: Optional[str] = Header(None, alias="X-Gemini-Api-Key")
@@ -307,7 +476,7 @@ async def validate_api_key(
     settings = get_settings()
     
     # --- FIX: GUNAKAN ENDPOINT LIST MODELS ---
-    url = "https://generativelanguage.googleapis.com/v1beta/models"
+    url = f"{settings.gemini_api_root}/v1beta/models"
     
     # pageSize=1 supaya ringan, kita cuma mau cek status code 200 OK
     params = {"key": user_api_key, "pageSize": "1"}
@@ -345,119 +514,390 @@ async def validate_api_key(
 @app.post("/chat", tags=["Chat"])
 async def chat_endpoint(
     payload: ChatRequest,
+    request: Request,
     user_api_key: Optional[str] = Header(None, alias="X-Gemini-Api-Key")
 ) -> StreamingResponse:
     """Endpoint utama untuk menangani percakapan obrolan melalui streaming."""
+    return await _admit_chat(payload, request, user_api_key)
+
+
+@app.post(
+    "/chat/upload",
+    tags=["Chat"],
+    # Form diurai sendiri (batas ukuran ditegakkan saat menerima), jadi skemanya ditulis manual
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["payload"],
+                        "properties": {
+                            "payload": {"type": "string", "description": "ChatRequest dalam bentuk JSON (tanpa image_base64)."},
+                            "image": {"type": "string", "format": "binary", "description": "File gambar biner (JPEG/PNG/WebP)."},
+                        },
+                    }
+                }
+            },
+        }
+    },
+)
+async def chat_upload_endpoint(
+    request: Request,
+    user_api_key: Optional[str] = Header(None, alias="X-Gemini-Api-Key")
+) -> StreamingResponse:
+    """
+    Sama seperti /chat, tapi gambar dikirim biner lewat multipart, bukan Base64
+    di dalam JSON. Respons SSE-nya identik.
+    """
+    upload_settings = get_settings()
+    try:
+        form = await read_upload_form(
+            request, max_bytes=upload_settings.image_upload_max_bytes, spool_bytes=upload_settings.image_spool_max_bytes,
+        )
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidUpload as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    image = form.get("image")
+    try:
+        payload = form.get("payload")
+        if not isinstance(payload, str):
+            raise RequestValidationError(
+                [{"type": "missing", "loc": ("body", "payload"), "msg": "Field required", "input": None}]
+            )
+        try:
+            chat_request = ChatRequest.model_validate_json(payload)
+        except ValidationError as e:
+            raise RequestValidationError(e.errors(include_url=False))
+        if not isinstance(image, UploadFile):
+            return await _admit_chat(chat_request, request, user_api_key)
+        if chat_request.image_base64:
+            raise HTTPException(status_code=400, detail="Kirim gambar lewat field 'image' ATAU 'image_base64', jangan keduanya.")
+        image_input = await ImageInput.from_upload(image, max_bytes=upload_settings.image_upload_max_bytes)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except BaseException:
+        await form.close()
+        raise
+    return await _admit_chat(chat_request, request, user_api_key, image_input)
+
+
+async def _admit_chat(
+    payload: ChatRequest,
+    request: Request,
+    user_api_key: Optional[str],
+    image: Optional[ImageInput] = None,
+) -> StreamingResponse:
+    """Admission + trace bersama untuk /chat dan /chat/upload."""
+    trace = start_trace("chat", request.headers.get("X-Request-ID"))
+    # Deadline dipasang sebelum antre admission; ikut ke producer dan single-flight lewat contextvar
+    start_deadline(resolve_budget(request.headers.get(DEADLINE_HEADER)))
+    # Slot admission dipegang sampai stream selesai, bukan cuma sampai fungsi ini return
+    try:
+        with span("admission"):
+            ticket = await get_admission_controller().acquire(Priority.CHAT, user_api_key)
+    except BaseException as e:
+        trace.finish(outcome=type(e).__name__)
+        if image is not None:
+            image.close()
+        raise
+    try:
+        return await _start_chat_stream(payload, user_api_key, ticket, request, trace, image)
+    except BaseException as e:
+        ticket.release()
+        trace.finish(outcome=type(e).__name__)
+        if image is not None:
+            image.close()
+        raise
+
+
+async def _start_chat_stream(
+    payload: ChatRequest,
+    user_api_key: Optional[str],
+    ticket: Ticket,
+    request: Request,
+    trace: Trace,
+    image: Optional[ImageInput] = None,
+) -> StreamingResponse:
+    """Menyiapkan prompt (memori, persona, cache) lalu membangun StreamingResponse."""
+    if image is None and payload.image_base64:
+        image = ImageInput.from_base64(payload.image_base64)
     logger.info("Menerima permintaan obrolan (Multimodal: %s)", 
-                "Ada Gambar" if payload.image_base64 else "Hanya Teks")
+                "Ada Gambar" if image is not None else "Hanya Teks")
     
-    _validate_messages(payload.messages) 
-    
-    clean_messages = _clean_interrupted_assistant_messages(payload.messages)
-    last_user_message = _extract_last_user_message(clean_messages)
+    with span("validate"):
+        _validate_messages(payload.messages) 
+        clean_messages = _clean_interrupted_assistant_messages(payload.messages)
+        last_user_message = _extract_last_user_message(clean_messages)
     memory_context = ""
-
-    if payload.use_memory and last_user_message:
-        logger.info("Mencari memori untuk kueri: '%s...'", last_user_message.content[:50])
-        memory_hits = await asyncio.to_thread(search_memory, last_user_message.content, 3)
-        if memory_hits:
-            memory_snippets = [row['text'] for row in memory_hits]
-            memory_context = "Hal yang pernah kamu ceritain sebelumnya: " + ", ".join(memory_snippets) + "."
-            logger.info("Menemukan %d memori yang relevan.", len(memory_hits))
+    stream_settings = get_settings()
+
+    # --- TAHAP PRA-GENERASI PARALEL ---
+    # Memori, pencarian web, gambar, dan warm-up koneksi saling lepas: jalan bersamaan,
+    # jadi TTFT mengikuti tahap terlama. Tahap opsional yang lewat budget dilewati.
+    # Router intent menentukan apakah memori/web perlu; kalau lewat budget, pakai leksikon saja.
+    request_deadline = current_deadline()
+    stages = StageGraph(deadline=min(
+        stream_settings.pregen_deadline,
+        request_deadline.remaining() if request_deadline is not None else stream_settings.pregen_deadline,
+    ))
+    query = last_user_message.content if last_user_message else ""
+    wants_memory = bool(payload.use_memory and last_user_message)
+    wants_web = bool(last_user_message and image is None)
+    if wants_memory or wants_web:
+        stages.add(
+            "intent", lambda: run_in("embedding", route_intent, query),
+            budget=stream_settings.intent_budget, default=route_lexical(query),
+        )
+
+    async def memory_stage() -> List[Dict[str, Any]]:
+        if not (await stages.result("intent")).memory:
+            return []
+        logger.info("Mencari memori untuk kueri: '%s...'", query[:50])
+        return await run_in("embedding", search_memory, query, 3)
+
+    async def web_stage() -> str:
+        if not (await stages.result("intent")).web:
+            return ""
+        return await fetch_search_context(query)
+
+    if wants_memory:
+        stages.add("memory_search", memory_stage, budget=stream_settings.pregen_memory_budget, default=[])
+    if wants_web:
+        stages.add("web_search", web_stage, budget=stream_settings.pregen_search_budget, default="")
+    if image is not None:
+        stages.add("image", lambda: run_in("embedding", image.build_part), optional=False)
+    if stream_settings.upstream_warmup:
+        stages.add("upstream_warmup", warm_upstream, default=False)
 
     persona_key = (payload.persona or settings.DEFAULT_PERSONA).strip().lower()
     logger.info("Persona diminta=%r, Persona diselesaikan=%s", payload.persona, persona_key)
     active_persona_prompt = PERSONAS.get(persona_key, PERSONAS[settings.DEFAULT_PERSONA])
     
-    cache_key: Optional[tuple[str, str, str]] = None
+    # Riwayat lama diringkas supaya ukuran input ke Gemini tetap datar
+    with span("history"):
+        history = compact_history(clean_messages, api_key=user_api_key)
+    if history.dropped:
+        logger.info("Riwayat dipadatkan: %d giliran lama diganti ringkasan.", history.dropped)
+
+    memory_hits = await stages.result("memory_search", [])
+    if memory_hits:
+        memory_snippets = [row['text'] for row in memory_hits]
+        memory_context = "Hal yang pernah kamu ceritain sebelumnya: " + ", ".join(memory_snippets) + "."
+        logger.info("Menemukan %d memori yang relevan.", len(memory_hits))
+
+    with span("prompt"):
+        system_prompt = prepare_system_prompt(
+            persona_default=TSUNDERE_PERSONA, 
+            persona_override=active_persona_prompt,
+            memory_snippet=memory_context or None,
+            history_summary=history.summary,
+        )
+
+    # Cache dikunci hash prompt efektif (persona, system prompt, riwayat terkirim, gambar)
+    response_cache = get_response_cache()
+    cache_key: Optional[str] = None
     cached_text: Optional[str] = None
-    last_user_content = last_user_message.content.strip() if last_user_message else ""
-    if last_user_content:
-        cache_key = (persona_key, last_user_content.lower(), payload.image_base64 or "")
-        cached_text = _cache_get(cache_key)
-        
-    system_prompt = prepare_system_prompt(
-        persona_default=TSUNDERE_PERSONA, 
-        persona_override=active_persona_prompt,
-        memory_snippet=memory_context or None,
-    )
+    if last_user_message:
+        with span("cache_lookup"):
+            cache_key = build_cache_key(
+                persona_key, system_prompt, history.messages, image_digest=image.digest if image else None,
+            )
+            cached_text = await response_cache.get(cache_key)
+        logger.info("Cache %s untuk kunci: %s", "HIT" if cached_text is not None else "MISS", cache_key[:12])
+
+    # Parafrase obrolan ringan ("lagi apa?" vs "kamu lagi ngapain?") lewat cache semantik.
+    # Hanya giliran yang jawabannya tidak bergantung pada memori, web, gambar, atau ringkasan.
+    semantic_cache = get_semantic_cache()
+    semantic_probe: Optional[SemanticProbe] = None
+    if (
+        cached_text is None and semantic_cache is not None and last_user_message
+        and image is None and not memory_hits and not history.summary
+    ):
+        decision = await stages.result("intent")
+        if decision is not None and decision.label == "chitchat" and not decision.web:
+            with span("semantic_cache_lookup"):
+                context_key = semantic_context_key(
+                    persona_key, history.messages, stream_settings.semantic_cache_context_turns,
+                )
+                # Dibatasi seperti intent: model yang masih dimuat atau executor embedding yang
+                # penuh tidak boleh menahan jawaban; lebih baik langsung ke Gemini
+                try:
+                    semantic_probe = await asyncio.wait_for(
+                        run_in("embedding", semantic_cache.lookup, persona_key, context_key, query),
+                        timeout=stream_settings.intent_budget,
+                    )
+                except asyncio.TimeoutError:
+                    logger.info("Cache semantik dilewati: lookup melebihi %.2f detik.", stream_settings.intent_budget)
+                except Exception as e:
+                    logger.warning("Cache semantik tidak tersedia: %s", e)
+            if semantic_probe is not None and semantic_probe.hit is not None:
+                cached_text = semantic_probe.hit.text
+                logger.info("Cache semantik HIT (kemiripan %.3f).", semantic_probe.hit.similarity)
+    if cached_text is not None:
+        # Jawaban dari cache tidak butuh hasil pencarian web, gambar, maupun koneksi upstream
+        stages.cancel("intent", "web_search", "image", "upstream_warmup")
     
-    async def event_stream() -> AsyncGenerator[str, None]:
-        queue: asyncio.Queue[str] = asyncio.Queue()
-        done = asyncio.Event()
+    stream_stats = get_stream_stats()
+    registry = get_stream_registry()
+
+    async def produce(broadcast: Broadcast) -> None:
+        """Menghasilkan frame SSE ke buffer replay; hidup lepas dari koneksi mana pun."""
+        max_lag = stream_settings.stream_max_lag
+        streamed: list[str] = []
+        first_token_at: Optional[float] = None
+        outcome = "completed"
+
+        # Delta token digabung per jendela waktu; token pertama tetap langsung terkirim
+        coalescer = TokenCoalescer(
+            broadcast,
+            window=stream_settings.stream_coalesce_window_ms / 1000,
+            max_chars=stream_settings.stream_coalesce_max_chars,
+            max_lag=max_lag,
+        )
+
+        async def emit(frame: str) -> None:
+            await coalescer.flush()
+            await broadcast.publish_with_backpressure(frame, max_lag)
+
+        async def emit_token(token: str) -> None:
+            nonlocal first_token_at
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                mark("first_token")
+                CHAT_TIME_TO_FIRST_TOKEN.observe(
+                    trace.elapsed(), source="cache" if cached_text is not None else "upstream",
+                )
+            streamed.append(token)
+            await coalescer.add(token)
 
-        async def producer() -> None:
+        try:
             try:
                 delay = settings.TSUNDERE_TYPING_DELAY if persona_key == "tsundere" else 0.0
                 full_text = ""
                 
-                if cached_text is not None:
-                    if delay: await asyncio.sleep(delay)
-                    for chunk in _chunk_text(cached_text):
-                        await queue.put(f"event: token\ndata: {chunk}\n\n")
-                    full_text = cached_text
-                else:
-                    captured: list[str] = []
-                    async for token in call_gemini_stream(
-                        messages=clean_messages, 
-                        system_prompt=system_prompt, 
-                        image_base64=payload.image_base64, 
-                        delay_seconds=delay,
-                        api_key=user_api_key 
-                    ):
-                        captured.append(token)
-                        await queue.put(f"event: token\ndata: {token}\n\n")
+                with span("generation", source="cache" if cached_text is not None else "upstream"):
+                    if cached_text is not None:
+                        if delay: await asyncio.sleep(delay)
+                        for chunk in _chunk_text(cached_text):
+                            await emit_token(chunk)
+                        full_text = cached_text
+                    else:
+                        async def upstream() -> AsyncGenerator[str, None]:
+                            search_context = await stages.result("web_search", "")
+                            image_part = await stages.result("image")
+                            await stages.result("upstream_warmup")
+                            async for token in call_gemini_stream(
+                                messages=history.messages, 
+                                system_prompt=system_prompt, 
+                                image_part=image_part,
+                                search_context=search_context,
+                                delay_seconds=delay,
+                                api_key=user_api_key,
+                                persona_prompt=active_persona_prompt.strip(),
+                            ):
+                                yield token
+
+                        async def fill_cache(text: str) -> None:
+                            if cache_key and text.strip():
+                                await response_cache.put(cache_key, text.strip())
+                            if semantic_probe is not None:
+                                semantic_cache.put(semantic_probe, text)
+
+                        # Prompt identik yang sedang jalan cukup ditumpangi, bukan memanggil Gemini lagi.
+                        # Hanya dengan key yang sama: request ber-key sendiri tidak boleh dilayani
+                        # (dan ditagih) lewat key orang lain atau pool server, begitu juga sebaliknya
+                        flight_key = (
+                            f"{key_id(user_api_key) or 'server-pool'}:{cache_key}"
+                            if cache_key
+                            else uuid.uuid4().hex
+                        )
+                        async with get_single_flight().join(
+                            flight_key, upstream, fill_cache, max_lag=max_lag
+                        ) as (flight, _owner):
+                            async for token in flight.subscribe():
+                                await emit_token(token)
                     
-                    full_text = "".join(captured).strip()
-                    if cache_key and full_text:
-                        _cache_put(cache_key, full_text)
+                        full_text = "".join(streamed).strip()
+                await coalescer.flush()
+
+                # --- EMOSI AVATAR (dari teks yang sudah ditangkap, tanpa round trip kedua) ---
+                if payload.emit_emotion and full_text:
+                    try:
+                        with span("emotion"):
+                            emotion = await resolve_emotion(full_text, persona_key, user_api_key)
+                        await emit(f"event: emotion\ndata: {emotion.model_dump_json()}\n\n")
+                    except Exception as e:
+                        logger.warning("Gagal menghitung emosi untuk stream: %s", e)
                         
                 # --- MEMORY UPSERT LOGIC ---
                 if payload.use_memory and full_text and last_user_message:
                     combined_text = f"User bilang: '{last_user_message.content}'. Linda jawab: '{full_text}'"
                     logger.info("Melakukan upsert memori untuk obrolan.")
-                    await asyncio.to_thread(upsert_memory, "chat_history", combined_text)
+                    with span("memory_upsert"):
+                        await run_in("embedding", upsert_memory, "chat_history", combined_text)
 
             except httpx.HTTPStatusError as e:
+                outcome = "error"
+                coalescer.flush_nowait()
                 logger.error("Streaming Gemini gagal: HTTP Status Error %s - %s", e.response.status_code, e.response.text)
                 if e.response.status_code == 401:
-                    await queue.put(f"event: error\ndata: API Key tidak valid atau ditolak. Mohon cek X-Gemini-Api-Key.\n\n")
-                    raise HTTPException(status_code=401, detail="API Key tidak valid atau ditolak.")
-                
-                error_msg = f"Waduh, ada error dari API-nya (kode: {e.response.status_code}). Coba lagi nanti ya."
-                if persona_key == "tsundere":
-                    error_msg = f"Hmph! API-nya ngambek tuh (kode: {e.response.status_code}). Bukan salah aku ya!"
-                await queue.put(f"event: error\ndata: {error_msg}\n\n")
+                    broadcast.publish(f"event: error\ndata: API Key tidak valid atau ditolak. Mohon cek X-Gemini-Api-Key.\n\n")
+                else:
+                    error_msg = f"Waduh, ada error dari API-nya (kode: {e.response.status_code}). Coba lagi nanti ya."
+                    if persona_key == "tsundere":
+                        error_msg = f"Hmph! API-nya ngambek tuh (kode: {e.response.status_code}). Bukan salah aku ya!"
+                    broadcast.publish(f"event: error\ndata: {error_msg}\n\n")
+            except DeadlineExceeded as e:
+                outcome = "deadline"
+                coalescer.flush_nowait()
+                logger.warning("Streaming Gemini dihentikan: %s", e)
+                error_msg = (
+                    "Hmph! Kelamaan nunggu servernya, aku nggak mau nunggu terus. Coba lagi deh!"
+                    if persona_key == "tsundere"
+                    else "Maaf ya, jawabannya kelamaan datang. Coba kirim lagi sebentar lagi."
+                )
+                broadcast.publish(f"event: error\ndata: {error_msg}\n\n")
             except Exception as e:
+                outcome = "error"
+                coalescer.flush_nowait()
                 logger.exception("Streaming Gemini gagal karena error tak terduga: %s", e)
                 error_msg = ("Ih berisik! Servernya lagi ngambek!" if persona_key == "tsundere" else "Server lagi ada masalah nih, coba lagi nanti ya.")
-                await queue.put(f"event: error\ndata: {error_msg}\n\n")
-            finally:
-                logger.info("Streaming selesai untuk permintaan ini.")
-                await queue.put("event: done\ndata: [DONE]\n\n")
-                done.set()
-            
-        async def heartbeat() -> None:
-            try:
-                while not done.is_set():
-                    await asyncio.sleep(15.0)
-                    await queue.put(":\n\n")
-            except asyncio.CancelledError:
-                return
-
-        producer_task = asyncio.create_task(producer())
-        heartbeat_task = asyncio.create_task(heartbeat())
-        try:
-            while True:
-                message = await queue.get()
-                yield message
-                if message.startswith("event: done"):
-                    break
-        finally:
-            producer_task.cancel()
-            heartbeat_task.cancel()
-            with contextlib.suppress(Exception): await producer_task
-            with contextlib.suppress(Exception): await heartbeat_task
+                broadcast.publish(f"event: error\ndata: {error_msg}\n\n")
+            logger.info("Streaming selesai untuk permintaan ini.")
+            # Header sudah terkirim sebelum streaming, jadi rincian lengkap dikirim sebagai event penutup
+            broadcast.publish(f"event: timing\ndata: {json.dumps(trace.summary())}\n\n")
+            broadcast.publish("event: done\ndata: [DONE]\n\n")
+            trace.finish(outcome=outcome)
+            tokens = estimate_tokens("".join(streamed))
+            stream_stats.record_completed(tokens)
+            CHAT_REQUESTS.inc(outcome=outcome)
+            if first_token_at is not None and tokens:
+                elapsed = time.perf_counter() - first_token_at
+                if elapsed > 0:
+                    CHAT_TOKENS_PER_SECOND.observe(tokens / elapsed)
+        except asyncio.CancelledError:
+            coalescer.flush_nowait()
+            CHAT_REQUESTS.inc(outcome="cancelled")
+            trace.finish(outcome="cancelled")
+            # Dibatalkan registry: tidak ada pembaca yang kembali dalam masa tenggang
+            tokens = estimate_tokens("".join(streamed))
+            saved = stream_stats.record_cancelled(tokens)
+            logger.info(
+                "Klien putus di tengah stream: %d token terkirim, ~%d token upstream dihemat.",
+                tokens, saved,
+            )
+            raise
+
+    record = registry.start(produce)
+    if image is not None:
+        # Spool upload dilepas paling lambat saat generasi selesai (mis. tahap gambar dibatalkan cache HIT)
+        record.task.add_done_callback(lambda _task: image.close())
+    # Slot admission mengikuti umur generasi, bukan umur koneksi (stream bisa dilanjutkan)
+    record.task.add_done_callback(lambda _task: ticket.release())
 
     headers = {
         "Cache-Control": "no-cache",
@@ -465,15 +905,122 @@ async def chat_endpoint(
         "X-Accel-Buffering": "no",
         "X-Persona-Requested": (payload.persona or "Not Provided"),
         "X-Persona-Resolved": persona_key,
+        "X-Stream-Id": record.stream_id,
+        "X-Request-Id": trace.request_id,
+        # Hanya tahap sebelum streaming; sisanya ada di event SSE `timing`
+        "Server-Timing": trace.server_timing(),
     }
-    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=headers)
+    return StreamingResponse(
+        _relay_stream(record, 0, request),
+        media_type="text/event-stream",
+        headers=headers,
+    )
+
+
+def _parse_last_event_id(value: Optional[str]) -> int:
+    """Indeks frame pertama yang belum diterima klien (Last-Event-ID + 1)."""
+    if not value:
+        return 0
+    try:
+        return max(0, int(value.strip()) + 1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Header 'Last-Event-ID' tidak valid.")
+
+
+async def _relay_stream(record: ResumableStream, start: int, request: Request) -> AsyncGenerator[str, None]:
+    """
+    Meneruskan frame dari buffer replay ke satu koneksi SSE, mulai dari indeks
+    `start`, ditambah heartbeat. Registry sudah mencatat koneksi ini sebagai
+    pembaca; saat selesai atau klien putus, pembaca dilepas lagi.
+    """
+    stream_settings = get_settings()
+    # Antrean terbatas: klien yang lambat menahan forwarder, lalu lewat broadcast, producer
+    queue: asyncio.Queue[str] = asyncio.Queue(maxsize=stream_settings.stream_queue_maxsize)
+
+    async def forward() -> None:
+        index = start
+        try:
+            async for frame in record.broadcast.subscribe(start):
+                await queue.put(f"id: {index}\n{frame}")
+                index += 1
+        except ReplayExpired:
+            # Pembaca tertinggal di luar jendela replay: tidak bisa disambung, klien kirim ulang
+            logger.warning("Stream %s: frame %d sudah dibuang dari buffer replay.", record.stream_id[:12], index)
+            await queue.put(f"event: error\ndata: {RESUME_EXPIRED_DETAIL}\n\n")
+        await queue.put(_STREAM_CLOSED)
+
+    async def watch_disconnect() -> None:
+        # Tanpa ini, putusnya klien baru ketahuan saat frame berikutnya gagal dikirim,
+        # sementara Gemini terus menghasilkan (dan menagih) token yang tidak dibaca siapa pun
+        while True:
+            await asyncio.sleep(stream_settings.disconnect_poll_interval)
+            if await request.is_disconnected():
+                forward_task.cancel()
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(_STREAM_CLOSED)
+                return
+
+    forward_task = asyncio.create_task(forward())
+    watcher_task = asyncio.create_task(watch_disconnect())
+    # Heartbeat datang dari satu timer bersama, bukan task per koneksi
+    heartbeats = get_heartbeat_hub()
+    heartbeats.register(queue)
+    SSE_OPEN_CONNECTIONS.inc()
+    try:
+        while True:
+            message = await queue.get()
+            if message == _STREAM_CLOSED:
+                break
+            yield message
+    finally:
+        forward_task.cancel()
+        watcher_task.cancel()
+        heartbeats.unregister(queue)
+        get_stream_registry().detach(record)
+        SSE_OPEN_CONNECTIONS.dec()
+        await asyncio.gather(forward_task, watcher_task, return_exceptions=True)
+
+
+@app.get("/chat/stream/{stream_id}", tags=["Chat"])
+async def resume_chat_stream(
+    stream_id: str,
+    request: Request,
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+) -> StreamingResponse:
+    """
+    Menyambung stream /chat yang terputus: frame setelah Last-Event-ID diputar
+    ulang dari buffer, lalu lanjut mengikuti ekor live. Tidak memicu generasi baru.
+    """
+    start = _parse_last_event_id(last_event_id)
+    registry = get_stream_registry()
+    record = registry.get(stream_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Stream tidak ditemukan atau sudah kedaluwarsa.")
+    if not record.broadcast.retains(start):
+        # Buffer replay terbatas: awal jawaban yang diminta sudah dibuang
+        raise HTTPException(status_code=410, detail=RESUME_EXPIRED_DETAIL)
+    registry.attach(record)
+    logger.info("Stream %s dilanjutkan dari event %d.", stream_id[:12], start)
+    headers = {
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "X-Accel-Buffering": "no",
+        "X-Stream-Id": record.stream_id,
+    }
+    return StreamingResponse(
+        _relay_stream(record, start, request),
+        media_type="text/event-stream",
+        headers=headers,
+    )
 
 
 @app.post("/memory/upsert", tags=["Memori"])
 async def memory_upsert_endpoint(payload: MemoryUpsert) -> dict:
     """Menyimpan entri memori ke database."""
     logger.info("Menyimpan memori tipe '%s'", payload.type)
-    stored = await asyncio.to_thread(upsert_memory, payload.type, payload.text)
+    async with admitted(Priority.BULK_WRITE):
+        stored = await run_in("embedding", upsert_memory, payload.type, payload.text)
     return {"memory": stored}
 
 
@@ -483,96 +1030,38 @@ async def memory_search_endpoint(payload: MemorySearch) -> dict:
     top_k = max(1, payload.top_k or 3)
     logger.info("Mencari memori dengan top_k=%d", top_k)
     try:
-        results = await asyncio.to_thread(search_memory, payload.query, top_k)
+        async with admitted(Priority.MEMORY_READ):
+            results = await run_in("embedding", search_memory, payload.query, top_k)
         return {"results": results or []}
+    except AdmissionRejected:
+        raise
     except Exception:
         logger.exception("Gagal mencari memori")
         raise HTTPException(status_code=500, detail="Pencarian memori gagal.")
 
 
-# --- ENDPOINT EMOSI YANG TELAH DIPERBAIKI (V3) ---
+# --- ENDPOINT EMOSI (LOKAL DULU, GEMINI HANYA JIKA RAGU) ---
 @app.post("/emotion", tags=["Avatar"])
 async def emotion_endpoint(
     payload: EmotionIn,
+    request: Request,
     user_api_key: Optional[str] = Header(None, alias="X-Gemini-Api-Key")
 ) -> EmotionOut:
     """
-    Analisis emosi dengan Timeout lebih panjang (15s) dan Versi Model Spesifik.
+    Analisis emosi avatar. Klasifikasi lokal (leksikon + embedding) dipakai lebih dulu;
+    Gemini hanya dipanggil jika keyakinan lokal di bawah ambang dan ada API Key.
     """
-    # Default fallback jika tidak ada API Key
-    if not user_api_key:
-        return EmotionOut(emotion="happy", glow="#a78bfa")
-
-    prompt = f"""
-    Analyze the sentiment of this text spoken by an anime character named 'Linda' (Persona: {payload.persona or 'cheerful'}).
-    Text: "{payload.text}"
-    
-    Determine the best facial expression and lighting color.
-    VALID EMOTIONS: neutral, happy, sad, angry, tsun (shy/tsundere), excited, calm.
-    
-    Return ONLY valid JSON:
-    {{
-        "emotion": "emotion_name",
-        "blink": true,
-        "wink": false, 
-        "headSwaySpeed": 1.0,
-        "glow": "#HEXCOLOR"
-    }}
-    """
-    
-   # --- DAFTAR MODEL OPTIMISASI ---
-    # Karena log membuktikan cuma 2.5 yang jalan di akunmu, kita taruh dia paling atas!
-    candidate_models = [
-        ("gemini-2.5-flash", "v1beta"),      # JUARA UTAMA (Terbukti Sukses)
-        ("gemini-1.5-flash-002", "v1beta"),  # Cadangan
-        ("gemini-1.5-flash", "v1beta"),      # Cadangan
-        ("gemini-1.5-flash-8b", "v1beta"),   # Cadangan
-    ]
-
-    # Set timeout 15 detik agar tidak terputus saat model 2.5 sedang 'berpikir'
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        for model, version in candidate_models:
-            url = f"https://generativelanguage.googleapis.com/{version}/models/{model}:generateContent"
-            
-            try:
-                response = await client.post(
-                    url,
-                    params={"key": user_api_key},
-                    json={"contents": [{"parts": [{"text": prompt}]}]}
-                )
-                
-                # Debugging: Cek kalau errornya bukan 200
-                if response.status_code != 200:
-                    logger.warning(f"Emotion {model} ({version}) gagal: {response.status_code}")
-                    continue 
-                
-                result = response.json()
-                
-                if "candidates" in result and result["candidates"]:
-                    text_response = result["candidates"][0]["content"]["parts"][0]["text"]
-                    # Bersihkan format markdown json ```json ... ```
-                    clean_json = text_response.replace("```json", "").replace("```", "").strip()
-                    data = json.loads(clean_json)
-                    
-                    logger.info(f"Sukses analisis emosi pakai {model}")
-                    return EmotionOut(
-                        emotion=data.get("emotion", "neutral"),
-                        blink=data.get("blink", True),
-                        wink=data.get("wink", False),
-                        headSwaySpeed=float(data.get("headSwaySpeed", 1.0)),
-                        glow=data.get("glow", "#a78bfa")
-                    )
-                
-            except httpx.TimeoutException:
-                logger.warning(f"Emotion {model} TIMEOUT (kelamaan mikir).")
-                continue
-            except Exception as e:
-                logger.warning(f"Error lain pada {model}: {e}")
-                continue
-
-    # Kalau semua gagal, senyum aja :)
-    logger.error("Semua model emosi gagal. Fallback ke default.")
-    return EmotionOut(emotion="neutral", glow="#a78bfa")
+    start_deadline(resolve_budget(request.headers.get(DEADLINE_HEADER)))
+    try:
+        async with admitted(Priority.EMOTION, user_api_key):
+            with EMOTION_SECONDS.time():
+                return await resolve_emotion(payload.text, payload.persona, user_api_key)
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        # Kalau semua gagal, senyum aja :)
+        logger.error("Analisis emosi gagal total, fallback ke default: %s", e)
+        return EmotionOut(emotion="neutral", glow="#a78bfa")
 
 
 if __name__ == "__main__":
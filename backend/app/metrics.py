@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+Registry metrik ringan (tanpa dependensi) dengan format eksposisi teks Prometheus.
+Menyediakan Counter, Gauge, dan Histogram berlabel yang aman dipakai dari thread
+(memori & pencarian jalan di executor thread), plus definisi metrik pipeline chat.
+"""
+
+import abc
+import asyncio
+import contextlib
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+
+LabelValues = Tuple[str, ...]
+GaugeSample = Union[float, Mapping[LabelValues, float]]
+
+# Bucket default dalam detik: dari operasi lokal (ms) sampai generasi panjang (puluhan detik)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric(abc.ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Mapping[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metrik {self.name} butuh label {self.labelnames}, dapat {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    @abc.abstractmethod
+    def _samples(self) -> List[str]:
+        """Baris sampel (tanpa HELP/TYPE) untuk eksposisi teks."""
+
+
+class _Scalar(_Metric):
+    """Satu nilai per kombinasi label; bisa juga dihitung saat scrape lewat `function`."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        function: Optional[Callable[[], GaugeSample]] = None,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._function = function
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        if self._function is not None:
+            try:
+                sample = self._function()
+            except Exception:
+                return []
+            items = sorted(sample.items()) if isinstance(sample, Mapping) else [((), float(sample))]
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Counter(_Scalar):
+    kind = "counter"
+
+
+class Gauge(_Scalar):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Per label: [hitungan per bucket..., sum, count]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Ukur durasi blok `with` (detik, monotonic)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels: str) -> float:
+        row = self._values.get(self._key(labels))
+        return row[-1] if row else 0.0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines: List[str] = []
+        for key, row in items:
+            cumulative = 0.0
+            for bound, hits in zip(self.buckets, row):
+                cumulative += hits
+                le = "+Inf" if math.isinf(bound) else _format_value(bound)
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', le))} {_format_value(cumulative)}"
+                )
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(row[-2])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(row[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metrik {metric.name} sudah terdaftar.")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._metrics
+
+    def counter(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        function: Optional[Callable[[], GaugeSample]] = None,
+    ) -> Counter:
+        return self._register(Counter(name, documentation, labelnames, function))  # type: ignore[return-value]
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        function: Optional[Callable[[], GaugeSample]] = None,
+    ) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames, function))  # type: ignore[return-value]
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))  # type: ignore[return-value]
+
+    def render(self) -> str:
+        """Seluruh metrik dalam format eksposisi teks (version=0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ==============================================================================
+#                           METRIK PIPELINE
+# ==============================================================================
+
+# --- Chat & SSE ---
+CHAT_REQUESTS = REGISTRY.counter(
+    "linda_chat_requests_total", "Jawaban /chat menurut hasil akhirnya.", ["outcome"]
+)
+CHAT_TIME_TO_FIRST_TOKEN = REGISTRY.histogram(
+    "linda_chat_time_to_first_token_seconds", "Waktu dari request /chat masuk sampai token pertama.", ["source"]
+)
+CHAT_TOKENS_PER_SECOND = REGISTRY.histogram(
+    "linda_chat_tokens_per_second", "Kecepatan token (estimasi) setelah token pertama.",
+    buckets=(5, 10, 25, 50, 100, 200, 400, 800),
+)
+DEADLINE_EXCEEDED = REGISTRY.counter(
+    "linda_request_deadline_exceeded_total", "Request yang budget waktunya habis, menurut tahap.", ["stage"]
+)
+PREGEN_STAGE_SKIPPED = REGISTRY.counter(
+    "linda_chat_pregen_stage_skipped_total", "Tahap pra-generasi opsional yang dilewati.", ["stage", "reason"]
+)
+INTENT_DECISIONS = REGISTRY.counter(
+    "linda_chat_intent_decisions_total", "Keputusan router intent menurut label dan sumber.", ["intent", "source"]
+)
+SEMANTIC_CACHE_LOOKUPS = REGISTRY.counter(
+    "linda_semantic_cache_lookups_total", "Lookup cache semantik menurut hasil (hit, miss, skipped).", ["result"]
+)
+SEMANTIC_CACHE_SIMILARITY = REGISTRY.histogram(
+    "linda_semantic_cache_similarity", "Kemiripan kosinus kandidat terdekat per lookup, menurut hasil.", ["result"],
+    buckets=(0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.92, 0.94, 0.96, 0.98, 1.0),
+)
+SEMANTIC_CACHE_EVICTIONS = REGISTRY.counter(
+    "linda_semantic_cache_evictions_total", "Entri cache semantik yang dibuang (ttl, capacity).", ["reason"]
+)
+SSE_OPEN_CONNECTIONS = REGISTRY.gauge(
+    "linda_sse_open_connections", "Koneksi SSE yang sedang terbuka (termasuk resume)."
+)
+SSE_TOKEN_DELTAS = REGISTRY.counter(
+    "linda_sse_token_deltas_total", "Delta token yang masuk ke writer SSE (sebelum digabung)."
+)
+SSE_TOKEN_FRAMES = REGISTRY.counter(
+    "linda_sse_token_frames_total", "Frame `event: token` yang benar-benar dikirim (setelah digabung)."
+)
+
+# --- Gemini upstream ---
+GEMINI_REQUESTS = REGISTRY.counter(
+    "linda_gemini_requests_total", "Percobaan request ke Gemini menurut model dan status HTTP.", ["model", "status"]
+)
+GEMINI_FALLBACKS = REGISTRY.counter(
+    "linda_gemini_model_fallbacks_total", "Berapa kali sebuah model dilewati dan pindah ke model berikutnya.",
+    ["model", "reason"],
+)
+PROMPT_CACHE_EVENTS = REGISTRY.counter(
+    "linda_gemini_prompt_cache_events_total",
+    "Cache persona Gemini (cachedContents): hit, miss, created, refreshed, rejected, gagal.", ["event"],
+)
+GEMINI_CONNECT_SECONDS = REGISTRY.histogram(
+    "linda_gemini_connect_seconds", "Waktu sampai header respons Gemini diterima.", ["model"]
+)
+
+# --- Memori (FAISS + SQLite) ---
+MEMORY_SEARCH_SECONDS = REGISTRY.histogram(
+    "linda_memory_search_seconds", "Durasi search_memory end-to-end."
+)
+MEMORY_ENCODE_SECONDS = REGISTRY.histogram(
+    "linda_memory_encode_seconds", "Durasi encode SentenceTransformer.", ["op"]
+)
+MEMORY_LOCK_WAIT_SECONDS = REGISTRY.histogram(
+    "linda_memory_lock_wait_seconds", "Lama menunggu memory_lock.", ["op"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+
+# --- Pencarian web ---
+WEB_SEARCH_SECONDS = REGISTRY.histogram(
+    "linda_web_search_seconds", "Durasi pencarian DuckDuckGo.", ["outcome"]
+)
+
+# --- Emosi ---
+EMOTION_REQUESTS = REGISTRY.counter(
+    "linda_emotion_resolutions_total", "Sumber label emosi (cache, local, gemini, local_fallback = Gemini gagal, tidak di-cache).", ["source"]
+)
+EMOTION_SECONDS = REGISTRY.histogram(
+    "linda_emotion_request_seconds", "Durasi endpoint /emotion."
+)
+
+# --- Logging ---
+LOG_RECORDS_DROPPED = REGISTRY.counter(
+    "linda_log_records_dropped_total", "Baris log yang dibuang (sampling, rate limit, antrean penuh).", ["reason"]
+)
+
+# --- Executor thread bernama ---
+EXECUTOR_QUEUE_DEPTH = REGISTRY.gauge(
+    "linda_executor_queue_depth", "Pekerjaan yang menunggu worker di executor.", ["executor"]
+)
+EXECUTOR_ACTIVE = REGISTRY.gauge(
+    "linda_executor_active", "Pekerjaan yang sedang jalan di executor.", ["executor"]
+)
+EXECUTOR_WAIT_SECONDS = REGISTRY.histogram(
+    "linda_executor_wait_seconds", "Lama pekerjaan menunggu worker bebas.", ["executor"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+
+# --- Event loop ---
+EVENT_LOOP_LAG = REGISTRY.gauge(
+    "linda_event_loop_lag_seconds", "Keterlambatan wake-up event loop terakhir yang terukur."
+)
+
+
+async def monitor_event_loop_lag(interval: float = 1.0) -> None:
+    """Tidur `interval` detik berulang kali dan catat seberapa telat bangunnya."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.set(max(0.0, loop.time() - started - interval))
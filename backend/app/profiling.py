@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Alat diagnosis untuk server yang sedang berjalan (endpoint /admin/*).
+Semuanya pustaka standar, tanpa dependensi tambahan:
+
+- profil CPU sampling: thread terpisah membaca stack semua thread lewat
+  sys._current_frames() tiap interval, hasilnya format "folded stacks"
+  (satu baris `frame;frame;frame jumlah`) yang langsung bisa dibuka di
+  speedscope atau flamegraph.pl;
+- diff snapshot tracemalloc terhadap baseline, per lokasi alokasi;
+- jumlah task asyncio per coroutine (task yang menumpuk = kebocoran).
+
+Mati secara default; lihat ADMIN_ENDPOINTS & ADMIN_TOKEN di config.
+"""
+
+import asyncio
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from functools import lru_cache
+from types import FrameType
+from typing import Any, Counter, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Frame milik tracemalloc/importlib sendiri bukan lokasi alokasi yang menarik
+_TRACEMALLOC_IGNORED = (tracemalloc.__file__, "<frozen importlib._bootstrap>", "<unknown>")
+
+
+class ProfilerBusy(RuntimeError):
+    """Profil CPU lain sedang berjalan."""
+
+
+# ==============================================================================
+#                           PROFIL CPU (SAMPLING)
+# ==============================================================================
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _fold(frame: Optional[FrameType], thread_name: str) -> str:
+    stack: List[str] = []
+    while frame is not None:
+        stack.append(_frame_label(frame))
+        frame = frame.f_back
+    stack.append(thread_name)
+    return ";".join(reversed(stack))
+
+
+class SamplingProfiler:
+    """Sampler stack semua thread; satu profil per waktu (sampling ke-2 akan mengganggu yang pertama)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+
+    def _sample(self, seconds: float, interval: float) -> Counter[str]:
+        samples: Counter[str] = collections.Counter()
+        own_id = threading.get_ident()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    samples[_fold(frame, names.get(thread_id, f"thread-{thread_id}"))] += 1
+            time.sleep(interval)
+        return samples
+
+    async def profile(self, seconds: float, interval: float) -> str:
+        """Sampling selama `seconds` di thread sendiri, lalu hasil dalam format folded stacks."""
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("Profil CPU lain sedang berjalan.")
+        loop = asyncio.get_running_loop()
+        done: "asyncio.Future[Counter[str]]" = loop.create_future()
+
+        def settle(outcome: Any, failed: bool) -> None:
+            if done.cancelled():
+                return
+            if failed:
+                done.set_exception(outcome)
+            else:
+                done.set_result(outcome)
+
+        def run() -> None:
+            # Lock dilepas oleh thread sampler, jadi klien yang putus tidak membuka jalan ke profil kedua
+            try:
+                loop.call_soon_threadsafe(settle, self._sample(seconds, interval), False)
+            except Exception as e:
+                loop.call_soon_threadsafe(settle, e, True)
+            finally:
+                self._lock.release()
+
+        logger.warning("Profil CPU dimulai: %.1f detik, interval %.1f ms.", seconds, interval * 1000)
+        try:
+            threading.Thread(target=run, name="linda-profiler", daemon=True).start()
+        except BaseException:
+            self._lock.release()
+            raise
+        samples = await done
+        return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+
+# ==============================================================================
+#                           ALOKASI (TRACEMALLOC)
+# ==============================================================================
+
+class AllocationTracker:
+    """
+    Baseline tracemalloc + diff per lokasi alokasi terhadap baseline itu.
+    Dipanggil dari thread (snapshot terlalu berat untuk event loop), jadi tiap
+    operasi dikunci supaya stop tidak jalan di tengah snapshot atau diff.
+    """
+
+    def __init__(self) -> None:
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._started_here = False
+        self._lock = threading.Lock()
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, pattern) for pattern in _TRACEMALLOC_IGNORED]
+        )
+
+    def start(self, frames: int) -> Dict[str, Any]:
+        """Mulai tracing (kalau belum) dan ambil baseline baru."""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+                self._started_here = True
+                logger.warning("tracemalloc dimulai (%d frame); alokasi jadi lebih lambat sampai dihentikan.", frames)
+            self._baseline = self._snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        return {"tracing": True, "frames": tracemalloc.get_traceback_limit(), "traced_bytes": current, "peak_bytes": peak}
+
+    def diff(self, limit: int, key_type: str = "lineno") -> Dict[str, Any]:
+        """Lokasi dengan pertumbuhan terbesar sejak baseline."""
+        with self._lock:
+            if self._baseline is None or not tracemalloc.is_tracing():
+                raise LookupError("Belum ada baseline tracemalloc.")
+            stats = self._snapshot().compare_to(self._baseline, key_type)
+            current, peak = tracemalloc.get_traced_memory()
+        return {
+            "traced_bytes": current,
+            "peak_bytes": peak,
+            "top": [
+                {
+                    "site": str(stat.traceback[0]) if stat.traceback else "?",
+                    "traceback": [str(frame) for frame in stat.traceback] if key_type == "traceback" else None,
+                    "size_diff": stat.size_diff,
+                    "size": stat.size,
+                    "count_diff": stat.count_diff,
+                    "count": stat.count,
+                }
+                for stat in stats[:limit]
+            ],
+        }
+
+    def stop(self) -> Dict[str, Any]:
+        with self._lock:
+            self._baseline = None
+            stopped = self._started_here and tracemalloc.is_tracing()
+            if stopped:
+                tracemalloc.stop()
+                logger.warning("tracemalloc dihentikan.")
+            self._started_here = False
+            return {"tracing": tracemalloc.is_tracing(), "stopped": stopped}
+
+
+# ==============================================================================
+#                           TASK ASYNCIO
+# ==============================================================================
+
+def _coroutine_name(task: "asyncio.Task[Any]") -> str:
+    coro = task.get_coro()
+    name = getattr(coro, "__qualname__", None) or type(coro).__name__
+    module = getattr(getattr(coro, "cr_code", None), "co_filename", None)
+    return f"{name} ({os.path.basename(module)})" if module else name
+
+
+def task_counts() -> Dict[str, Any]:
+    """Task asyncio yang belum selesai di loop ini, dikelompokkan per coroutine."""
+    counts: Counter[str] = collections.Counter(_coroutine_name(task) for task in asyncio.all_tasks())
+    return {
+        "total": sum(counts.values()),
+        "by_coroutine": [{"coroutine": name, "count": count} for name, count in counts.most_common()],
+    }
+
+
+@lru_cache(maxsize=1)
+def get_profiler() -> SamplingProfiler:
+    return SamplingProfiler()
+
+
+@lru_cache(maxsize=1)
+def get_allocation_tracker() -> AllocationTracker:
+    return AllocationTracker()
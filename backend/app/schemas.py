@@ -28,6 +28,10 @@ class ChatRequest(BaseModel):
     messages: List[Message] = Field(..., min_items=1, description="List riwayat chat.")
     persona: Optional[str] = Field("ceria", description="ID Persona (ceria, tsundere, dll).")
     use_memory: bool = Field(default=False, description="Aktifkan memori jangka panjang (RAG).")
+    emit_emotion: bool = Field(
+        default=False,
+        description="Kirim event SSE 'emotion' (EmotionOut) sebelum 'done', tanpa request /emotion terpisah.",
+    )
     
     # Field khusus buat nerima gambar (Multimodal)
     image_base64: Optional[str] = Field(
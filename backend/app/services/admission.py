@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Service layer untuk admission control.
+Membatasi jumlah request yang dikerjakan bersamaan (global dan per API Key),
+menampung sisanya di antrean berprioritas yang terbatas dengan deadline, dan
+menolak cepat (429 + Retry-After) saat antrean penuh supaya latensi request
+yang sudah diterima tetap stabil.
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import itertools
+import logging
+import math
+import time
+from enum import IntEnum
+from functools import lru_cache
+from typing import AsyncIterator, Dict, List, Optional
+
+from ..config import get_settings
+from ..metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Kelas prioritas: angka lebih kecil dilayani lebih dulu."""
+    CHAT = 0
+    MEMORY_READ = 1
+    EMOTION = 2
+    BULK_WRITE = 3
+
+
+class AdmissionRejected(Exception):
+    """Request ditolak karena antrean penuh atau terlalu lama menunggu."""
+
+    def __init__(self, reason: str, retry_after: int) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """Slot eksekusi yang sudah diberikan. release() aman dipanggil berkali-kali."""
+
+    def __init__(self, controller: "AdmissionController", key: Optional[str]) -> None:
+        self._controller = controller
+        self.key = key
+        self.granted_at = time.monotonic()
+        self.released = False
+
+    def release(self) -> None:
+        if self.released:
+            return
+        self.released = True
+        self._controller._release(self)
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "key", "future", "enqueued_at")
+
+    def __init__(self, priority: Priority, seq: int, key: Optional[str], future: "asyncio.Future[Ticket]") -> None:
+        self.priority = priority
+        self.seq = seq
+        self.key = key
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+def key_id(api_key: Optional[str]) -> Optional[str]:
+    """API Key tidak disimpan mentah; cukup hash pendek sebagai identitas."""
+    if not api_key:
+        return None
+    return hashlib.sha1(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        global_limit: int,
+        per_key_limit: int,
+        max_queue: int,
+        queue_timeout: float,
+    ) -> None:
+        self.global_limit = max(1, global_limit)
+        self.per_key_limit = max(1, per_key_limit)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._active = 0
+        self._active_by_key: Dict[str, int] = {}
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._hold_ewma = 1.0
+        self.rejected = 0
+
+    # --------------------------------------------------------------------------
+    #                           STATE INTERNAL
+    # --------------------------------------------------------------------------
+
+    def _can_run(self, key: Optional[str]) -> bool:
+        if self._active >= self.global_limit:
+            return False
+        if key is not None and self._active_by_key.get(key, 0) >= self.per_key_limit:
+            return False
+        return True
+
+    def _grant(self, key: Optional[str]) -> Ticket:
+        self._active += 1
+        if key is not None:
+            self._active_by_key[key] = self._active_by_key.get(key, 0) + 1
+        return Ticket(self, key)
+
+    def _release(self, ticket: Ticket) -> None:
+        self._active = max(0, self._active - 1)
+        if ticket.key is not None:
+            remaining = self._active_by_key.get(ticket.key, 0) - 1
+            if remaining > 0:
+                self._active_by_key[ticket.key] = remaining
+            else:
+                self._active_by_key.pop(ticket.key, None)
+        held = time.monotonic() - ticket.granted_at
+        self._hold_ewma = 0.8 * self._hold_ewma + 0.2 * held
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Memberikan slot kosong ke waiter prioritas tertinggi yang boleh jalan."""
+        self._waiters = [w for w in self._waiters if not w.future.done()]
+        while self._waiters and self._active < self.global_limit:
+            eligible = [w for w in self._waiters if self._can_run(w.key)]
+            if not eligible:
+                return
+            best = min(eligible, key=lambda w: (w.priority, w.seq))
+            self._waiters.remove(best)
+            best.future.set_result(self._grant(best.key))
+
+    def retry_after(self) -> int:
+        """Perkiraan detik sampai ada slot kosong (untuk header Retry-After)."""
+        backlog = len(self._waiters) + 1
+        return max(1, math.ceil(self._hold_ewma * backlog / self.global_limit))
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        self.rejected += 1
+        return AdmissionRejected(reason, self.retry_after())
+
+    # --------------------------------------------------------------------------
+    #                           API PUBLIK
+    # --------------------------------------------------------------------------
+
+    async def acquire(self, priority: Priority, api_key: Optional[str] = None) -> Ticket:
+        """Meminta slot; menunggu di antrean sampai queue_timeout atau ditolak."""
+        key = key_id(api_key)
+        if self._can_run(key):
+            return self._grant(key)
+
+        pending = [w for w in self._waiters if not w.future.done()]
+        if len(pending) >= self.max_queue:
+            # Antrean penuh: usir waiter paling tidak penting kalau kita lebih penting
+            worst = max(pending, key=lambda w: (w.priority, w.seq), default=None)
+            if worst is None or worst.priority <= priority:
+                raise self._reject("Antrean penuh")
+            self._waiters.remove(worst)
+            worst.future.set_exception(self._reject("Digeser request prioritas lebih tinggi"))
+
+        future: "asyncio.Future[Ticket]" = asyncio.get_running_loop().create_future()
+        waiter = _Waiter(priority, next(self._seq), key, future)
+        self._waiters.append(waiter)
+
+        try:
+            done, _ = await asyncio.wait({future}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            # Klien pergi saat masih antre: kembalikan slot kalau sempat diberikan
+            if future.done() and not future.cancelled() and future.exception() is None:
+                future.result().release()
+            else:
+                future.cancel()
+            raise
+
+        if not done:
+            future.cancel()
+            self._dispatch()
+            raise self._reject("Terlalu lama menunggu giliran")
+        return future.result()
+
+    def stats(self) -> Dict[str, object]:
+        pending = [w for w in self._waiters if not w.future.done()]
+        return {
+            "active": self._active,
+            "queued": len(pending),
+            "queued_by_priority": {
+                p.name.lower(): sum(1 for w in pending if w.priority == p) for p in Priority
+            },
+            "rejected": self.rejected,
+            "global_limit": self.global_limit,
+            "per_key_limit": self.per_key_limit,
+        }
+
+
+@contextlib.asynccontextmanager
+async def admitted(priority: Priority, api_key: Optional[str] = None) -> AsyncIterator[Ticket]:
+    """Pemakaian: `async with admitted(Priority.EMOTION, key): ...`"""
+    ticket = await get_admission_controller().acquire(priority, api_key)
+    try:
+        yield ticket
+    finally:
+        ticket.release()
+
+
+# Dijaga seperti di memory.py: reload modul tidak boleh gagal karena nama sudah terdaftar
+if "linda_admission_active" not in REGISTRY:
+    REGISTRY.gauge(
+        "linda_admission_active", "Slot admission yang sedang dipakai.",
+        function=lambda: get_admission_controller().stats()["active"],
+    )
+if "linda_admission_queued" not in REGISTRY:
+    REGISTRY.gauge(
+        "linda_admission_queued", "Request yang menunggu slot admission.",
+        function=lambda: get_admission_controller().stats()["queued"],
+    )
+if "linda_admission_rejected_total" not in REGISTRY:
+    REGISTRY.counter(
+        "linda_admission_rejected_total", "Request yang ditolak admission control (429).",
+        function=lambda: get_admission_controller().stats()["rejected"],
+    )
+
+
+@lru_cache(maxsize=1)
+def get_admission_controller() -> AdmissionController:
+    """Mengembalikan AdmissionController tunggal sesuai konfigurasi."""
+    settings = get_settings()
+    return AdmissionController(
+        global_limit=settings.admission_global_limit,
+        per_key_limit=settings.admission_per_key_limit,
+        max_queue=settings.admission_max_queue,
+        queue_timeout=settings.admission_queue_timeout,
+    )
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+Service layer untuk cache respons chat.
+Kunci cache adalah hash dari prompt efektif (persona, system prompt termasuk
+memori/ringkasan, riwayat yang dikirim, gambar, tanggal), bukan cuma pesan
+terakhir. L1 ada di RAM dan dibatasi byte + TTL; L2 opsional di SQLite supaya
+tahan restart dan bisa dipakai bersama oleh beberapa worker di host yang sama.
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from datetime import date
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from ..config import get_settings
+from ..executors import run_in
+from ..metrics import REGISTRY
+from ..schemas import Message
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY_VERSION = 1
+
+
+def build_cache_key(
+    persona: str,
+    system_prompt: str,
+    messages: List[Message],
+    image_base64: Optional[str] = None,
+    *,
+    image_digest: Optional[str] = None,
+) -> str:
+    """
+    Hash SHA-256 dari semua yang menentukan jawaban Gemini. Gambar cukup
+    diwakili digest-nya (ImageInput.digest); `image_base64` untuk pemanggil lama.
+    """
+    if image_digest is None:
+        image_digest = hashlib.sha256(image_base64.encode("utf-8")).hexdigest() if image_base64 else ""
+    material = json.dumps(
+        [
+            CACHE_KEY_VERSION,
+            persona,
+            system_prompt,
+            [[m.role.value, m.content] for m in messages],
+            image_digest,
+            # Prompt Gemini disuntik tanggal hari ini, jadi jawaban kemarin tidak dipakai ulang
+            date.today().isoformat(),
+        ],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl: float,
+        l2_path: Optional[Path] = None,
+        l2_max_bytes: int = 0,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.l2_path = l2_path
+        self.l2_max_bytes = l2_max_bytes
+        self._entries: "OrderedDict[str, Tuple[str, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self.counters: Dict[str, int] = {
+            "l1_hits": 0, "l2_hits": 0, "misses": 0, "puts": 0, "evictions": 0,
+        }
+        if self.l2_path is not None:
+            self._init_l2()
+
+    # --------------------------------------------------------------------------
+    #                           L1 (RAM)
+    # --------------------------------------------------------------------------
+
+    def _l1_get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at, size = entry
+        if expires_at <= time.time():
+            self._l1_remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _l1_remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def _l1_put(self, key: str, value: str, expires_at: float) -> None:
+        size = len(value.encode("utf-8")) + len(key)
+        if size > self.max_bytes:
+            return
+        self._l1_remove(key)
+        self._entries[key] = (value, expires_at, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes and self._entries:
+            oldest_key = next(iter(self._entries))
+            self._l1_remove(oldest_key)
+            self.counters["evictions"] += 1
+
+    # --------------------------------------------------------------------------
+    #                           L2 (SQLITE, OPSIONAL)
+    # --------------------------------------------------------------------------
+
+    def _connect(self) -> sqlite3.Connection:
+        assert self.l2_path is not None
+        conn = sqlite3.connect(self.l2_path, timeout=5.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _init_l2(self) -> None:
+        assert self.l2_path is not None
+        self.l2_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                );
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_access ON response_cache(last_access)")
+        logger.info("Cache respons L2 aktif di %s", self.l2_path)
+
+    def _l2_get(self, key: str) -> Optional[Tuple[str, float]]:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM response_cache WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+            if row:
+                conn.execute("UPDATE response_cache SET last_access = ? WHERE key = ?", (now, key))
+        return (row[0], row[1]) if row else None
+
+    def _l2_put(self, key: str, value: str, expires_at: float) -> None:
+        now = time.time()
+        size = len(value.encode("utf-8")) + len(key)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO response_cache(key, value, size, expires_at, last_access) "
+                "VALUES(?, ?, ?, ?, ?)",
+                (key, value, size, expires_at, now),
+            )
+            conn.execute("DELETE FROM response_cache WHERE expires_at <= ?", (now,))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM response_cache").fetchone()[0]
+            if self.l2_max_bytes and total > self.l2_max_bytes:
+                # Buang entri yang paling lama tidak diakses sampai di bawah batas
+                rows = conn.execute("SELECT key, size FROM response_cache ORDER BY last_access").fetchall()
+                doomed: List[str] = []
+                for old_key, old_size in rows:
+                    if total <= self.l2_max_bytes:
+                        break
+                    doomed.append(old_key)
+                    total -= old_size
+                conn.executemany("DELETE FROM response_cache WHERE key = ?", [(k,) for k in doomed])
+
+    def _l2_clear(self) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM response_cache")
+
+    # --------------------------------------------------------------------------
+    #                           API PUBLIK
+    # --------------------------------------------------------------------------
+
+    async def get(self, key: str) -> Optional[str]:
+        value = self._l1_get(key)
+        if value is not None:
+            self.counters["l1_hits"] += 1
+            return value
+        if self.l2_path is not None:
+            try:
+                row = await run_in("sqlite", self._l2_get, key)
+            except sqlite3.Error as e:
+                logger.warning("Cache L2 gagal dibaca: %s", e)
+                row = None
+            if row is not None:
+                self.counters["l2_hits"] += 1
+                self._l1_put(key, row[0], row[1])
+                return row[0]
+        self.counters["misses"] += 1
+        return None
+
+    async def put(self, key: str, value: str) -> None:
+        if not value:
+            return
+        expires_at = time.time() + self.ttl
+        self._l1_put(key, value, expires_at)
+        self.counters["puts"] += 1
+        if self.l2_path is not None:
+            try:
+                await run_in("sqlite", self._l2_put, key, value, expires_at)
+            except sqlite3.Error as e:
+                logger.warning("Cache L2 gagal ditulis: %s", e)
+
+    async def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+        if self.l2_path is not None:
+            await run_in("sqlite", self._l2_clear)
+
+    def stats(self) -> Dict[str, object]:
+        lookups = self.counters["l1_hits"] + self.counters["l2_hits"] + self.counters["misses"]
+        hits = self.counters["l1_hits"] + self.counters["l2_hits"]
+        return {
+            **self.counters,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "l2_enabled": self.l2_path is not None,
+        }
+
+
+def _lookup_counts() -> Dict[Tuple[str, ...], float]:
+    counters = get_response_cache().counters
+    return {
+        ("l1_hit",): counters["l1_hits"],
+        ("l2_hit",): counters["l2_hits"],
+        ("miss",): counters["misses"],
+    }
+
+
+# Dijaga seperti di memory.py: reload modul tidak boleh gagal karena nama sudah terdaftar
+if "linda_response_cache_lookups_total" not in REGISTRY:
+    REGISTRY.counter(
+        "linda_response_cache_lookups_total", "Lookup cache respons menurut hasil.", ["result"],
+        function=_lookup_counts,
+    )
+if "linda_response_cache_bytes" not in REGISTRY:
+    REGISTRY.gauge(
+        "linda_response_cache_bytes", "Ukuran cache respons L1 (byte).",
+        function=lambda: get_response_cache().stats()["bytes"],
+    )
+
+
+@lru_cache(maxsize=1)
+def get_response_cache() -> ResponseCache:
+    """Mengembalikan ResponseCache tunggal sesuai konfigurasi."""
+    settings = get_settings()
+    return ResponseCache(
+        max_bytes=settings.response_cache_max_bytes,
+        ttl=settings.response_cache_ttl,
+        l2_path=settings.response_cache_db_path,
+        l2_max_bytes=settings.response_cache_l2_max_bytes,
+    )
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+Service layer untuk mengelola ukuran konteks percakapan yang dikirim ke Gemini.
+Giliran terbaru dikirim apa adanya selama muat di budget token, sedangkan giliran
+lama diganti dengan ringkasan bergulir (rolling summary) yang di-cache dan
+diperbarui di background, bukan di jalur request.
+"""
+
+import asyncio
+import hashlib
+import logging
+import math
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Set
+
+from ..config import get_settings
+from ..schemas import Message
+from .keypool import get_key_pool
+from .upstream import get_upstream_client
+
+logger = logging.getLogger(__name__)
+
+# --- Konstanta Estimasi ---
+CHARS_PER_TOKEN = 4          # Perkiraan kasar tokenizer Gemini untuk teks latin
+MESSAGE_OVERHEAD_TOKENS = 4  # Overhead role/struktur per pesan
+SNIPPET_CHARS = 160          # Panjang potongan ekstraktif untuk giliran yang belum diringkas
+
+# --- Cache Ringkasan (kunci: hash rantai prefix riwayat) ---
+_summary_cache: "OrderedDict[str, str]" = OrderedDict()
+# Jangkar pembaruan yang sedang berjalan: hash prefix sampai beberapa giliran pertama yang
+# belum diringkas. Hash berantai, jadi jangkar ini mewakili seluruh isi percakapan sampai
+# titik itu (bukan sekadar sapaan pembuka yang sama), dan tetap sama selama pembaruannya jalan.
+_pending_refresh: Set[str] = set()
+_background_tasks: Set["asyncio.Task[None]"] = set()
+
+
+class CompactedHistory(NamedTuple):
+    """Hasil pemadatan riwayat: pesan verbatim + ringkasan giliran lama."""
+    messages: List[Message]
+    summary: Optional[str]
+    dropped: int
+    estimated_tokens: int
+
+
+# ==============================================================================
+#                           ESTIMASI TOKEN
+# ==============================================================================
+
+def estimate_tokens(text: str) -> int:
+    """Estimasi jumlah token secara lokal tanpa memanggil API."""
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def estimate_message_tokens(message: Message) -> int:
+    """Estimasi token untuk satu pesan termasuk overhead strukturnya."""
+    return estimate_tokens(message.content) + MESSAGE_OVERHEAD_TOKENS
+
+
+# ==============================================================================
+#                           FUNGSI BANTU CACHE
+# ==============================================================================
+
+def _prefix_hashes(messages: List[Message]) -> List[str]:
+    """Hash berantai: elemen ke-i mewakili prefix messages[:i+1]."""
+    hashes: List[str] = []
+    digest = ""
+    for message in messages:
+        digest = hashlib.sha1(
+            f"{digest}|{message.role}|{message.content}".encode("utf-8")
+        ).hexdigest()
+        hashes.append(digest)
+    return hashes
+
+
+def _summary_get(key: str) -> Optional[str]:
+    cached = _summary_cache.get(key)
+    if cached is not None:
+        _summary_cache.move_to_end(key)
+    return cached
+
+
+def _summary_put(key: str, summary: str) -> None:
+    if not summary:
+        return
+    _summary_cache[key] = summary
+    _summary_cache.move_to_end(key)
+    while len(_summary_cache) > get_settings().summary_cache_items:
+        _summary_cache.popitem(last=False)
+
+
+def _speaker(message: Message) -> str:
+    return "User" if message.role == "user" else "Linda"
+
+
+def _extractive_summary(messages: List[Message], token_budget: int) -> str:
+    """Ringkasan darurat: potongan pendek dari giliran terbaru yang muat di budget."""
+    lines: List[str] = []
+    used = 0
+    for message in reversed(messages):
+        content = " ".join(message.content.split())
+        if len(content) > SNIPPET_CHARS:
+            content = content[: SNIPPET_CHARS - 1] + "…"
+        line = f"{_speaker(message)}: {content}"
+        cost = estimate_tokens(line)
+        if used + cost > token_budget:
+            break
+        lines.append(line)
+        used += cost
+    return "\n".join(reversed(lines))
+
+
+def _trim_to_budget(text: str, token_budget: int) -> str:
+    max_chars = token_budget * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[: max_chars - 1] + "…"
+
+
+# ==============================================================================
+#                           PEMADATAN RIWAYAT
+# ==============================================================================
+
+def compact_history(
+    messages: List[Message],
+    *,
+    api_key: Optional[str] = None,
+    token_budget: Optional[int] = None,
+) -> CompactedHistory:
+    """
+    Menyimpan giliran terbaru apa adanya dalam budget token, dan mengganti
+    giliran lama dengan ringkasan dari cache. Jika ringkasan untuk prefix
+    lengkap belum ada, dipakai ringkasan prefix terpanjang yang tersedia
+    ditambah potongan ekstraktif, lalu pembaruan dijadwalkan di background.
+    """
+    settings = get_settings()
+    budget = token_budget if token_budget is not None else settings.history_token_budget
+    history = [m for m in messages if m.role != "system"]
+
+    # 1. Ambil giliran dari belakang selama masih muat di budget
+    cut = len(history)
+    used = 0
+    for i in range(len(history) - 1, -1, -1):
+        cost = estimate_message_tokens(history[i])
+        if used + cost > budget and cut < len(history):
+            break
+        used += cost
+        cut = i
+
+    # Riwayat verbatim sebaiknya dimulai dari giliran user
+    while cut < len(history) - 1 and history[cut].role != "user":
+        used -= estimate_message_tokens(history[cut])
+        cut += 1
+
+    kept = history[cut:]
+    dropped = history[:cut]
+    if not dropped:
+        return CompactedHistory(kept, None, 0, used)
+
+    # 2. Cari ringkasan untuk prefix terpanjang yang sudah pernah diringkas
+    hashes = _prefix_hashes(dropped)
+    covered = 0
+    previous: Optional[str] = None
+    for i in range(len(hashes) - 1, -1, -1):
+        cached = _summary_get(hashes[i])
+        if cached is not None:
+            covered, previous = i + 1, cached
+            break
+
+    uncovered = dropped[covered:]
+    summary_budget = settings.summary_token_budget
+    parts: List[str] = []
+    if previous:
+        parts.append(previous)
+    if uncovered:
+        remaining = max(0, summary_budget - estimate_tokens(previous or ""))
+        snippet = _extractive_summary(uncovered, remaining)
+        if snippet:
+            parts.append(snippet)
+        # Prefix yang dibuang bertambah tiap giliran, jadi tanpa ambang ini setiap giliran
+        # memicu satu panggilan ringkasan lagi ke Gemini
+        due = (
+            len(uncovered) >= settings.summary_refresh_min_messages
+            or sum(estimate_message_tokens(m) for m in uncovered) >= settings.summary_refresh_min_tokens
+        )
+        if settings.summary_enabled and due:
+            anchor = hashes[min(covered + settings.summary_refresh_min_messages, len(hashes)) - 1]
+            _schedule_refresh(anchor, hashes[-1], previous, uncovered, api_key)
+
+    summary = _trim_to_budget("\n".join(parts), summary_budget) if parts else None
+    total = used + estimate_tokens(summary or "")
+    logger.debug(
+        "Riwayat dipadatkan: %d giliran verbatim, %d diringkas (~%d token).",
+        len(kept), len(dropped), total,
+    )
+    return CompactedHistory(kept, summary, len(dropped), total)
+
+
+# ==============================================================================
+#                       PEMBARUAN RINGKASAN (BACKGROUND)
+# ==============================================================================
+
+def _schedule_refresh(
+    anchor: str, key: str, previous: Optional[str], messages: List[Message], api_key: Optional[str]
+) -> None:
+    """
+    Menjadwalkan pembaruan ringkasan tanpa memblokir request yang sedang jalan.
+    Paling banyak satu pembaruan per percakapan (`anchor`); giliran yang masuk
+    selama itu ikut diringkas di pembaruan berikutnya.
+    """
+    if anchor in _pending_refresh:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    final_api_key = api_key
+    if not final_api_key:
+        # Pakai pool key server, tapi jangan menunggu: ringkasan bukan prioritas
+        final_api_key, _ = get_key_pool().try_acquire(get_settings().gemini_model)
+    if not final_api_key:
+        return
+
+    _pending_refresh.add(anchor)
+    task = loop.create_task(_refresh_summary(anchor, key, previous, list(messages), final_api_key))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _refresh_summary(
+    anchor: str, key: str, previous: Optional[str], messages: List[Message], api_key: str
+) -> None:
+    try:
+        summary = await summarize_messages(previous, messages, api_key)
+        if summary:
+            _summary_put(key, summary)
+            logger.info("Ringkasan riwayat diperbarui (%d giliran baru).", len(messages))
+    except Exception as e:
+        logger.warning("Gagal memperbarui ringkasan riwayat: %s", e)
+    finally:
+        _pending_refresh.discard(anchor)
+
+
+async def summarize_messages(
+    previous: Optional[str], messages: List[Message], api_key: str
+) -> str:
+    """Meminta Gemini menggabungkan ringkasan lama dengan giliran baru."""
+    settings = get_settings()
+    transcript = "\n".join(f"{_speaker(m)}: {m.content}" for m in messages)
+    max_words = max(40, settings.summary_token_budget // 2)
+    prompt = (
+        "Kamu merangkum percakapan antara User dan Linda.\n"
+        f"Ringkasan sebelumnya:\n{previous or '(belum ada)'}\n\n"
+        f"Giliran baru:\n{transcript}\n\n"
+        "Tulis ringkasan gabungan dalam Bahasa Indonesia, maksimal "
+        f"{max_words} kata. Pertahankan fakta penting tentang user, janji, "
+        "dan topik yang masih berjalan. Jangan pakai markdown."
+    )
+    url = f"{settings.gemini_base_url}/{settings.gemini_model}:generateContent"
+    body: Dict[str, object] = {
+        "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+        "generationConfig": {
+            "temperature": 0.2,
+            "maxOutputTokens": settings.summary_token_budget,
+        },
+    }
+    response = await get_upstream_client().post(
+        url, params={"key": api_key}, json=body, timeout=settings.request_timeout,
+    )
+    response.raise_for_status()
+    data = response.json()
+
+    texts: List[str] = []
+    for candidate in data.get("candidates", []):
+        for part in candidate.get("content", {}).get("parts", []):
+            if isinstance(part, dict) and part.get("text"):
+                texts.append(part["text"])
+    return _trim_to_budget(" ".join("".join(texts).split()), settings.summary_token_budget)
+
+
+def clear_summary_cache() -> None:
+    """Menghapus semua ringkasan (dipakai saat reset sesi)."""
+    _summary_cache.clear()
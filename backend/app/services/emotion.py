@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+Service layer untuk analisis emosi avatar Linda.
+Jalur cepat memakai leksikon emotikon persona + vektor prototipe dari model
+embedding MiniLM yang sama dengan memori. Gemini hanya dipanggil kalau
+klasifikasi lokal kurang yakin.
+"""
+
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from ..config import get_settings
+from ..deadline import DeadlineExceeded, time_left
+from ..executors import run_in
+from ..lazy import lazy_import
+from ..metrics import EMOTION_REQUESTS
+from ..schemas import EmotionOut
+from .prototypes import PrototypeClassifier
+from .upstream import get_upstream_client
+
+logger = logging.getLogger(__name__)
+
+# numpy baru dimuat saat klasifikasi lokal pertama, bukan saat startup
+np = lazy_import("numpy")
+
+# --- Label yang dikenal frontend (lihat EmotionOut) ---
+EMOTIONS = ("happy", "sad", "angry", "tsun", "excited", "calm", "neutral")
+
+# --- Gaya visual per emosi (glow, kecepatan goyang kepala, wink) ---
+EMOTION_STYLES: Dict[str, Dict[str, object]] = {
+    "happy":   {"glow": "#f472b6", "headSwaySpeed": 1.2, "wink": False},
+    "excited": {"glow": "#facc15", "headSwaySpeed": 1.6, "wink": False},
+    "sad":     {"glow": "#60a5fa", "headSwaySpeed": 0.6, "wink": False},
+    "angry":   {"glow": "#ef4444", "headSwaySpeed": 1.4, "wink": False},
+    "tsun":    {"glow": "#fb7185", "headSwaySpeed": 1.1, "wink": True},
+    "calm":    {"glow": "#34d399", "headSwaySpeed": 0.7, "wink": False},
+    "neutral": {"glow": "#a78bfa", "headSwaySpeed": 1.0, "wink": False},
+}
+
+# --- Leksikon: emotikon & kata khas persona (pola regex, label, bobot) ---
+LEXICON: List[Tuple[str, str, float]] = [
+    (r"\^\^|:d\b|\(≧▽≦\)|:\)|♡|<3", "happy", 1.0),
+    (r"\bhe(he)+\b|\bsenang\b|\bseneng\b|\bmakasih\b", "happy", 0.6),
+    (r"\bwk(wk)+|\bi+y+a{3,}|\bwa+h{2,}|\bkere+n{2,}|\byeay\b|!{3,}", "excited", 1.0),
+    (r"\(≧▽≦\)|\basik\b|\bseru\b", "excited", 0.5),
+    (r"\bhu(hu)+\b|\(￣︿￣\)|:\(|\bhiks\b|\bt_t\b", "sad", 1.0),
+    (r"\bsedih\b|\bkangen\b|\bsepi\b|\bmaaf\b", "sad", 0.6),
+    (r"\(¬¬\)|\bhmph\b|>:\(", "angry", 0.8),
+    (r"\bastaga\b|\bawas aja\b|\bkesel\b|\bberisik\b|\bngambek\b", "angry", 0.7),
+    (r"\(>__<\)|>_<|\bbukan salah aku\b|\bbukan karena\b|\bbaka\b|\bgengsi\b", "tsun", 1.0),
+    (r"\bhmph\b|\bjangan ge-?er\b", "tsun", 0.5),
+    (r"\bistirahat\b|\btenang\b|\bpelan-pelan\b|\bsemoga\b|\bjaga diri\b", "calm", 0.7),
+]
+
+# --- Kalimat prototipe per label untuk klasifikasi berbasis embedding ---
+PROTOTYPES: Dict[str, List[str]] = {
+    "happy": [
+        "Aku senang banget ngobrol sama kamu hari ini!",
+        "Hehe makasih ya, kamu baik banget ^^",
+        "Wah, aku ikut bahagia dengarnya :D",
+    ],
+    "excited": [
+        "IYAAAA kerennn banget!!! Aku nggak sabar!",
+        "Wahhh seru banget wkwkwk ayo kita coba sekarang!",
+        "Yeay! Ini kabar paling heboh hari ini!",
+    ],
+    "sad": [
+        "Huhuhu aku sedih dengarnya...",
+        "Maaf ya, aku kangen kamu, rasanya sepi banget.",
+        "Aku ikut sedih, semoga kamu cepat membaik.",
+    ],
+    "angry": [
+        "Astaga, kamu ini ya! Kenapa nggak dengerin aku?!",
+        "Hmph! Awas aja kalau kamu ulangi lagi!",
+        "Aku kesel banget sama kelakuanmu barusan.",
+    ],
+    "tsun": [
+        "B-bukan karena aku peduli sama kamu ya! (>__<)",
+        "Hmph, aku cuma kebetulan ingat, jangan ge-er!",
+        "Bukan salah aku kalau aku khawatir... dasar baka.",
+    ],
+    "calm": [
+        "Istirahat dulu ya, pelan-pelan saja.",
+        "Tenang, semuanya akan baik-baik saja.",
+        "Tarik napas dulu, jaga diri baik-baik ya.",
+    ],
+    "neutral": [
+        "Berikut penjelasan singkat tentang hal tersebut.",
+        "Jadi jawabannya adalah seperti ini.",
+        "Oke, aku mengerti maksud pertanyaanmu.",
+    ],
+}
+
+LEXICON_WEIGHT = 0.5
+
+# --- State Global (lazy) ---
+_classifier = PrototypeClassifier(
+    "emosi", EMOTIONS, PROTOTYPES, LEXICON,
+    enabled=lambda: get_settings().emotion_local_embeddings,
+    lexicon_weight=LEXICON_WEIGHT,
+)
+_emotion_cache: "OrderedDict[str, EmotionOut]" = OrderedDict()
+
+
+# ==============================================================================
+#                           FUNGSI BANTU
+# ==============================================================================
+
+def build_emotion(label: str) -> EmotionOut:
+    """Membuat EmotionOut lengkap dengan gaya visual default untuk label."""
+    style = EMOTION_STYLES.get(label, EMOTION_STYLES["neutral"])
+    return EmotionOut(
+        emotion=label if label in EMOTION_STYLES else "neutral",
+        blink=True,
+        wink=bool(style["wink"]),
+        headSwaySpeed=float(style["headSwaySpeed"]),  # type: ignore[arg-type]
+        glow=str(style["glow"]),
+    )
+
+
+def _cache_key(text: str, persona: Optional[str]) -> str:
+    return hashlib.sha1(f"{persona or ''}|{text}".encode("utf-8")).hexdigest()
+
+
+def _cache_get(key: str) -> Optional[EmotionOut]:
+    cached = _emotion_cache.get(key)
+    if cached is not None:
+        _emotion_cache.move_to_end(key)
+    return cached
+
+
+def _cache_put(key: str, value: EmotionOut) -> None:
+    _emotion_cache[key] = value
+    _emotion_cache.move_to_end(key)
+    while len(_emotion_cache) > get_settings().emotion_cache_items:
+        _emotion_cache.popitem(last=False)
+
+
+# ==============================================================================
+#                           KLASIFIKASI
+# ==============================================================================
+
+def classify_emotion_local(text: str, persona: Optional[str] = None) -> Tuple[EmotionOut, float]:
+    """
+    Klasifikasi emosi lokal (blocking, jalankan di thread).
+    Mengembalikan EmotionOut dan skor keyakinan 0..1.
+    """
+    lex_probs = _classifier.lexicon_probs(text)
+    emb_probs = _classifier.embedding_probs(text) if text.strip() else None
+    probs = _classifier.blend(lex_probs, emb_probs)
+    if probs is None:
+        return build_emotion("neutral"), 0.0
+
+    # Persona tsundere cenderung menyamarkan perhatian sebagai omelan
+    if (persona or "").strip().lower() == "tsundere":
+        probs = probs.copy()
+        probs[EMOTIONS.index("tsun")] += 0.5 * probs[EMOTIONS.index("angry")]
+        probs[EMOTIONS.index("angry")] *= 0.5
+
+    best = int(np.argmax(probs))
+    return build_emotion(EMOTIONS[best]), float(probs[best])
+
+
+async def classify_emotion_gemini(
+    text: str, persona: Optional[str], api_key: str
+) -> Optional[EmotionOut]:
+    """Fallback analisis emosi via Gemini (rantai model kandidat)."""
+    prompt = f"""
+    Analyze the sentiment of this text spoken by an anime character named 'Linda' (Persona: {persona or 'cheerful'}).
+    Text: "{text}"
+
+    Determine the best facial expression and lighting color.
+    VALID EMOTIONS: neutral, happy, sad, angry, tsun (shy/tsundere), excited, calm.
+
+    Return ONLY valid JSON:
+    {{
+        "emotion": "emotion_name",
+        "blink": true,
+        "wink": false,
+        "headSwaySpeed": 1.0,
+        "glow": "#HEXCOLOR"
+    }}
+    """
+
+    # Karena log membuktikan cuma 2.5 yang jalan di akunmu, kita taruh dia paling atas!
+    candidate_models = [
+        ("gemini-2.5-flash", "v1beta"),      # JUARA UTAMA (Terbukti Sukses)
+        ("gemini-1.5-flash-002", "v1beta"),  # Cadangan
+        ("gemini-1.5-flash", "v1beta"),      # Cadangan
+        ("gemini-1.5-flash-8b", "v1beta"),   # Cadangan
+    ]
+
+    api_root = get_settings().gemini_api_root
+    # Klien upstream bersama: koneksi ke Gemini yang sudah hangat dipakai ulang, tanpa handshake TLS baru
+    client = get_upstream_client()
+    for model, version in candidate_models:
+        url = f"{api_root}/{version}/models/{model}:generateContent"
+        try:
+            # Timeout 15 detik agar tidak terputus saat model 2.5 sedang 'berpikir', tapi tiap
+            # model hanya dapat sisa deadline request; habis = pakai hasil lokal saja
+            attempt_timeout = time_left(15.0, stage="emotion")
+        except DeadlineExceeded:
+            logger.warning("Batas waktu request habis, fallback emosi Gemini dihentikan.")
+            return None
+        try:
+            response = await client.post(
+                url,
+                params={"key": api_key},
+                json={"contents": [{"parts": [{"text": prompt}]}]},
+                timeout=attempt_timeout,
+            )
+            if response.status_code != 200:
+                logger.warning(f"Emotion {model} ({version}) gagal: {response.status_code}")
+                continue
+
+            result = response.json()
+            if "candidates" in result and result["candidates"]:
+                text_response = result["candidates"][0]["content"]["parts"][0]["text"]
+                # Bersihkan format markdown json ```json ... ```
+                clean_json = text_response.replace("```json", "").replace("```", "").strip()
+                data = json.loads(clean_json)
+
+                logger.info(f"Sukses analisis emosi pakai {model}")
+                return EmotionOut(
+                    emotion=data.get("emotion", "neutral"),
+                    blink=data.get("blink", True),
+                    wink=data.get("wink", False),
+                    headSwaySpeed=float(data.get("headSwaySpeed", 1.0)),
+                    glow=data.get("glow", "#a78bfa")
+                )
+        except httpx.TimeoutException:
+            logger.warning(f"Emotion {model} TIMEOUT (kelamaan mikir).")
+            continue
+        except Exception as e:
+            logger.warning(f"Error lain pada {model}: {e}")
+            continue
+
+    logger.error("Semua model emosi gagal.")
+    return None
+
+
+async def resolve_emotion(
+    text: str, persona: Optional[str] = None, api_key: Optional[str] = None
+) -> EmotionOut:
+    """
+    Jalur utama emosi: cache → klasifikasi lokal → Gemini (hanya jika ragu).
+    Hasil akhir di-cache per hash teks + persona, kecuali tebakan lokal yang
+    ragu karena Gemini gagal (supaya dicoba lagi di request berikutnya).
+    """
+    key = _cache_key(text, persona)
+    cached = _cache_get(key)
+    if cached is not None:
+        EMOTION_REQUESTS.inc(source="cache")
+        return cached
+
+    local, confidence = await run_in("embedding", classify_emotion_local, text, persona)
+    result = local
+    source = "local"
+    threshold = get_settings().emotion_confidence_threshold
+    if confidence < threshold and api_key:
+        logger.info("Emosi lokal ragu (%.2f < %.2f), fallback ke Gemini.", confidence, threshold)
+        remote = await classify_emotion_gemini(text, persona, api_key)
+        if remote is None:
+            # Gangguan sementara (timeout, 429, deadline) tidak boleh mengunci tebakan ragu ini
+            EMOTION_REQUESTS.inc(source="local_fallback")
+            return local
+        result = remote
+        source = "gemini"
+
+    EMOTION_REQUESTS.inc(source=source)
+    _cache_put(key, result)
+    return result
+
+
+def clear_emotion_cache() -> None:
+    """Menghapus cache emosi."""
+    _emotion_cache.clear()
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Input gambar untuk /chat.
+Gambar bisa datang sebagai string Base64 di body JSON (jalur lama) atau
+sebagai file biner lewat multipart (/chat/upload). Body multipart diurai
+langsung dari stream request: batas ukuran ditegakkan selagi byte masuk
+(Content-Length yang kebesaran ditolak sebelum membaca apa pun), dan file
+spool Starlette (di RAM sampai batas tertentu, lalu ke disk) dipakai apa
+adanya, tanpa salinan kedua. Tidak ada string Base64 besar yang divalidasi
+pydantic, di-decode ulang, atau disimpan utuh hanya untuk kunci cache.
+"""
+
+import base64
+import hashlib
+import logging
+from typing import IO, AsyncIterator, Any, Dict, Optional
+
+from starlette.datastructures import FormData, UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+from starlette.requests import Request
+
+from .llm import build_image_part
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_BYTES = 64 * 1024
+# Field non-file (JSON ChatRequest di `payload`) paling besar segini
+FORM_FIELD_MAX_BYTES = 1024 * 1024
+# Ruang untuk field payload, boundary, dan header part di atas batas gambar
+FORM_OVERHEAD_BYTES = FORM_FIELD_MAX_BYTES + 64 * 1024
+FORM_MAX_FIELDS = 8
+
+
+class ImageTooLarge(ValueError):
+    """Upload melebihi IMAGE_UPLOAD_MAX_BYTES."""
+
+
+class InvalidUpload(ValueError):
+    """Body multipart tidak bisa diurai."""
+
+
+async def read_upload_form(request: Request, *, max_bytes: int, spool_bytes: int) -> FormData:
+    """
+    Urai form /chat/upload dari stream request. Body yang lebih besar dari
+    batas gambar + overhead form ditolak (ImageTooLarge) begitu ketahuan, jadi
+    upload raksasa tidak sempat ditulis utuh ke disk. Form non-multipart
+    (tanpa file) diurai biasa.
+    """
+    limit = max_bytes + FORM_OVERHEAD_BYTES
+    too_large = f"Gambar melebihi batas {max_bytes // 1024} KB."
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > limit:
+        raise ImageTooLarge(too_large)
+    if not request.headers.get("content-type", "").lower().startswith("multipart/form-data"):
+        return await request.form(max_files=0, max_fields=FORM_MAX_FIELDS, max_part_size=FORM_FIELD_MAX_BYTES)
+
+    async def limited() -> AsyncIterator[bytes]:
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > limit:
+                raise ImageTooLarge(too_large)
+            yield chunk
+
+    parser = MultiPartParser(
+        request.headers, limited(), max_files=1, max_fields=FORM_MAX_FIELDS, max_part_size=FORM_FIELD_MAX_BYTES,
+    )
+    parser.spool_max_size = spool_bytes
+    try:
+        return await parser.parse()
+    except MultiPartException as e:
+        raise InvalidUpload(e.message) from e
+
+
+class ImageInput:
+    """Satu gambar milik satu request; `digest` dipakai untuk kunci cache."""
+
+    __slots__ = ("digest", "size", "mime_type", "_base64", "_file")
+
+    def __init__(
+        self,
+        digest: str,
+        size: int,
+        mime_type: Optional[str] = None,
+        base64_data: Optional[str] = None,
+        file: Optional[IO[bytes]] = None,
+    ) -> None:
+        self.digest = digest
+        self.size = size
+        self.mime_type = mime_type
+        self._base64 = base64_data
+        self._file = file
+
+    @classmethod
+    def from_base64(cls, value: str) -> "ImageInput":
+        # Digest sama dengan kunci cache versi JSON sebelumnya (hash dari string-nya)
+        return cls(hashlib.sha256(value.encode("utf-8")).hexdigest(), len(value), base64_data=value)
+
+    @classmethod
+    async def from_upload(cls, upload: UploadFile, *, max_bytes: int) -> "ImageInput":
+        """
+        Ambil alih file spool upload (tanpa disalin) setelah menghitung hash-nya.
+        Ukuran sudah dibatasi saat diterima; cek di sini menjaga batas tepat untuk gambar.
+        """
+        try:
+            if upload.size is not None and upload.size > max_bytes:
+                raise ImageTooLarge(f"Gambar melebihi batas {max_bytes // 1024} KB.")
+            hasher = hashlib.sha256()
+            size = 0
+            await upload.seek(0)
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                hasher.update(chunk)
+        except BaseException:
+            await upload.close()
+            raise
+        return cls(hasher.hexdigest(), size, mime_type=upload.content_type, file=upload.file)
+
+    def build_part(self) -> Optional[Dict[str, Any]]:
+        """Validasi + part inlineData untuk Gemini (blocking, jalankan di thread)."""
+        if self._base64 is not None:
+            return build_image_part(self._base64)
+        if self._file is None:
+            return None
+        try:
+            # PIL hanya dimuat kalau memang ada gambar
+            from PIL import Image
+
+            self._file.seek(0)
+            with Image.open(self._file) as image:
+                detected = Image.MIME.get(image.format or "")
+            self._file.seek(0)
+            # Base64 cukup sekali, tepat di titik keluar ke API Gemini
+            encoded = base64.b64encode(self._file.read()).decode("ascii")
+            return {"inlineData": {"data": encoded, "mimeType": detected or self.mime_type or "image/jpeg"}}
+        except Exception as e:
+            logger.error("Gagal memproses gambar upload: %s", e)
+            return None
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
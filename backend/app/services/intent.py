@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Router intent untuk pesan terakhir user.
+Menentukan tahap retrieval mana yang perlu jalan sebelum generasi: pencarian
+web (butuh info terkini), memori (mengungkit cerita user), atau tidak keduanya
+(obrolan ringan). Memakai model embedding MiniLM yang sama dengan memori
+terhadap kalimat prototipe, dibantu leksikon berbatas kata (bukan substring,
+jadi "informatika" tidak lagi memicu pencarian).
+"""
+
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Tuple
+
+from ..config import get_settings
+from ..lazy import lazy_import
+from ..metrics import INTENT_DECISIONS
+from .prototypes import PrototypeClassifier
+
+logger = logging.getLogger(__name__)
+
+np = lazy_import("numpy")
+
+# --- Label intent ---
+INTENTS = ("web", "memory", "chitchat")
+
+# --- Leksikon: pola regex berbatas kata, label, bobot ---
+LEXICON: List[Tuple[str, str, float]] = [
+    (r"\b(berita|terbaru|terkini|terupdate|update)\b", "web", 1.0),
+    (r"\b(hari ini|sekarang|semalam|kemarin|minggu ini|bulan ini|tahun ini|barusan)\b", "web", 0.4),
+    (r"\b(skor|klasemen|cuaca|harga|kurs|saham|jadwal|pemilu|presiden|menteri|juara|rilis)\b", "web", 0.8),
+    (r"\b(cari(in|kan)?|mencari|carikan|googling|search|browsing)\b", "web", 1.0),
+    (r"\b(latest|news|today|weather|price|score)\b", "web", 0.8),
+    (r"\b20[2-9]\d\b", "web", 0.5),
+    (r"\b(ingat|inget|lupa|pernah|ceritain|cerita)\b", "memory", 0.8),
+    (r"\b(nama(ku| aku)|hobi(ku| aku)|kesukaan(ku| aku)|remember)\b", "memory", 1.0),
+    (r"\b(hai|halo|hello|hi|pagi|siang|sore|malam|makasih|terima kasih|apa kabar)\b", "chitchat", 0.8),
+    (r"\b(he(he)+|ha(ha)+|wk(wk)+|hmm+|oke|ok|sip|iya|yaudah)\b", "chitchat", 0.6),
+]
+
+# --- Kalimat prototipe per intent untuk klasifikasi berbasis embedding ---
+PROTOTYPES: Dict[str, List[str]] = {
+    "web": [
+        "Siapa yang menang pertandingan tadi malam?",
+        "Berapa harga emas hari ini?",
+        "Apa berita terbaru soal pemilu?",
+        "Gimana cuaca di Jakarta besok?",
+        "Siapa presiden Indonesia sekarang?",
+        "Kapan film itu rilis di bioskop?",
+        "What is the latest news about the election?",
+    ],
+    "memory": [
+        "Kamu masih ingat namaku nggak?",
+        "Aku pernah cerita soal kucingku kan?",
+        "Apa makanan kesukaanku yang dulu aku bilang?",
+        "Tadi aku bilang mau ke mana ya?",
+        "Inget nggak hobi aku apa?",
+        "Do you remember what I told you yesterday?",
+    ],
+    "chitchat": [
+        "Hai Linda, lagi apa?",
+        "Hehe makasih ya udah nemenin aku.",
+        "Aku capek banget hari ini.",
+        "Selamat malam, mimpi indah ya.",
+        "Ceritain lelucon dong.",
+        "Kamu lucu banget sih.",
+        "Tolong jelasin konsep rekursi dengan contoh.",
+    ],
+}
+
+LEXICON_WEIGHT = 0.4
+# Obrolan ringan baru dianggap pasti (memori dilewati) di atas keyakinan ini
+CHITCHAT_SKIP_MEMORY = 0.6
+
+# --- State Global (lazy) ---
+_classifier = PrototypeClassifier(
+    "intent", INTENTS, PROTOTYPES, LEXICON,
+    enabled=lambda: get_settings().intent_local_embeddings,
+    lexicon_weight=LEXICON_WEIGHT,
+)
+_intent_cache: "OrderedDict[str, IntentDecision]" = OrderedDict()
+
+
+class IntentDecision(NamedTuple):
+    """Keputusan router: label teratas, probabilitas per intent, dan tahap yang dijalankan."""
+    label: str
+    scores: Dict[str, float]
+    web: bool
+    memory: bool
+    source: str
+
+
+# ==============================================================================
+#                           FUNGSI BANTU
+# ==============================================================================
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def _cache_key(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _decide(probs: "np.ndarray", source: str) -> IntentDecision:
+    settings = get_settings()
+    best = int(np.argmax(probs))
+    label = INTENTS[best]
+    scores = {name: round(float(p), 4) for name, p in zip(INTENTS, probs)}
+    # Ambang web sengaja di bawah argmax: lebih baik sesekali mencari daripada melewatkan pertanyaan terkini
+    web = scores["web"] >= settings.intent_web_threshold
+    memory = not (label == "chitchat" and scores["chitchat"] >= CHITCHAT_SKIP_MEMORY)
+    return IntentDecision(label, scores, web, memory, source)
+
+
+# ==============================================================================
+#                           ROUTING
+# ==============================================================================
+
+def route_lexical(text: str) -> IntentDecision:
+    """Keputusan dari leksikon saja (murah, tanpa model). Dipakai juga sebagai fallback."""
+    lex_probs = _classifier.lexicon_probs(_normalize(text))
+    if lex_probs is None:
+        # Tanpa sinyal apa pun: perilaku lama (memori jalan, web tidak)
+        return IntentDecision("chitchat", {name: 0.0 for name in INTENTS}, False, True, "lexicon")
+    return _decide(lex_probs, "lexicon")
+
+
+def route_intent(text: str) -> IntentDecision:
+    """
+    Klasifikasi intent pesan user (blocking, jalankan di thread).
+    Hasil di-cache per teks ternormalisasi.
+    """
+    normalized = _normalize(text)
+    if not normalized:
+        return route_lexical("")
+    key = _cache_key(normalized)
+    cached = _intent_cache.get(key)
+    if cached is not None:
+        _intent_cache.move_to_end(key)
+        INTENT_DECISIONS.inc(intent=cached.label, source="cache")
+        return cached
+
+    emb_probs = _classifier.embedding_probs(normalized)
+    if emb_probs is None:
+        decision = route_lexical(normalized)
+    else:
+        decision = _decide(_classifier.blend(_classifier.lexicon_probs(normalized), emb_probs), "embedding")
+
+    INTENT_DECISIONS.inc(intent=decision.label, source=decision.source)
+    if emb_probs is None and get_settings().intent_local_embeddings:
+        # Model belum tersedia: jangan kunci teks ini ke keputusan leksikon setelah model pulih
+        return decision
+    _intent_cache[key] = decision
+    while len(_intent_cache) > get_settings().intent_cache_items:
+        _intent_cache.popitem(last=False)
+    return decision
+
+
+def clear_intent_cache() -> None:
+    """Menghapus cache keputusan intent."""
+    _intent_cache.clear()
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Service layer untuk pool API Key Gemini milik server.
+Setiap pasangan (key, model) punya token bucket sendiri. KEY_POOL_RPM adalah
+plafon (kuota key yang sudah diketahui), bukan tebakan awal: 429/Retry-After
+menurunkan rate setengah dan sukses memulihkannya pelan-pelan sampai plafon
+itu lagi, tidak pernah di atasnya. Jadi ini backoff, bukan pencarian kuota;
+scheduler menghindari key yang sedang habis kuota SEBELUM request dikirim.
+Bucket hanya aktif kalau KEY_POOL_RPM diisi; tanpa itu key tidak dibatasi
+lokal dan cukup diistirahatkan sesuai Retry-After.
+"""
+
+import asyncio
+import json
+import logging
+import re
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from ..config import get_settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COOLDOWN = 30.0    # Detik istirahat kalau 429 tanpa info Retry-After
+DISABLED_COOLDOWN = 3600.0 # Key ditolak (401/403): jangan dipakai selama 1 jam
+MIN_RATE_FACTOR = 0.1      # Rate terendah = 10% dari rate terkonfigurasi
+
+
+class KeyPoolExhausted(Exception):
+    """Semua key sedang kena limit lebih lama dari waktu tunggu yang diizinkan."""
+
+    def __init__(self, wait: float) -> None:
+        super().__init__(f"Semua API Key kena limit, coba lagi dalam {wait:.0f} detik.")
+        self.wait = wait
+
+
+class _Bucket:
+    __slots__ = ("rate", "tokens", "updated", "cooldown_until", "throttled")
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.cooldown_until = 0.0
+        self.throttled = 0
+
+
+class KeyPool:
+    def __init__(self, keys: List[str], requests_per_minute: float, burst: float) -> None:
+        self.keys = list(dict.fromkeys(k for k in keys if k))
+        # requests_per_minute <= 0: tanpa token bucket, hanya cooldown dari 429/Retry-After
+        self.base_rate = max(requests_per_minute, 0.1) / 60.0 if requests_per_minute > 0 else 0.0
+        self.burst = max(burst, 1.0)
+        self._buckets: Dict[Tuple[str, str], _Bucket] = {}
+        self._disabled_until: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    # --------------------------------------------------------------------------
+    #                           TOKEN BUCKET
+    # --------------------------------------------------------------------------
+
+    def _bucket(self, key: str, model: str) -> _Bucket:
+        bucket = self._buckets.get((key, model))
+        if bucket is None:
+            bucket = _Bucket(self.base_rate, self.burst)
+            self._buckets[(key, model)] = bucket
+        return bucket
+
+    def _refill(self, bucket: _Bucket, now: float) -> None:
+        if not self.base_rate:
+            bucket.tokens = self.burst
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * bucket.rate)
+        bucket.updated = now
+
+    def _wait_time(self, bucket: _Bucket, now: float) -> float:
+        if bucket.cooldown_until > now:
+            return bucket.cooldown_until - now
+        if bucket.tokens >= 1.0:
+            return 0.0
+        return (1.0 - bucket.tokens) / bucket.rate
+
+    def try_acquire(self, model: str) -> Tuple[Optional[str], float]:
+        """
+        Ambil key dengan token terbanyak untuk model ini tanpa menunggu.
+        Return (key, 0) kalau dapat, atau (None, detik_tunggu_minimum).
+        """
+        if not self.keys:
+            return None, float("inf")
+        now = time.monotonic()
+        best_key: Optional[str] = None
+        best_tokens = -1.0
+        min_wait = float("inf")
+        for key in self.keys:
+            bucket = self._bucket(key, model)
+            self._refill(bucket, now)
+            wait = max(self._wait_time(bucket, now), self._disabled_until.get(key, 0.0) - now)
+            if wait == 0.0 and bucket.tokens > best_tokens:
+                best_key, best_tokens = key, bucket.tokens
+            min_wait = min(min_wait, wait)
+        if best_key is None:
+            return None, min_wait
+        self._bucket(best_key, model).tokens -= 1.0
+        return best_key, 0.0
+
+    async def acquire(self, model: str, max_wait: float) -> str:
+        """Ambil key, menunggu paling lama max_wait detik kalau semua sedang penuh."""
+        waited = 0.0
+        while True:
+            key, wait = self.try_acquire(model)
+            if key is not None:
+                return key
+            if waited + wait > max_wait:
+                raise KeyPoolExhausted(wait)
+            await asyncio.sleep(wait)
+            waited += wait
+
+    # --------------------------------------------------------------------------
+    #                           UMPAN BALIK DARI UPSTREAM
+    # --------------------------------------------------------------------------
+
+    def report_success(self, key: str, model: str) -> None:
+        """Additive increase setelah backoff; berhenti di KEY_POOL_RPM, tidak pernah melewatinya."""
+        bucket = self._bucket(key, model)
+        bucket.rate = min(self.base_rate, bucket.rate + self.base_rate * 0.05)
+
+    def report_throttled(self, key: str, model: str, retry_after: Optional[float]) -> None:
+        """Multiplicative decrease + cooldown sesuai Retry-After dari Gemini."""
+        bucket = self._bucket(key, model)
+        now = time.monotonic()
+        bucket.rate = max(self.base_rate * MIN_RATE_FACTOR, bucket.rate * 0.5)
+        bucket.tokens = 0.0
+        bucket.updated = now
+        bucket.cooldown_until = now + (retry_after if retry_after else DEFAULT_COOLDOWN)
+        bucket.throttled += 1
+        logger.warning(
+            "Key ...%s kena limit di %s, istirahat %.0f detik%s.",
+            key[-4:], model, bucket.cooldown_until - now,
+            f" (rate {bucket.rate * 60:.2f}/menit)" if self.base_rate else "",
+        )
+
+    def report_rejected(self, key: str) -> None:
+        """Key ditolak (401/403): parkir di semua model."""
+        self._disabled_until[key] = time.monotonic() + DISABLED_COOLDOWN
+        logger.error("Key ...%s ditolak Gemini, dinonaktifkan sementara.", key[-4:])
+
+    def stats(self) -> List[Dict[str, object]]:
+        now = time.monotonic()
+        return [
+            {
+                "key": f"...{key[-4:]}",
+                "model": model,
+                "rate_per_minute": round(bucket.rate * 60, 2),
+                "tokens": round(bucket.tokens, 2),
+                "cooldown_seconds": round(max(0.0, bucket.cooldown_until - now), 1),
+                "throttled": bucket.throttled,
+            }
+            for (key, model), bucket in self._buckets.items()
+        ]
+
+
+async def parse_retry_after(response: httpx.Response) -> Optional[float]:
+    """Baca Retry-After dari header, atau retryDelay (google.rpc.RetryInfo) di body error."""
+    header = response.headers.get("Retry-After")
+    if header:
+        try:
+            return max(0.0, float(header))
+        except ValueError:
+            pass
+    try:
+        body = await response.aread()
+        data = json.loads(body or b"{}")
+    except Exception:
+        return None
+    if isinstance(data, list) and data:
+        data = data[0]
+    details = data.get("error", {}).get("details", []) if isinstance(data, dict) else []
+    for detail in details:
+        delay = detail.get("retryDelay") if isinstance(detail, dict) else None
+        if delay:
+            match = re.match(r"^([\d.]+)s$", str(delay))
+            if match:
+                return float(match.group(1))
+    return None
+
+
+@lru_cache(maxsize=1)
+def get_key_pool() -> KeyPool:
+    """Mengembalikan KeyPool tunggal dari GEMINI_API_KEYS + GEMINI_API_KEY."""
+    settings = get_settings()
+    return KeyPool(
+        settings.gemini_api_keys,
+        requests_per_minute=settings.key_pool_rpm,
+        burst=settings.key_pool_burst,
+    )
@@ -1,6 +1,8 @@
 # backend/app/services/llm.py
 
 import asyncio
+import contextlib
+import functools
 import json
 import logging
 import re
@@ -8,13 +10,20 @@ import base64
 import time
 from datetime import datetime 
 from io import BytesIO
-from typing import AsyncGenerator, Dict, List, Tuple, Optional, Any
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Dict, List, Optional, Tuple
 
 import httpx
-from PIL import Image
 
 from app.config import get_settings
+from app.deadline import DeadlineExceeded, time_left
+from app.executors import run_in
+from app.metrics import GEMINI_CONNECT_SECONDS, GEMINI_FALLBACKS, GEMINI_REQUESTS
+from app.tracing import mark, record_span, span
 from app.schemas import Message
+from app.services.intent import route_intent
+from app.services.keypool import KeyPoolExhausted, get_key_pool, parse_retry_after
+from app.services.prompt_cache import REJECTED_STATUSES, get_prompt_cache
+from app.services.upstream import get_upstream_client, mark_upstream_used
 
 # --- IMPORT FITUR SEARCH ---
 try:
@@ -34,6 +43,10 @@ _CONNECTED_FLAG = False
 def _mask_key(text: str) -> str:
     return re.sub(r'key=AIza[a-zA-Z0-9_\-]+', 'key=AIza***HIDDEN***', str(text))
 
+def build_image_part(image_base64: str) -> Optional[Dict[str, Any]]:
+    """Decode + validasi gambar Base64 jadi part inlineData (blocking, jalankan di thread)."""
+    return _build_image_part_dict(image_base64)
+
 def _build_image_part_dict(image_base64: str) -> Optional[Dict[str, Any]]:
     if "," in image_base64:
         header, encoded = image_base64.split(",", 1)
@@ -42,6 +55,9 @@ def _build_image_part_dict(image_base64: str) -> Optional[Dict[str, Any]]:
         encoded = image_base64
         mime_type = "image/jpeg"
     try:
+        # PIL hanya dimuat kalau memang ada gambar
+        from PIL import Image
+
         image_bytes = base64.b64decode(encoded)
         Image.open(BytesIO(image_bytes))
         return {"inlineData": {"data": encoded, "mimeType": mime_type}}
@@ -50,7 +66,10 @@ def _build_image_part_dict(image_base64: str) -> Optional[Dict[str, Any]]:
         return None
 
 def prepare_system_prompt(
-    persona_default: str, persona_override: str | None = None, memory_snippet: str | None = None
+    persona_default: str,
+    persona_override: str | None = None,
+    memory_snippet: str | None = None,
+    history_summary: str | None = None,
 ) -> str:
     persona = (persona_override or persona_default).strip()
     parts = [persona]
@@ -59,12 +78,28 @@ def prepare_system_prompt(
             "Catatan konteks dari obrolan sebelumnya: " + memory_snippet.strip() +
             "\nGunakan konteks ini secara natural dalam percakapan, jangan sebutkan sebagai daftar memori."
         )
+    if history_summary:
+        parts.append(
+            "Ringkasan bagian awal percakapan ini (pesan lamanya tidak dikirim ulang):\n" +
+            history_summary.strip()
+        )
     return "\n\n".join(parts)
 
 def _build_payload(
-    messages: List[Message], system_prompt: str, image_base64: Optional[str] = None
+    messages: List[Message],
+    system_prompt: str,
+    image_base64: Optional[str] = None,
+    image_part: Optional[Dict[str, Any]] = None,
+    cached_content: Optional[str] = None,
 ) -> Dict:
-    image_part = _build_image_part_dict(image_base64) if image_base64 else None
+    """
+    Payload generateContent. Dengan `cached_content`, persona sudah ada di cache
+    Gemini dan `system_prompt` hanya berisi bagian dinamis (memori, ringkasan,
+    waktu, hasil search); Gemini tidak menerima system_instruction bersama
+    cachedContent, jadi bagian itu ditaruh di depan giliran user terakhir.
+    """
+    if image_part is None and image_base64:
+        image_part = _build_image_part_dict(image_base64)
     contents: List[Dict[str, object]] = []
     
     last_user_content_index = -1
@@ -80,11 +115,12 @@ def _build_payload(
         
         if i == last_user_content_index and image_part:
             parts.insert(0, image_part)
+        if i == last_user_content_index and cached_content and system_prompt:
+            parts.insert(0, {"text": f"[KONTEKS SISTEM]\n{system_prompt}"})
             
         contents.append({"role": role, "parts": parts})
         
-    return {
-        "system_instruction": {"parts": [{"text": system_prompt}]},
+    payload: Dict[str, Any] = {
         "contents": contents,
         "generationConfig": {
             "temperature": 0.7, # Agak serius dikit biar gak halu
@@ -94,58 +130,115 @@ def _build_payload(
             "responseMimeType": "text/plain",
         },
     }
+    if cached_content:
+        payload["cachedContent"] = cached_content
+    else:
+        payload["system_instruction"] = {"parts": [{"text": system_prompt}]}
+    return payload
+
+
+@contextlib.asynccontextmanager
+async def _open_stream(
+    url: str,
+    params: Dict[str, str],
+    payload: Dict[str, Any],
+    cached_payload: Optional[Dict[str, Any]] = None,
+    on_cache_rejected: Optional[Callable[[int], None]] = None,
+    timeout: Optional[float] = None,
+) -> AsyncIterator[httpx.Response]:
+    """
+    Buka stream Gemini; payload ber-cachedContent dicoba dulu, dan kalau handle-nya
+    ditolak (hilang/kedaluwarsa/key lain) langsung diulang inline di model yang sama.
+    `timeout` (sisa deadline request) menggantikan timeout bawaan klien untuk percobaan ini.
+    """
+    client = get_upstream_client()
+    request_timeout = httpx.Timeout(timeout) if timeout is not None else httpx.USE_CLIENT_DEFAULT
+    if cached_payload is not None:
+        async with client.stream(
+            "POST", url, params=params, json=cached_payload, timeout=request_timeout,
+        ) as response:
+            if response.status_code not in REJECTED_STATUSES:
+                yield response
+                return
+            await response.aread()
+            if on_cache_rejected is not None:
+                on_cache_rejected(response.status_code)
+    async with client.stream("POST", url, params=params, json=payload, timeout=request_timeout) as response:
+        yield response
 
 # ==============================================================================
 #                           CORE FUNCTION (SMART SEARCH)
 # ==============================================================================
 
+# Kata pemicu pencarian web pada pesan terakhir user
+async def fetch_search_context(query: str) -> str:
+    """search_google (DuckDuckGo, blocking) dijalankan di executor `network` supaya event loop tidak tertahan."""
+    return await run_in("network", search_google, query.lower())
+
+def with_search_context(system_prompt: str, search_context: str) -> str:
+    if not search_context:
+        return system_prompt
+    logger.info("🔍 Info internet ditemukan, memaksa Linda baca...")
+    # --- UPDATE: PROMPT LEBIH GALAK ---
+    # Kita taruh hasil search di PALING ATAS instruksi biar dibaca duluan
+    search_instruction = f"""
+            !!! DATA INTERNET TERBARU (REAL-TIME) !!!
+            {search_context}
+            
+            INSTRUKSI PENTING:
+            1. Gunakan data di atas untuk menjawab pertanyaan user.
+            2. Data di atas LEBIH AKURAT daripada ingatanmu sendiri.
+            3. Jika data di atas bilang Presiden adalah Prabowo, MAKA JAWAB PRABOWO (abaikan ingatan lamamu tentang Jokowi).
+            4. Jawab tetap dengan gaya persona yang aktif.
+            """
+    return search_instruction + "\n\n" + system_prompt
+
 async def call_gemini_stream(
     messages: List[Message],
     system_prompt: str,
     *,
     image_base64: Optional[str] = None,
+    image_part: Optional[Dict[str, Any]] = None,
+    search_context: Optional[str] = None,
     delay_seconds: float = 0.0,
     api_key: Optional[str] = None,
+    persona_prompt: Optional[str] = None,
 ) -> AsyncGenerator[str, None]:
+    """
+    Stream jawaban Gemini. `image_part` dan `search_context` boleh sudah disiapkan
+    pemanggil (pipeline paralel); kalau tidak, disiapkan di sini tanpa memblokir loop.
+    `persona_prompt` (awalan statis `system_prompt`) boleh dirujuk dari cache Gemini.
+    """
     
     settings = get_settings()
-    final_api_key = api_key or settings.gemini_api_key
+    # Key dari frontend dipakai apa adanya; tanpa itu, pakai pool key milik server
+    pool = None if api_key else get_key_pool()
     
-    if not final_api_key:
+    if not api_key and not pool:
         raise ValueError("API Key kosong! Masukkan di Frontend atau .env")
 
+    # Persona statis bisa dirujuk dari cache Gemini; sisanya (dinamis) tetap dikirim tiap giliran
+    prompt_cache = get_prompt_cache() if persona_prompt and system_prompt.startswith(persona_prompt) else None
+    dynamic_prompt = system_prompt[len(persona_prompt):].strip() if prompt_cache and persona_prompt else ""
+
     # --- 1. SUNTIK TANGGAL HARI INI ---
     # Biar Linda sadar waktu
     today = datetime.now().strftime("%A, %d %B %Y")
     time_context = f"\n[INFO WAKTU SAAT INI]: {today}. Jika user bertanya tentang 'sekarang' atau 'terbaru', gunakan tanggal ini sebagai acuan."
     system_prompt += time_context
+    dynamic_prompt += time_context
 
     # --- 2. LOGIKA SEARCH (MATA-MATA INTERNET) ---
-    last_user_msg = messages[-1].content.lower() if messages else ""
-    
-    # Trigger words diperbanyak
-    trigger_words = ["siapa", "kapan", "dimana", "berita", "terbaru", "skor", "cuaca", "harga", "cari", "search", "info", "presiden", "pemilu", "juara"]
-    
-    should_search = any(word in last_user_msg for word in trigger_words) and not image_base64
-    
-    if should_search:
-        search_context = search_google(last_user_msg)
-        if search_context:
-            logger.info("🔍 Info internet ditemukan, memaksa Linda baca...")
-            
-            # --- UPDATE: PROMPT LEBIH GALAK ---
-            # Kita taruh hasil search di PALING ATAS instruksi biar dibaca duluan
-            search_instruction = f"""
-            !!! DATA INTERNET TERBARU (REAL-TIME) !!!
-            {search_context}
-            
-            INSTRUKSI PENTING:
-            1. Gunakan data di atas untuk menjawab pertanyaan user.
-            2. Data di atas LEBIH AKURAT daripada ingatanmu sendiri.
-            3. Jika data di atas bilang Presiden adalah Prabowo, MAKA JAWAB PRABOWO (abaikan ingatan lamamu tentang Jokowi).
-            4. Jawab tetap dengan gaya persona yang aktif.
-            """
-            system_prompt = search_instruction + "\n\n" + system_prompt
+    # Biasanya sudah diambil paralel oleh pipeline pra-generasi; None = belum dicari sama sekali
+    if search_context is None:
+        last_user_msg = messages[-1].content if messages else ""
+        search_context = ""
+        has_image = bool(image_base64 or image_part)
+        if not has_image and (await run_in("embedding", route_intent, last_user_msg)).web:
+            with span("web_search"):
+                search_context = await fetch_search_context(last_user_msg)
+    system_prompt = with_search_context(system_prompt, search_context)
+    dynamic_prompt = with_search_context(dynamic_prompt, search_context)
 
     # --- 3. DAFTAR MODEL ---
     candidate_models = [
@@ -156,40 +249,93 @@ async def call_gemini_stream(
         ("gemini-1.5-pro", "v1beta"),       
     ]
     
-    payload = _build_payload(messages, system_prompt, image_base64)
+    if image_part is None and image_base64:
+        image_part = await run_in("embedding", _build_image_part_dict, image_base64)
+    with span("build_payload", image=image_part is not None):
+        payload = _build_payload(messages, system_prompt, image_part=image_part)
     last_error = "Belum mencoba"
 
     for model_name, api_version in candidate_models:
-        base_url = f"https://generativelanguage.googleapis.com/{api_version}/models"
+        base_url = f"{settings.gemini_api_root}/{api_version}/models"
         url = f"{base_url}/{model_name}:streamGenerateContent"
-        params = {"key": final_api_key, "alt": "sse"}
-        
-        logger.info(f"Menghubungi: {model_name} ({api_version})...")
 
-        try:
-            async with httpx.AsyncClient(timeout=settings.request_timeout) as client:
-                async with client.stream("POST", url, params=params, json=payload) as response:
-                    
+        # Dengan pool, model yang sama dicoba pakai key lain dulu sebelum pindah model
+        for _attempt in range(len(pool) if pool else 1):
+            # Sisa deadline request; kalau sudah habis, DeadlineExceeded langsung ke pemanggil
+            # (tidak ditelan fallback di bawah) daripada mencoba model berikutnya yang pasti telat
+            attempt_timeout = time_left(settings.request_timeout, stage="upstream")
+            if pool is not None:
+                try:
+                    final_api_key = await pool.acquire(
+                        model_name, max_wait=min(settings.key_pool_max_wait, attempt_timeout),
+                    )
+                except KeyPoolExhausted as exc:
+                    logger.warning(f"Semua key habis untuk {model_name} ({exc.wait:.0f} detik lagi). Skip.")
+                    last_error = "Server Error (429)"
+                    GEMINI_FALLBACKS.inc(model=model_name, reason="keys_exhausted")
+                    break
+            else:
+                final_api_key = api_key
+            params = {"key": final_api_key, "alt": "sse"}
+            
+            logger.info(f"Menghubungi: {model_name} ({api_version})...")
+
+            cached_payload = None
+            on_cache_rejected = None
+            if prompt_cache is not None and persona_prompt:
+                handle = prompt_cache.lookup(api_version, model_name, final_api_key, persona_prompt)
+                if handle:
+                    cached_payload = _build_payload(
+                        messages, dynamic_prompt, image_part=image_part, cached_content=handle,
+                    )
+                    on_cache_rejected = functools.partial(
+                        prompt_cache.reject, api_version, model_name, final_api_key, persona_prompt,
+                    )
+
+            try:
+                connect_started = time.perf_counter()
+                async with _open_stream(
+                    url, params, payload, cached_payload, on_cache_rejected,
+                    timeout=time_left(settings.request_timeout, stage="upstream"),
+                ) as response:
+                        
                     status = response.status_code
-                    
+                    GEMINI_CONNECT_SECONDS.observe(time.perf_counter() - connect_started, model=model_name)
+                    record_span("upstream_connect", connect_started, model=model_name, status=status)
+                    GEMINI_REQUESTS.inc(model=model_name, status=str(status))
+                        
                     if status == 404:
                         logger.warning(f"Model {model_name} 404. Skip.")
-                        continue 
-                    
+                        GEMINI_FALLBACKS.inc(model=model_name, reason="not_found")
+                        break 
+                        
+                    if status == 429 and pool is not None:
+                        # Catat limit key ini lalu langsung coba key lain
+                        retry_after = await parse_retry_after(response)
+                        pool.report_throttled(final_api_key, model_name, retry_after)
+                        last_error = "Server Error (429)"
+                        continue
+
                     if status == 429 or status >= 500:
                         logger.warning(f"Model {model_name} {status}. Istirahat 1 detik...")
-                        await asyncio.sleep(1)
+                        await asyncio.sleep(time_left(1.0, stage="upstream"))
                         last_error = f"Server Error ({status})"
+                        GEMINI_FALLBACKS.inc(model=model_name, reason="throttled" if status == 429 else "server_error")
+                        break
+
+                    if status in (401, 403) and pool is not None:
+                        pool.report_rejected(final_api_key)
+                        last_error = f"HTTP Error {status}"
                         continue
 
                     if status == 401:
                         raise httpx.HTTPStatusError("API Key Salah/Expired.", request=response.request, response=response)
 
                     response.raise_for_status()
-                    
+                        
                     aggregated_raw = ""
                     first_chunk = True
-                    
+                        
                     async for payload_json in _read_sse_payloads(response): 
                         if payload_json == "[DONE]": break
                         chunks = _extract_text(payload_json)
@@ -199,26 +345,39 @@ async def call_gemini_stream(
                             if not delta_raw: continue
                             cleaned = _sanitize_delta(delta_raw)
                             if not cleaned: continue
-                            
+                                
                             if first_chunk and delay_seconds > 0:
                                 await asyncio.sleep(delay_seconds)
                                 delay_seconds = 0.0
                             if first_chunk:
                                 cleaned = cleaned.lstrip()
                                 first_chunk = False
+                                mark("upstream_first_token", model=model_name)
                             if cleaned:
                                 yield cleaned
-                                
+                                    
+                    mark_upstream_used()
+                    if pool is not None:
+                        pool.report_success(final_api_key, model_name)
                     _log_connected(f"{model_name} ({api_version})")
                     return 
 
-        except httpx.HTTPStatusError as exc:
-            last_error = f"HTTP Error {exc.response.status_code}"
-            safe_url = _mask_key(str(exc.request.url))
-            logger.warning(f"Request failed: {safe_url} -> {exc.response.status_code}")
-        except Exception as exc:
-            last_error = str(exc)
-            logger.warning(f"Error koneksi ke {model_name}: {exc}")
+            except DeadlineExceeded:
+                raise
+            except httpx.HTTPStatusError as exc:
+                last_error = f"HTTP Error {exc.response.status_code}"
+                safe_url = _mask_key(str(exc.request.url))
+                logger.warning(f"Request failed: {safe_url} -> {exc.response.status_code}")
+                GEMINI_FALLBACKS.inc(model=model_name, reason="http_error")
+                break
+            except Exception as exc:
+                last_error = str(exc)
+                logger.warning(f"Error koneksi ke {model_name}: {exc}")
+                GEMINI_FALLBACKS.inc(model=model_name, reason="connection")
+                break
+        else:
+            # Semua key pool sudah dicoba untuk model ini (429/401/403 semua)
+            GEMINI_FALLBACKS.inc(model=model_name, reason="keys_rejected")
 
     error_msg = str(last_error)
     if "429" in error_msg:
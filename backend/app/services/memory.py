@@ -4,33 +4,77 @@ Service layer untuk mengelola memori jangka panjang chatbot (dengan Lazy Loading
 File ini menangani penyimpanan ke SQLite dan Indexing Vektor menggunakan FAISS.
 """
 
+import contextlib
+import hashlib
+import json
 import logging
+import os
 import sqlite3
 import textwrap
 import threading  # <--- TAMBAHAN PENTING: Untuk Thread Safety
+import time
 from pathlib import Path
-from typing import Any, Dict, List, Optional
-
-# --- Impor Pustaka Pihak Ketiga ---
-import faiss
-import numpy as np
-from sentence_transformers import SentenceTransformer
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
 
 # --- Impor Lokal ---
 from ..config import get_settings
+from ..executors import torch_threads
+from ..lazy import lazy_import
+from ..metrics import MEMORY_ENCODE_SECONDS, MEMORY_LOCK_WAIT_SECONDS, MEMORY_SEARCH_SECONDS, REGISTRY
+
+# --- Impor Pustaka Pihak Ketiga (malas) ---
+# faiss/numpy/sentence_transformers (+ torch) baru dimuat saat memori pertama kali dipakai
+faiss = lazy_import("faiss")
+np = lazy_import("numpy")
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
 
 # --- Konfigurasi Logging ---
 logger = logging.getLogger(__name__)
 
 # --- Variabel Global ---
-MODEL_NAME = "all-MiniLM-L6-v2"
-embedding_model: Optional[SentenceTransformer] = None
-index: Optional[faiss.Index] = None
+# Satu-satunya model sebelum indeks punya metadata; indeks lama tanpa metadata dianggap buatan model ini
+LEGACY_MODEL_NAME = "all-MiniLM-L6-v2"
+INDEX_FILE = "memory_index.faiss"
+# Metadata indeks aktif (model, dimensi, nama file); ditulis terakhir, jadi inilah titik commit-nya
+META_FILE = "memory_index.json"
+
+embedding_model: Optional["SentenceTransformer"] = None
+# Nama model yang sedang melayani indeks; None = model disuntik dari luar (benchmark)
+embedding_model_name: Optional[str] = None
+index: Optional["faiss.Index"] = None
+index_meta: Optional[Dict[str, Any]] = None
 is_initialized = False
 
 # --- GLOBAL LOCK ---
 # Mencegah error jika ada dua request menulis ke DB/FAISS bersamaan
 memory_lock = threading.Lock()
+# Lock terpisah untuk model, supaya fitur lain (mis. emosi) bisa memuat model tanpa indeks
+_model_lock = threading.Lock()
+# Menjaga pasangan (model, indeks) tetap konsisten bagi search saat migrasi berpindah ke indeks baru
+_swap_lock = threading.Lock()
+
+# Kegagalan muat model per nama: (jumlah gagal beruntun, boleh dicoba lagi setelah monotonic ini)
+_load_failures: Dict[str, Tuple[int, float]] = {}
+# Batas atas jeda antar percobaan muat ulang (detik)
+LOAD_BACKOFF_MAX = 600.0
+
+
+class EmbeddingModelUnavailable(RuntimeError):
+    """Model embedding baru saja gagal dimuat; belum dicoba lagi sampai masa jeda lewat."""
+
+# importlib.reload memakai namespace modul yang sama, jadi callback lama tetap valid
+if "linda_memory_index_vectors" not in REGISTRY:
+    REGISTRY.gauge(
+        "linda_memory_index_vectors", "Jumlah vektor di indeks FAISS (ntotal).",
+        function=lambda: index.ntotal if index is not None else 0,
+    )
+if "linda_memory_migration_pending" not in REGISTRY:
+    REGISTRY.gauge(
+        "linda_memory_migration_pending", "Memori yang belum di-encode ulang oleh migrasi model embedding.",
+        function=lambda: _migration.pending() if _migration is not None else 0,
+    )
 
 # ==============================================================================
 #                           FUNGSI BANTU PATH & TEKS
@@ -43,9 +87,77 @@ def _get_db_path() -> Path:
     return path
 
 def _get_index_path() -> Path:
-    """Mendapatkan path ke file indeks FAISS."""
+    """Mendapatkan path ke file indeks FAISS yang sedang aktif."""
     db_path = _get_db_path()
-    return db_path.parent / "memory_index.faiss"
+    return db_path.parent / (index_meta["file"] if index_meta else INDEX_FILE)
+
+def _get_meta_path() -> Path:
+    return _get_db_path().parent / META_FILE
+
+def _index_file_for(model_name: str) -> str:
+    """Nama file indeks per model, supaya indeks baru tidak menimpa yang sedang dipakai."""
+    if model_name == LEGACY_MODEL_NAME:
+        return INDEX_FILE
+    return f"memory_index-{hashlib.sha1(model_name.encode('utf-8')).hexdigest()[:10]}.faiss"
+
+def _read_meta() -> Optional[Dict[str, Any]]:
+    path = _get_meta_path()
+    if path.exists():
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            logger.error("Metadata indeks rusak, diabaikan: %s", e)
+            return None
+    if (path.parent / INDEX_FILE).exists():
+        # Indeks dari versi sebelum metadata ada
+        return {"model": LEGACY_MODEL_NAME, "dimension": None, "file": INDEX_FILE}
+    return None
+
+def _write_index(target_index: "faiss.Index", meta: Dict[str, Any]) -> None:
+    """Tulis file indeks lalu metadatanya, masing-masing lewat rename atomik."""
+    directory = _get_db_path().parent
+    index_path = directory / meta["file"]
+    tmp_index = index_path.with_name(index_path.name + ".tmp")
+    faiss.write_index(target_index, str(tmp_index))
+    os.replace(tmp_index, index_path)
+    meta_path = _get_meta_path()
+    tmp_meta = meta_path.with_name(meta_path.name + ".tmp")
+    tmp_meta.write_text(json.dumps(meta), encoding="utf-8")
+    os.replace(tmp_meta, meta_path)
+
+def _make_meta(model_name: str, dimension: int) -> Dict[str, Any]:
+    return {
+        "model": model_name,
+        "dimension": dimension,
+        "file": _index_file_for(model_name),
+        "index_factory": get_settings().memory_index_factory,
+    }
+
+def _set_serving(model: "SentenceTransformer", model_name: Optional[str], new_index: "faiss.Index", meta: Dict[str, Any]) -> None:
+    global embedding_model, embedding_model_name, index, index_meta
+    with _swap_lock:
+        embedding_model, embedding_model_name = model, model_name
+        index, index_meta = new_index, meta
+
+def _serving() -> Tuple[Optional["SentenceTransformer"], Optional["faiss.Index"]]:
+    with _swap_lock:
+        return embedding_model, index
+
+@contextlib.contextmanager
+def _memory_locked(op: str) -> Iterator[None]:
+    """memory_lock + catat berapa lama menunggu lock tersebut."""
+    started = time.perf_counter()
+    with memory_lock:
+        MEMORY_LOCK_WAIT_SECONDS.observe(time.perf_counter() - started, op=op)
+        yield
+
+def _new_index(dimension: int) -> "faiss.Index":
+    """
+    Indeks kosong sesuai MEMORY_INDEX_FACTORY, selalu dibungkus IDMap supaya
+    ID vektor = ID baris SQLite. Default "Flat" = IndexIDMap(IndexFlatL2).
+    """
+    spec = get_settings().memory_index_factory
+    return faiss.index_factory(dimension, f"IDMap,{spec}")
 
 def _compact_text(raw_text: str) -> str:
     """Membersihkan spasi dan memotong teks agar tidak terlalu panjang."""
@@ -83,88 +195,365 @@ def init_memory_system():
         logger.error("Gagal menginisialisasi database memori: %s", e)
         raise
 
+def _check_load_backoff(model_name: str) -> None:
+    """Gagal cepat selama masa jeda, daripada mengulang unduhan yang makan waktu lama."""
+    failure = _load_failures.get(model_name)
+    if failure is not None:
+        wait = failure[1] - time.monotonic()
+        if wait > 0:
+            raise EmbeddingModelUnavailable(
+                f"Model '{model_name}' gagal dimuat; dicoba lagi {wait:.0f} detik lagi."
+            )
+
+
+def _record_load_failure(model_name: str) -> None:
+    failures = _load_failures.get(model_name, (0, 0.0))[0] + 1
+    backoff = min(get_settings().embedding_load_backoff * 2 ** (failures - 1), LOAD_BACKOFF_MAX)
+    _load_failures[model_name] = (failures, time.monotonic() + backoff)
+    logger.warning("Model '%s' dicoba dimuat lagi paling cepat %.0f detik lagi.", model_name, backoff)
+
+
+def _construct_model(model_name: str) -> "SentenceTransformer":
+    """Impor sentence_transformers (berat) dan muat modelnya; tanpa backoff maupun logging."""
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model_name)
+
+
+def _load_model(model_name: str) -> "SentenceTransformer":
+    _check_load_backoff(model_name)
+    logger.info("Memuat model embedding '%s'...", model_name)
+    try:
+        model = _construct_model(model_name)
+    except Exception as e:
+        logger.error("Gagal total memuat model SentenceTransformer: %s", e)
+        _record_load_failure(model_name)
+        raise RuntimeError(f"Tidak bisa memuat model '{model_name}'. Cek koneksi internet.") from e
+    _load_failures.pop(model_name, None)
+    _limit_torch_threads()
+    logger.info("Model embedding '%s' berhasil dimuat.", model_name)
+    return model
+
+
+def get_embedding_model() -> "SentenceTransformer":
+    """
+    Memuat model embedding sekali saja (lazy) lalu mengembalikannya.
+    Dipakai bersama oleh memori dan fitur lain supaya model tidak dimuat dua kali.
+    Selama migrasi, ini model lama yang masih melayani indeks.
+    Setelah gagal dimuat, EmbeddingModelUnavailable langsung (tanpa antre lock)
+    sampai masa jeda lewat.
+    """
+    global embedding_model, embedding_model_name
+    if embedding_model is not None:
+        return embedding_model
+
+    _check_load_backoff(get_settings().embedding_model)
+    with _model_lock:
+        if embedding_model is None:
+            model_name = get_settings().embedding_model
+            embedding_model = _load_model(model_name)
+            embedding_model_name = model_name
+    return embedding_model
+
+
+def _target_model() -> "SentenceTransformer":
+    """Model sesuai EMBEDDING_MODEL; menggantikan model bersama kalau yang termuat model lain."""
+    target = get_settings().embedding_model
+    model = get_embedding_model()
+    if embedding_model_name in (None, target):
+        return model
+    model = _load_model(target)
+    _set_serving(model, target, index, index_meta)
+    return model
+
+
+def _limit_torch_threads() -> None:
+    """Batasi thread intra-op torch sesuai jumlah worker executor embedding (tanpa oversubscribe)."""
+    import torch
+
+    threads = torch_threads()
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Hanya bisa diatur sebelum torch menjalankan kerja paralel pertama
+        pass
+    logger.info("Torch memakai %d thread intra-op per encode.", threads)
+
+
 def _lazy_init_model_and_index():
     """
     Fungsi internal untuk memuat model dan indeks FAISS saat pertama kali diperlukan.
     Dilindungi oleh Lock agar tidak dimuat dua kali secara bersamaan.
     """
-    global embedding_model, index, is_initialized
+    global is_initialized
     
     # Cek cepat tanpa lock
     if is_initialized:
         return
 
-    with memory_lock:
+    with _memory_locked("init"):
         # Cek lagi di dalam lock (double-check locking pattern)
         if is_initialized:
             return
 
         logger.info("LAZY INIT: Memulai inisialisasi sistem memori (Model + Indeks)...")
+        target = get_settings().embedding_model
 
-        # 1. Muat Model Embedding
-        try:
-            logger.info("Memuat model embedding '%s'...", MODEL_NAME)
-            embedding_model = SentenceTransformer(MODEL_NAME)
-            logger.info("Model embedding berhasil dimuat.")
-        except Exception as e:
-            logger.error("Gagal total memuat model SentenceTransformer: %s", e)
-            raise RuntimeError(f"Tidak bisa memuat model '{MODEL_NAME}'. Cek koneksi internet.") from e
-
-        # 2. Muat atau Bangun Ulang Indeks FAISS
-        index_path = _get_index_path()
-        if index_path.exists():
+        # 1. Baca metadata + indeks FAISS yang tersimpan (kalau ada)
+        meta = _read_meta()
+        stored = None
+        if meta is not None:
+            index_path = _get_db_path().parent / meta["file"]
             try:
-                logger.info("Memuat indeks FAISS dari %s...", index_path)
-                index = faiss.read_index(str(index_path))
-                logger.info("Indeks FAISS berhasil dimuat. Terdapat %d vektor.", index.ntotal)
+                logger.info("Memuat indeks FAISS dari %s (model '%s')...", index_path, meta["model"])
+                stored = faiss.read_index(str(index_path))
+                logger.info("Indeks FAISS berhasil dimuat. Terdapat %d vektor.", stored.ntotal)
             except Exception as e:
                 logger.error("Gagal memuat file indeks FAISS, mencoba bangun ulang: %s", e)
-                _rebuild_index_from_db_unsafe() # Versi unsafe karena sudah di dalam lock
         else:
             logger.warning("File indeks FAISS tidak ditemukan. Membangun ulang dari database...")
+
+        # 2. Pilih model yang melayani indeks itu: model sekarang, atau model lama + migrasi
+        if stored is None:
+            _target_model()
             _rebuild_index_from_db_unsafe()
-        
+        elif meta["model"] == target:
+            _serve_stored_unsafe(_target_model(), target, stored, meta)
+        else:
+            _serve_previous_model_unsafe(target, stored, meta)
+
         is_initialized = True
         logger.info("LAZY INIT: Inisialisasi sistem memori selesai.")
 
 
+def _serve_stored_unsafe(model: "SentenceTransformer", model_name: str, stored: "faiss.Index", meta: Dict[str, Any]) -> None:
+    """Pakai indeks tersimpan kalau dimensinya cocok dengan model; kalau tidak, bangun ulang."""
+    dimension = model.get_sentence_embedding_dimension()
+    if stored.d != dimension or meta.get("dimension") not in (None, dimension):
+        logger.warning(
+            "Dimensi indeks (%d) tidak cocok dengan model '%s' (%d). Membangun ulang...",
+            stored.d, model_name, dimension,
+        )
+        _target_model()
+        _rebuild_index_from_db_unsafe()
+        return
+    if meta.get("dimension") is None:
+        # Indeks lama: lengkapi metadatanya supaya pergantian model berikutnya terdeteksi
+        meta = _make_meta(model_name, dimension)
+        _write_index(stored, meta)
+    _set_serving(model, model_name, stored, meta)
+
+
+def _serve_previous_model_unsafe(target: str, stored: "faiss.Index", meta: Dict[str, Any]) -> None:
+    """Model berganti: indeks lama tetap melayani search (dengan model lamanya) selama migrasi."""
+    try:
+        previous = embedding_model if embedding_model_name == meta["model"] else _load_model(meta["model"])
+    except RuntimeError as e:
+        logger.error("Model lama '%s' tidak bisa dimuat, bangun ulang langsung dengan '%s': %s", meta["model"], target, e)
+        _target_model()
+        _rebuild_index_from_db_unsafe()
+        return
+    _serve_stored_unsafe(previous, meta["model"], stored, meta)
+    if embedding_model_name == meta["model"]:
+        _start_migration_unsafe(meta["model"], target)
+
+
+def preload_memory_system() -> None:
+    """Muat model + indeks sekarang (dipanggil di background bila MEMORY_PRELOAD aktif)."""
+    try:
+        _lazy_init_model_and_index()
+    except Exception as e:
+        logger.error("Preload sistem memori gagal, akan dicoba lagi saat dipakai: %s", e)
+
+
+def _embed_rows(
+    model: "SentenceTransformer",
+    target_index: "faiss.Index",
+    after_id: int = 0,
+    on_batch: Optional[Callable[[int], None]] = None,
+) -> int:
+    """
+    Encode semua memori dengan id > after_id per MEMORY_MIGRATION_BATCH lalu masukkan
+    ke target_index. Mengembalikan id terakhir yang ikut ter-encode.
+    """
+    batch_size = max(1, get_settings().memory_migration_batch)
+    db_path = _get_db_path()
+    all_ids: List[int] = []
+    chunks = []
+    last_id = after_id
+    while True:
+        with sqlite3.connect(db_path) as conn:
+            rows = conn.execute(
+                "SELECT id, text FROM memories WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)
+            ).fetchall()
+        if not rows:
+            break
+        ids, texts = zip(*rows)
+        with MEMORY_ENCODE_SECONDS.time(op="rebuild"):
+            chunks.append(np.asarray(model.encode(list(texts), convert_to_tensor=False, show_progress_bar=False)))
+        all_ids.extend(ids)
+        last_id = ids[-1]
+        if on_batch is not None:
+            on_batch(len(rows))
+
+    if all_ids:
+        embeddings = np.vstack(chunks).astype(np.float32)
+        if not target_index.is_trained:
+            # Indeks berbasis IVF/PQ perlu dilatih dulu pada data yang ada
+            target_index.train(embeddings)
+        target_index.add_with_ids(embeddings, np.array(all_ids, dtype=np.int64))
+    return last_id
+
+
 def _rebuild_index_from_db_unsafe():
     """
     Membangun ulang indeks FAISS dari awal berdasarkan data di SQLite.
     Hanya dipanggil di dalam fungsi yang sudah memegang Lock.
     """
-    global index, embedding_model
     if embedding_model is None:
         raise RuntimeError("Model embedding belum diinisialisasi.")
 
-    db_path = _get_db_path()
-    with sqlite3.connect(db_path) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, text FROM memories ORDER BY id")
-        rows = cursor.fetchall()
-
-    dimension = embedding_model.get_sentence_embedding_dimension()
-    index = faiss.IndexIDMap(faiss.IndexFlatL2(dimension))
+    model = embedding_model
+    model_name = embedding_model_name or get_settings().embedding_model
+    dimension = model.get_sentence_embedding_dimension()
+    meta = _make_meta(model_name, dimension)
+    new_index = _new_index(dimension)
 
-    if not rows:
-        logger.info("Database memori kosong, indeks FAISS baru dibuat.")
-        return
-
-    logger.info("Membangun ulang indeks untuk %d memori...", len(rows))
-    ids, texts = zip(*rows)
-    
+    logger.info("Membangun ulang indeks dengan model '%s'...", model_name)
     try:
-        embeddings = embedding_model.encode(list(texts), convert_to_tensor=False, show_progress_bar=False)
-        ids_array = np.array(ids, dtype=np.int64)
-        index.add_with_ids(embeddings, ids_array)
-        
-        logger.info("Rebuild selesai. Menyimpan ke disk...")
-        faiss.write_index(index, str(_get_index_path()))
+        _embed_rows(model, new_index)
+        logger.info("Rebuild selesai (%d vektor). Menyimpan ke disk...", new_index.ntotal)
+        _write_index(new_index, meta)
         logger.info("Indeks baru berhasil disimpan.")
     except Exception as e:
         logger.error("Gagal encoding/saving indeks: %s", e)
         # Fallback ke index kosong biar app gak crash
-        index = faiss.IndexIDMap(faiss.IndexFlatL2(dimension))
+        new_index = faiss.IndexIDMap(faiss.IndexFlatL2(dimension))
+    _set_serving(model, embedding_model_name, new_index, meta)
+
+
+# ==============================================================================
+#                   MIGRASI MODEL EMBEDDING (BACKGROUND)
+# ==============================================================================
+
+class _MigrationCancelled(Exception):
+    pass
+
+
+class _Migration:
+    """Encode ulang seluruh memori ke indeks baru tanpa menghentikan search di indeks lama."""
+
+    def __init__(self, source: str, target: str) -> None:
+        self.source = source
+        self.target = target
+        self.state = "running"
+        self.total = 0
+        self.done = 0
+        self.error: Optional[str] = None
+        # Memori yang ditulis ke indeks lama selama migrasi; di-encode ulang sebelum pindah
+        self.dirty: Set[int] = set()
+        self.cancelled = threading.Event()
+        self.started_at = time.time()
+
+    def pending(self) -> int:
+        return max(0, self.total - self.done) if self.state == "running" else 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "source": self.source,
+            "target": self.target,
+            "state": self.state,
+            "total": self.total,
+            "done": self.done,
+            "error": self.error,
+        }
+
+
+_migration: Optional[_Migration] = None
+
+
+def _start_migration_unsafe(source: str, target: str) -> None:
+    """Mulai migrasi di thread sendiri (bukan executor embedding, supaya search tidak kehabisan worker)."""
+    global _migration
+    if _migration is not None and _migration.state == "running":
+        return
+    _migration = _Migration(source, target)
+    logger.warning("Model embedding berganti '%s' -> '%s'. Migrasi indeks berjalan di background.", source, target)
+    threading.Thread(
+        target=_run_migration, args=(_migration,), name="linda-memory-migration", daemon=True
+    ).start()
+
+
+def _run_migration(migration: _Migration) -> None:
+    try:
+        model = _load_model(migration.target)
+        dimension = model.get_sentence_embedding_dimension()
+        new_index = _new_index(dimension)
+        with sqlite3.connect(_get_db_path()) as conn:
+            migration.total = conn.execute("SELECT COUNT(*) FROM memories").fetchone()[0]
+
+        def on_batch(count: int) -> None:
+            if migration.cancelled.is_set():
+                raise _MigrationCancelled()
+            migration.done += count
+
+        last_id = _embed_rows(model, new_index, on_batch=on_batch)
+        with _memory_locked("migrate"):
+            if migration.cancelled.is_set():
+                raise _MigrationCancelled()
+            # Susulan: memori baru/diubah selama encode di atas
+            _catch_up_unsafe(model, new_index, last_id, migration.dirty)
+            previous_path = _get_index_path()
+            meta = _make_meta(migration.target, dimension)
+            _write_index(new_index, meta)
+            _set_serving(model, migration.target, new_index, meta)
+            if previous_path != _get_index_path():
+                previous_path.unlink(missing_ok=True)
+        migration.state = "done"
+        logger.info(
+            "Migrasi indeks ke '%s' selesai: %d vektor, %.1f detik.",
+            migration.target, new_index.ntotal, time.time() - migration.started_at,
+        )
+    except _MigrationCancelled:
+        migration.state = "cancelled"
+        logger.info("Migrasi indeks ke '%s' dibatalkan.", migration.target)
+    except Exception as e:
+        # Indeks lama tetap melayani; migrasi dicoba lagi saat proses dimulai ulang
+        migration.state = "failed"
+        migration.error = str(e)
+        logger.error("Migrasi indeks ke '%s' gagal: %s", migration.target, e)
+
+
+def _catch_up_unsafe(model: "SentenceTransformer", target_index: "faiss.Index", last_id: int, dirty: Set[int]) -> None:
+    ids = sorted(i for i in dirty if i <= last_id)
+    with sqlite3.connect(_get_db_path()) as conn:
+        rows = conn.execute("SELECT id, text FROM memories WHERE id > ? ORDER BY id", (last_id,)).fetchall()
+        if ids:
+            placeholders = ",".join("?" for _ in ids)
+            rows += conn.execute(f"SELECT id, text FROM memories WHERE id IN ({placeholders})", ids).fetchall()
+    if not rows or not target_index.is_trained:
+        return
+    row_ids, texts = zip(*rows)
+    vector_ids = np.array(row_ids, dtype=np.int64)
+    embeddings = np.asarray(model.encode(list(texts), convert_to_tensor=False, show_progress_bar=False))
+    try:
+        target_index.remove_ids(vector_ids)
+    except RuntimeError:
+        pass  # Sama seperti upsert: tidak semua jenis indeks mendukung remove_ids
+    target_index.add_with_ids(embeddings.astype(np.float32), vector_ids)
+    logger.info("Migrasi: %d memori susulan di-encode ulang.", len(rows))
+
+
+def memory_stats() -> Dict[str, Any]:
+    """Model & indeks yang sedang melayani, plus status migrasi (kalau ada)."""
+    _, current = _serving()
+    return {
+        "model": embedding_model_name,
+        "dimension": current.d if current is not None else None,
+        "vectors": current.ntotal if current is not None else 0,
+        "migration": _migration.stats() if _migration is not None else None,
+    }
 
 
 # ==============================================================================
@@ -186,7 +575,7 @@ def upsert_memory(memory_type: str, text: str) -> Dict[str, Any]:
     compacted = _compact_text(text)
     db_path = _get_db_path()
     
-    with memory_lock: # <--- LOCK DIMULAI
+    with _memory_locked("upsert"): # <--- LOCK DIMULAI
         try:
             # 1. Operasi Database
             with sqlite3.connect(db_path) as conn:
@@ -211,7 +600,8 @@ def upsert_memory(memory_type: str, text: str) -> Dict[str, Any]:
             # Namun, karena SQLite ID auto-increment dan unik, kita bisa langsung add.
             
             # Encode teks ke vektor
-            embedding = embedding_model.encode([stored_text], convert_to_tensor=False)
+            with MEMORY_ENCODE_SECONDS.time(op="upsert"):
+                embedding = embedding_model.encode([stored_text], convert_to_tensor=False)
             vector_id = np.array([memory_id], dtype=np.int64)
             
             # Tambahkan ke RAM Index
@@ -223,15 +613,22 @@ def upsert_memory(memory_type: str, text: str) -> Dict[str, Any]:
             except:
                 pass # Tidak masalah jika ID belum ada
             
+            if not index.is_trained:
+                # Indeks IVF/PQ yang belum dilatih: vektor baru masuk saat rebuild berikutnya
+                logger.warning("Indeks belum dilatih, memori ID %s hanya disimpan di database.", memory_id)
+                return {"id": memory_id, "type": memory_type, "text": stored_text, "created_at": created_at}
             index.add_with_ids(embedding, vector_id)
+            if _migration is not None and _migration.state == "running":
+                # Indeks baru belum punya versi terbaru memori ini
+                _migration.dirty.add(memory_id)
             
             logger.info(f"Memori ID {memory_id} ditambahkan ke RAM Index. Total: {index.ntotal}")
 
             # 3. AUTO-SAVE KE DISK (Hanya setiap 10 item baru)
             # Ini mencegah IO Disk Usage yang tinggi.
-            if index.ntotal % 10 == 0:
+            if index.ntotal % 10 == 0 and index_meta is not None:
                 logger.info("Auto-save: Menyimpan indeks ke disk...")
-                faiss.write_index(index, str(_get_index_path()))
+                _write_index(index, index_meta)
 
             return {
                 "id": memory_id, 
@@ -247,27 +644,34 @@ def upsert_memory(memory_type: str, text: str) -> Dict[str, Any]:
 
 def search_memory(query: str, top_k: int = 5) -> List[Dict[str, Any]]:
     """Mencari memori yang relevan secara semantik."""
+    with MEMORY_SEARCH_SECONDS.time():
+        return _search_memory(query, top_k)
+
+
+def _search_memory(query: str, top_k: int) -> List[Dict[str, Any]]:
     _lazy_init_model_and_index() 
 
     # Search biasanya aman dilakukan konkruen (read-only di FAISS), 
     # tapi embedding model kadang butuh lock kalau GPU/Shared resource.
-    # Untuk CPU biasanya aman tanpa lock, tapi kita pakai lock sebentar untuk akses index.
+    # Model & indeks diambil berpasangan: migrasi bisa berpindah ke indeks baru kapan saja.
+    model, current_index = _serving()
     
-    if embedding_model is None or index is None:
+    if model is None or current_index is None:
         logger.warning("Sistem belum siap.")
         return []
     
-    if index.ntotal == 0:
+    if current_index.ntotal == 0:
         return []
 
     try:
         # Encode query
-        query_embedding = embedding_model.encode([query.strip()], convert_to_tensor=False)
+        with MEMORY_ENCODE_SECONDS.time(op="search"):
+            query_embedding = model.encode([query.strip()], convert_to_tensor=False)
         
-        k = min(top_k, index.ntotal)
+        k = min(top_k, current_index.ntotal)
         
         # Search di Index
-        distances, ids = index.search(query_embedding, k)
+        distances, ids = current_index.search(query_embedding, k)
         
         found_ids = [int(i) for i in ids[0] if i != -1]
         if not found_ids:
@@ -296,9 +700,11 @@ def search_memory(query: str, top_k: int = 5) -> List[Dict[str, Any]]:
 
 def clear_memory_system() -> bool:
     """Reset total: Hapus DB dan File Index."""
-    global index, is_initialized
+    global index, index_meta, is_initialized
     
-    with memory_lock: # <--- LOCK PENTING SAAT DESTRUCTIVE ACTION
+    if _migration is not None:
+        _migration.cancelled.set()
+    with _memory_locked("clear"): # <--- LOCK PENTING SAAT DESTRUCTIVE ACTION
         db_path = _get_db_path()
         if db_path.exists():
             with sqlite3.connect(db_path) as conn:
@@ -307,16 +713,18 @@ def clear_memory_system() -> bool:
                 conn.execute("VACUUM") 
             logger.info("Tabel memories dibersihkan.")
 
-        index_path = _get_index_path()
-        if index_path.exists():
-            try:
-                index_path.unlink()
-                logger.info("File indeks FAISS dihapus.")
-            except Exception as e:
-                logger.error("Gagal menghapus file index: %s", e)
+        for path in (_get_index_path(), _get_meta_path()):
+            if path.exists():
+                try:
+                    path.unlink()
+                    logger.info("File %s dihapus.", path.name)
+                except Exception as e:
+                    logger.error("Gagal menghapus file index: %s", e)
             
         # Reset state
-        index = None
+        with _swap_lock:
+            index = None
+            index_meta = None
         is_initialized = False
         logger.info("Sistem memori di-reset total.")
 
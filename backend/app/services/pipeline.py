@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Graf tahap pra-generasi untuk /chat.
+Tahap yang saling lepas (ambil memori, pencarian web, olah gambar, warm-up
+koneksi upstream) dijalankan bersamaan di bawah satu deadline, jadi waktu
+sampai token pertama mengikuti tahap TERLAMA, bukan jumlah semuanya. Tahap
+opsional yang melewati budget atau gagal dilewati dan diganti nilai default.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from ..metrics import PREGEN_STAGE_SKIPPED
+from ..tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+class _Stage:
+    __slots__ = ("name", "task", "optional", "default", "status")
+
+    def __init__(self, name: str, task: "asyncio.Task[Any]", optional: bool, default: Any) -> None:
+        self.name = name
+        self.task = task
+        self.optional = optional
+        self.default = default
+        self.status = "running"
+
+
+class StageGraph:
+    """
+    Setiap tahap langsung dijalankan sebagai task saat ditambahkan. Ketergantungan
+    antar tahap cukup ditulis dengan `await graph.result("nama")` di dalam tahap.
+    """
+
+    def __init__(self, deadline: float) -> None:
+        self.started = time.monotonic()
+        self.deadline = deadline
+        self._stages: Dict[str, _Stage] = {}
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - (time.monotonic() - self.started))
+
+    def add(
+        self,
+        name: str,
+        func: Callable[[], Awaitable[Any]],
+        *,
+        optional: bool = True,
+        budget: Optional[float] = None,
+        default: Any = None,
+    ) -> None:
+        if name in self._stages:
+            raise ValueError(f"Tahap {name} sudah ada.")
+        task = asyncio.create_task(self._run(name, func, optional, budget))
+        # Tahap yang hasilnya tidak pernah diambil tidak boleh memicu "exception was never retrieved"
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._stages[name] = _Stage(name, task, optional, default)
+
+    async def _run(self, name: str, func: Callable[[], Awaitable[Any]], optional: bool, budget: Optional[float]) -> Any:
+        # Budget tahap tidak boleh melewati sisa deadline bersama; tahap wajib tidak dibatasi
+        timeout = min(budget, self.remaining()) if budget is not None else self.remaining()
+        with span(name, stage="pregen"):
+            if not optional:
+                return await func()
+            return await asyncio.wait_for(func(), timeout)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._stages
+
+    async def result(self, name: str, default: Any = None) -> Any:
+        """
+        Hasil tahap `name`. Tahap opsional yang timeout/gagal/dibatalkan
+        menghasilkan default-nya; kesalahan tahap wajib diteruskan.
+        """
+        stage = self._stages.get(name)
+        if stage is None:
+            return default
+        try:
+            value = await asyncio.shield(stage.task)
+        except asyncio.CancelledError:
+            if not stage.task.cancelled():
+                raise  # Pemanggilnya sendiri yang dibatalkan
+            return self._skip(stage, "cancelled")
+        except asyncio.TimeoutError:
+            if not stage.optional:
+                raise
+            return self._skip(stage, "timeout")
+        except Exception as e:
+            if not stage.optional:
+                raise
+            logger.warning("Tahap %s gagal, dilewati: %s", name, e)
+            return self._skip(stage, "error")
+        stage.status = "ok"
+        return value
+
+    def _skip(self, stage: _Stage, reason: str) -> Any:
+        if stage.status == "running":
+            stage.status = reason
+            PREGEN_STAGE_SKIPPED.inc(stage=stage.name, reason=reason)
+        return stage.default
+
+    def cancel(self, *names: str) -> None:
+        """Batalkan tahap yang hasilnya tidak lagi dibutuhkan (mis. cache HIT)."""
+        for name in names or tuple(self._stages):
+            stage = self._stages.get(name)
+            if stage is not None and not stage.task.done():
+                stage.task.cancel()
+
+    def statuses(self) -> Dict[str, str]:
+        return {name: stage.status for name, stage in self._stages.items()}
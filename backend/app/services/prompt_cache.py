@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Context caching Gemini (cachedContents) untuk teks persona yang statis.
+Tanpa ini, persona (yandere saja ribuan karakter) dikirim ulang sebagai
+system_instruction di setiap giliran dan diproses ulang oleh Gemini. Di sini
+setiap kombinasi (versi API, model, API key, teks persona) mendapat satu
+handle cache yang dibuat di background saat pertama dipakai, diperpanjang
+sebelum TTL habis, dan dirujuk lewat `cachedContent` di payload. Selama handle
+belum ada, ditolak, atau fitur mati, payload tetap memakai teks inline.
+"""
+
+import asyncio
+import hashlib
+import logging
+import time
+from functools import lru_cache
+from typing import Dict, Optional, Set, Tuple
+
+import httpx
+
+from ..config import get_settings
+from ..metrics import PROMPT_CACHE_EVENTS
+from .upstream import get_upstream_client
+
+logger = logging.getLogger(__name__)
+
+# cachedContents hanya ada di v1beta
+CACHE_API_VERSIONS = ("v1beta",)
+# Handle yang tersisa kurang dari ini dianggap sudah kedaluwarsa (jaga jarak dengan jam server)
+EXPIRY_SAFETY = 30.0
+# Pembuatan yang ditolak (persona terlalu pendek, model tidak mendukung) tidak dicoba lagi selama ini
+FAILURE_BACKOFF = 3600.0
+# Gangguan jaringan saat membuat cache dicoba lagi lebih cepat
+NETWORK_BACKOFF = 60.0
+# Status respons generate yang berarti handle tidak bisa dipakai (hilang, key lain, dst.)
+REJECTED_STATUSES = (400, 403, 404)
+
+_CacheKey = Tuple[str, str, str, str]
+
+
+class _Entry:
+    __slots__ = ("name", "expires_at", "refreshing")
+
+    def __init__(self, name: str, expires_at: float) -> None:
+        self.name = name
+        self.expires_at = expires_at
+        self.refreshing = False
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class PromptCache:
+    def __init__(self, ttl: float, min_chars: int) -> None:
+        self.ttl = ttl
+        self.min_chars = min_chars
+        # Diperpanjang saat sisa umur di bawah ini, jauh sebelum benar-benar habis
+        self.refresh_margin = min(300.0, ttl * 0.2)
+        self.expiry_safety = min(EXPIRY_SAFETY, ttl * 0.05)
+        self._entries: Dict[_CacheKey, _Entry] = {}
+        self._blocked_until: Dict[_CacheKey, float] = {}
+        self._creating: Set[_CacheKey] = set()
+        self._tasks: Set["asyncio.Task[None]"] = set()
+
+    def _key(self, api_version: str, model: str, api_key: str, prompt: str) -> _CacheKey:
+        # Handle cachedContents terikat ke project pemilik API key
+        return (api_version, model, _digest(api_key)[:16], _digest(prompt))
+
+    def lookup(self, api_version: str, model: str, api_key: str, prompt: str) -> Optional[str]:
+        """
+        Nama handle (`cachedContents/...`) kalau sudah siap; None = pakai teks inline.
+        Tidak pernah menunggu jaringan: pembuatan & perpanjangan jalan di background.
+        """
+        if api_version not in CACHE_API_VERSIONS or len(prompt) < self.min_chars:
+            return None
+        key = self._key(api_version, model, api_key, prompt)
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at - now > self.expiry_safety:
+            if entry.expires_at - now < self.refresh_margin and not entry.refreshing:
+                entry.refreshing = True
+                self._spawn(self._refresh(key, entry, api_key))
+            PROMPT_CACHE_EVENTS.inc(event="hit")
+            return entry.name
+        if entry is not None:
+            del self._entries[key]
+        if self._blocked_until.get(key, 0.0) <= now and key not in self._creating:
+            self._creating.add(key)
+            self._spawn(self._create(key, model, api_key, prompt))
+        PROMPT_CACHE_EVENTS.inc(event="miss")
+        return None
+
+    def reject(self, api_version: str, model: str, api_key: str, prompt: str, status: int) -> None:
+        """Gemini menolak handle yang dirujuk: buang, lalu langsung buat ulang (404) atau tahan dulu."""
+        key = self._key(api_version, model, api_key, prompt)
+        entry = self._entries.pop(key, None)
+        PROMPT_CACHE_EVENTS.inc(event="rejected")
+        if status != 404:
+            self._blocked_until[key] = time.monotonic() + FAILURE_BACKOFF
+        elif key not in self._creating:
+            # Handle hilang/kedaluwarsa lebih cepat dari perkiraan: siapkan yang baru untuk giliran berikutnya
+            self._creating.add(key)
+            self._spawn(self._create(key, model, api_key, prompt))
+        logger.warning(
+            "Handle cache persona %s ditolak Gemini (%s), kembali ke teks inline.",
+            entry.name if entry else "-", status,
+        )
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _url(self, api_version: str, path: str) -> str:
+        return f"{get_settings().gemini_api_root}/{api_version}/{path}"
+
+    async def _create(self, key: _CacheKey, model: str, api_key: str, prompt: str) -> None:
+        api_version = key[0]
+        body = {
+            "model": f"models/{model}",
+            "displayName": f"linda-persona-{key[3][:12]}",
+            "systemInstruction": {"parts": [{"text": prompt}]},
+            "ttl": f"{int(self.ttl)}s",
+        }
+        try:
+            response = await get_upstream_client().post(
+                self._url(api_version, "cachedContents"), params={"key": api_key}, json=body,
+            )
+        except httpx.HTTPError as e:
+            logger.warning("Gagal membuat cache persona untuk %s: %s", model, e)
+            self._blocked_until[key] = time.monotonic() + NETWORK_BACKOFF
+            PROMPT_CACHE_EVENTS.inc(event="create_failed")
+            return
+        finally:
+            self._creating.discard(key)
+
+        if response.status_code != 200:
+            # Mis. persona di bawah minimum token cache model ini, atau model tidak mendukung
+            logger.info(
+                "Cache persona tidak tersedia untuk %s (%s): %s",
+                model, response.status_code, response.text[:200],
+            )
+            self._blocked_until[key] = time.monotonic() + FAILURE_BACKOFF
+            PROMPT_CACHE_EVENTS.inc(event="create_failed")
+            return
+        data = response.json()
+        self._entries[key] = _Entry(data["name"], time.monotonic() + self.ttl)
+        PROMPT_CACHE_EVENTS.inc(event="created")
+        logger.info(
+            "Cache persona dibuat: %s (%s, %s token).",
+            data["name"], model, data.get("usageMetadata", {}).get("totalTokenCount", "?"),
+        )
+
+    async def _refresh(self, key: _CacheKey, entry: _Entry, api_key: str) -> None:
+        try:
+            response = await get_upstream_client().patch(
+                self._url(key[0], entry.name),
+                params={"key": api_key, "updateMask": "ttl"},
+                json={"ttl": f"{int(self.ttl)}s"},
+            )
+            if response.status_code == 200:
+                entry.expires_at = time.monotonic() + self.ttl
+                PROMPT_CACHE_EVENTS.inc(event="refreshed")
+                return
+            logger.info("Perpanjangan cache %s gagal (%s); dibuat ulang saat habis.", entry.name, response.status_code)
+        except httpx.HTTPError as e:
+            logger.info("Perpanjangan cache %s gagal: %s", entry.name, e)
+        finally:
+            entry.refreshing = False
+        PROMPT_CACHE_EVENTS.inc(event="refresh_failed")
+
+    def stats(self) -> Dict[str, int]:
+        now = time.monotonic()
+        return {
+            "handles": sum(1 for entry in self._entries.values() if entry.expires_at > now),
+            "blocked": sum(1 for until in self._blocked_until.values() if until > now),
+            "creating": len(self._creating),
+        }
+
+
+@lru_cache(maxsize=1)
+def get_prompt_cache() -> Optional[PromptCache]:
+    """Cache persona tunggal per proses; None kalau GEMINI_CONTEXT_CACHE mati."""
+    settings = get_settings()
+    if not settings.gemini_context_cache:
+        return None
+    return PromptCache(ttl=settings.gemini_context_cache_ttl, min_chars=settings.gemini_context_cache_min_chars)
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Klasifikasi teks pendek lewat kalimat prototipe + leksikon.
+Dipakai bersama oleh router intent dan emosi avatar: teks di-embed dengan model
+MiniLM yang sama dengan memori, dibandingkan dengan centroid prototipe per
+label, lalu digabung dengan skor leksikon berbatas kata. Kalau model tidak
+tersedia (dimatikan, gagal dimuat, atau masih dalam masa jeda), leksikon saja.
+"""
+
+import logging
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from ..lazy import lazy_import
+
+logger = logging.getLogger(__name__)
+
+# numpy baru dimuat saat klasifikasi pertama, bukan saat startup
+np = lazy_import("numpy")
+
+SOFTMAX_TEMPERATURE = 0.05
+
+
+class PrototypeClassifier:
+    """
+    `labels` menentukan urutan semua array skor; `prototypes` berisi kalimat contoh
+    per label dan `lexicon` berisi (pola regex, label, bobot). `enabled` dibaca di
+    tiap panggilan, jadi flag konfigurasi berlaku tanpa membuat ulang classifier.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        labels: Sequence[str],
+        prototypes: Dict[str, List[str]],
+        lexicon: List[Tuple[str, str, float]],
+        *,
+        enabled: Callable[[], bool],
+        lexicon_weight: float,
+    ) -> None:
+        self.name = name
+        self.labels: Tuple[str, ...] = tuple(labels)
+        self.prototypes = prototypes
+        self.lexicon = [(re.compile(p, re.IGNORECASE), label, w) for p, label, w in lexicon]
+        self.enabled = enabled
+        self.lexicon_weight = lexicon_weight
+        self._matrix: Optional["np.ndarray"] = None
+        # Model yang menghasilkan _matrix; migrasi model memori bisa menggantinya
+        self._model: Any = None
+        self._lock = threading.Lock()
+
+    def lexicon_scores(self, text: str) -> "np.ndarray":
+        scores = np.zeros(len(self.labels), dtype=np.float32)
+        for pattern, label, weight in self.lexicon:
+            hits = len(pattern.findall(text))
+            if hits:
+                scores[self.labels.index(label)] += weight * min(hits, 3)
+        return scores
+
+    def lexicon_probs(self, text: str) -> Optional["np.ndarray"]:
+        """Skor leksikon ternormalisasi (dibagi total + 1, jadi satu kata saja tidak pernah yakin penuh)."""
+        scores = self.lexicon_scores(text)
+        total = float(scores.sum())
+        return scores / (total + 1.0) if total else None
+
+    def _centroids(self, model: Any) -> "np.ndarray":
+        """Centroid embedding per label, urut sesuai `labels`; dihitung ulang kalau model berganti."""
+        if self._matrix is not None and self._model is model:
+            return self._matrix
+
+        with self._lock:
+            if self._matrix is None or self._model is not model:
+                centroids = []
+                for label in self.labels:
+                    vectors = np.asarray(model.encode(self.prototypes[label], convert_to_tensor=False))
+                    centroid = vectors.mean(axis=0)
+                    centroids.append(centroid / (np.linalg.norm(centroid) or 1.0))
+                self._matrix = np.vstack(centroids).astype(np.float32)
+                self._model = model
+                logger.info("Prototipe %s siap (%d label).", self.name, len(self.labels))
+        return self._matrix
+
+    def embedding_probs(self, text: str) -> Optional["np.ndarray"]:
+        """Distribusi softmax kemiripan ke tiap centroid; None kalau model tidak bisa dipakai."""
+        if not self.enabled():
+            return None
+
+        from .memory import EmbeddingModelUnavailable, get_embedding_model
+
+        try:
+            model = get_embedding_model()
+            prototypes = self._centroids(model)
+        except EmbeddingModelUnavailable as e:
+            # Masa jeda setelah gagal muat: leksikon saja, tanpa menahan executor embedding
+            logger.debug("Prototipe %s dilewati: %s", self.name, e)
+            return None
+        except Exception as e:
+            logger.warning("Prototipe %s tidak tersedia, pakai leksikon saja: %s", self.name, e)
+            return None
+
+        vector = np.asarray(model.encode([text], convert_to_tensor=False))[0]
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        sims = prototypes @ vector
+        logits = (sims - sims.max()) / SOFTMAX_TEMPERATURE
+        probs = np.exp(logits)
+        return probs / probs.sum()
+
+    def blend(
+        self, lex_probs: Optional["np.ndarray"], emb_probs: Optional["np.ndarray"]
+    ) -> Optional["np.ndarray"]:
+        """Gabungan berbobot `lexicon_weight`; kalau salah satu kosong, yang ada saja dipakai."""
+        if lex_probs is not None and emb_probs is not None:
+            return self.lexicon_weight * lex_probs + (1 - self.lexicon_weight) * emb_probs
+        return emb_probs if emb_probs is not None else lex_probs
@@ -1,7 +1,9 @@
 # backend/app/services/search.py
 
 import logging
-from duckduckgo_search import DDGS
+import time
+
+from app.metrics import WEB_SEARCH_SECONDS
 
 logger = logging.getLogger(__name__)
 
@@ -10,15 +12,20 @@ def search_google(query: str, max_results: int = 3) -> str:
     Mencari informasi di internet menggunakan DuckDuckGo.
     Mengembalikan string ringkasan hasil pencarian.
     """
+    started = time.perf_counter()
+    outcome = "error"
     try:
         logger.info(f"🔍 Sedang browsing: '{query}'...")
         
-        # Inisialisasi DuckDuckGo Search
+        # Inisialisasi DuckDuckGo Search (diimpor di sini supaya startup tetap ringan)
+        from duckduckgo_search import DDGS
+
         with DDGS() as ddgs:
             # Cari teks (text search)
             results = list(ddgs.text(query, max_results=max_results))
             
             if not results:
+                outcome = "empty"
                 return ""
 
             # Format hasilnya biar enak dibaca sama Linda
@@ -31,8 +38,11 @@ def search_google(query: str, max_results: int = 3) -> str:
 
             # Gabungin jadi satu paragraf konteks
             context = "\n".join(formatted_results)
+            outcome = "ok"
             return f"FAKTA DARI INTERNET (Gunakan ini untuk menjawab):\n{context}\n"
 
     except Exception as e:
         logger.error(f"Gagal searching: {e}")
-        return ""
\ No newline at end of file
+        return ""
+    finally:
+        WEB_SEARCH_SECONDS.observe(time.perf_counter() - started, outcome=outcome)
\ No newline at end of file
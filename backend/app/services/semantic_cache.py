@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Cache respons semantik untuk obrolan ringan.
+Cache biasa (cache.py) hanya kena kalau prompt-nya identik, padahal "lagi apa?"
+dan "kamu lagi ngapain?" minta jawaban yang sama. Di sini pesan terakhir user
+di-embed dengan model yang sama dengan memori, lalu dicari tetangga terdekatnya
+di indeks FAISS kecil per persona. Jawaban lama diputar ulang kalau kemiripan
+kosinus di atas ambang dan konteksnya cocok (persona, tanggal, dan giliran
+sebelumnya sebanyak SEMANTIC_CACHE_CONTEXT_TURNS). Pemanggil hanya memakai
+cache ini untuk giliran chitchat tanpa memori, pencarian web, gambar, atau
+ringkasan riwayat, karena jawaban semacam itu bergantung pada hal di luar pesan.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from ..config import get_settings
+from ..lazy import lazy_import
+from ..metrics import SEMANTIC_CACHE_EVICTIONS, SEMANTIC_CACHE_LOOKUPS, SEMANTIC_CACHE_SIMILARITY
+from ..schemas import Message
+
+logger = logging.getLogger(__name__)
+
+faiss = lazy_import("faiss")
+np = lazy_import("numpy")
+
+# Tetangga yang diperiksa per lookup (sebagian bisa kedaluwarsa atau beda konteks)
+SEARCH_K = 4
+
+
+def semantic_context_key(persona: str, messages: List[Message], turns: int) -> str:
+    """Hash konteks yang harus sama persis: persona, tanggal, dan `turns` giliran sebelum pesan terakhir."""
+    previous = messages[:-1][-turns:] if turns > 0 else []
+    material = json.dumps(
+        [persona, date.today().isoformat(), [[m.role.value, m.content] for m in previous]],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class SemanticHit(NamedTuple):
+    text: str
+    similarity: float
+
+
+class SemanticProbe(NamedTuple):
+    """Hasil lookup; vektor disimpan supaya jawaban baru bisa dimasukkan tanpa encode ulang."""
+
+    persona: str
+    context: str
+    vector: Any
+    model: Any
+    hit: Optional[SemanticHit]
+
+
+class _Entry:
+    __slots__ = ("context", "text", "expires_at", "hits")
+
+    def __init__(self, context: str, text: str, expires_at: float) -> None:
+        self.context = context
+        self.text = text
+        self.expires_at = expires_at
+        self.hits = 0
+
+
+class _PersonaIndex:
+    """Indeks FAISS inner product (vektor ternormalisasi = kosinus) + entri urut LRU."""
+
+    def __init__(self, dimension: int) -> None:
+        self.index = faiss.IndexIDMap(faiss.IndexFlatIP(dimension))
+        self.entries: "OrderedDict[int, _Entry]" = OrderedDict()
+
+    def remove(self, entry_id: int) -> None:
+        self.entries.pop(entry_id, None)
+        self.index.remove_ids(np.array([entry_id], dtype=np.int64))
+
+
+class SemanticCache:
+    def __init__(self, threshold: float, ttl: float, max_entries: int, max_chars: int) -> None:
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self._lock = threading.Lock()
+        self._personas: Dict[str, _PersonaIndex] = {}
+        # Model yang menghasilkan vektor di indeks; kalau model memori berganti, cache dikosongkan
+        self._model: Any = None
+        self._next_id = 1
+        self.counters: Dict[str, int] = {"hits": 0, "misses": 0, "puts": 0, "evictions": 0}
+
+    def _encode(self, text: str) -> Tuple[Any, Any]:
+        from .memory import get_embedding_model
+
+        model = get_embedding_model()
+        vector = np.asarray(model.encode([text], convert_to_tensor=False), dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        with self._lock:
+            if self._model is not model:
+                if self._model is not None:
+                    logger.info("Model embedding berganti, cache semantik dikosongkan.")
+                self._personas.clear()
+                self._model = model
+        return model, vector
+
+    def _purge_expired(self, persona_index: _PersonaIndex, now: float) -> None:
+        expired = [entry_id for entry_id, entry in persona_index.entries.items() if entry.expires_at <= now]
+        for entry_id in expired:
+            persona_index.remove(entry_id)
+        if expired:
+            self.counters["evictions"] += len(expired)
+            SEMANTIC_CACHE_EVICTIONS.inc(len(expired), reason="ttl")
+
+    def lookup(self, persona: str, context: str, text: str) -> Optional[SemanticProbe]:
+        """
+        Cari jawaban untuk pesan yang mirip (blocking, jalankan di executor embedding).
+        None = pesan tidak layak di-cache (kosong atau terlalu panjang).
+        """
+        text = " ".join(text.split())
+        if not text or len(text) > self.max_chars:
+            SEMANTIC_CACHE_LOOKUPS.inc(result="skipped")
+            return None
+        model, vector = self._encode(text)
+        now = time.time()
+        with self._lock:
+            persona_index = self._personas.get(persona)
+            best: Optional[SemanticHit] = None
+            best_id = 0
+            if persona_index is not None:
+                self._purge_expired(persona_index, now)
+                if persona_index.index.ntotal:
+                    sims, ids = persona_index.index.search(vector, min(SEARCH_K, persona_index.index.ntotal))
+                    for sim, entry_id in zip(sims[0], ids[0]):
+                        entry = persona_index.entries.get(int(entry_id))
+                        if entry is not None and entry.context == context:
+                            best, best_id = SemanticHit(entry.text, float(sim)), int(entry_id)
+                            break
+            if best is not None and best.similarity >= self.threshold:
+                persona_index.entries.move_to_end(best_id)
+                persona_index.entries[best_id].hits += 1
+                self.counters["hits"] += 1
+                SEMANTIC_CACHE_LOOKUPS.inc(result="hit")
+                SEMANTIC_CACHE_SIMILARITY.observe(best.similarity, result="hit")
+                return SemanticProbe(persona, context, vector, model, best)
+            self.counters["misses"] += 1
+            SEMANTIC_CACHE_LOOKUPS.inc(result="miss")
+            if best is not None:
+                # Kandidat terdekat yang tidak lolos ambang: bahan menyetel SEMANTIC_CACHE_THRESHOLD
+                SEMANTIC_CACHE_SIMILARITY.observe(best.similarity, result="miss")
+        return SemanticProbe(persona, context, vector, model, None)
+
+    def put(self, probe: SemanticProbe, text: str) -> None:
+        """Simpan jawaban untuk pesan yang tadi di-lookup (vektornya sudah ada di probe)."""
+        text = text.strip()
+        if not text or probe.hit is not None:
+            return
+        with self._lock:
+            if probe.model is not self._model:
+                # Vektor dari model sebelum migrasi: tidak sebanding dengan isi indeks sekarang
+                return
+            persona_index = self._personas.get(probe.persona)
+            if persona_index is None:
+                persona_index = self._personas[probe.persona] = _PersonaIndex(probe.vector.shape[1])
+            entry_id = self._next_id
+            self._next_id += 1
+            persona_index.index.add_with_ids(probe.vector, np.array([entry_id], dtype=np.int64))
+            persona_index.entries[entry_id] = _Entry(probe.context, text, time.time() + self.ttl)
+            self.counters["puts"] += 1
+            while len(persona_index.entries) > self.max_entries:
+                oldest_id = next(iter(persona_index.entries))
+                persona_index.remove(oldest_id)
+                self.counters["evictions"] += 1
+                SEMANTIC_CACHE_EVICTIONS.inc(reason="capacity")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._personas.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "entries": {persona: len(p.entries) for persona, p in self._personas.items()},
+                "hit_ratio": round(self.counters["hits"] / lookups, 4) if lookups else 0.0,
+                "threshold": self.threshold,
+            }
+
+
+@lru_cache(maxsize=1)
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """Cache semantik tunggal per proses; None kalau SEMANTIC_CACHE mati."""
+    settings = get_settings()
+    if not settings.semantic_cache:
+        return None
+    return SemanticCache(
+        threshold=settings.semantic_cache_threshold,
+        ttl=settings.semantic_cache_ttl,
+        max_entries=settings.semantic_cache_max_entries,
+        max_chars=settings.semantic_cache_max_chars,
+    )
@@ -0,0 +1,478 @@
+# -*- coding: utf-8 -*-
+"""
+Service layer untuk berbagi stream token antar request.
+Broadcast menyimpan token yang sudah keluar supaya subscriber yang datang
+belakangan tetap dapat awal jawaban, lalu mengikuti ekor live. SingleFlight
+memastikan prompt identik yang sedang diproses hanya membuka SATU stream
+upstream; request lain cukup menumpang sebagai subscriber. StreamRegistry
+menyimpan frame SSE tiap jawaban sebentar supaya koneksi yang putus bisa
+disambung lagi lewat Last-Event-ID tanpa generasi baru. TokenCoalescer
+menggabungkan delta token menjadi frame per jendela waktu, dan HeartbeatHub
+mengirim heartbeat ke semua koneksi dari satu timer bersama.
+"""
+
+import asyncio
+import contextlib
+import itertools
+import logging
+import time
+import uuid
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from ..config import get_settings
+from ..metrics import SSE_TOKEN_DELTAS, SSE_TOKEN_FRAMES
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayExpired(LookupError):
+    """Item yang diminta sudah dibuang dari jendela replay; klien harus mengirim ulang permintaannya."""
+
+
+class Broadcast:
+    """
+    Buffer item dengan banyak pembaca independen. Posisi item absolut (dihitung
+    sejak item pertama). Dengan `max_bytes`, item tertua dibuang begitu total
+    ukurannya lewat batas (item terakhir selalu disimpan), dan `base` maju.
+    Pembaca yang butuh item sebelum `base` mendapat ReplayExpired.
+    """
+
+    def __init__(self, max_bytes: int = 0) -> None:
+        self.items: Deque[str] = deque()
+        self.base = 0
+        self.max_bytes = max_bytes
+        self._bytes = 0
+        self.closed = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+        self._advanced = asyncio.Event()
+        self._positions: Dict[int, int] = {}
+        self._next_reader = itertools.count()
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def _notify_advanced(self) -> None:
+        advanced, self._advanced = self._advanced, asyncio.Event()
+        advanced.set()
+
+    @property
+    def end(self) -> int:
+        """Posisi item berikutnya (jumlah item yang pernah dipublish)."""
+        return self.base + len(self.items)
+
+    def retains(self, start: int) -> bool:
+        return start >= self.base
+
+    def publish(self, item: str) -> None:
+        if self.closed:
+            return
+        self.items.append(item)
+        if self.max_bytes:
+            self._bytes += len(item.encode("utf-8"))
+            while self._bytes > self.max_bytes and len(self.items) > 1:
+                self._bytes -= len(self.items.popleft().encode("utf-8"))
+                self.base += 1
+        self._notify()
+
+    async def publish_with_backpressure(self, item: str, max_lag: int) -> None:
+        """
+        Publish lalu tunggu selama pembaca TERCEPAT masih tertinggal lebih dari
+        max_lag item. Klien lambat jadi menahan upstream, bukan menumpuk di RAM.
+        Tanpa pembaca sama sekali, tidak ada yang ditunggu.
+        """
+        self.publish(item)
+        while self._positions and self.end - max(self._positions.values()) > max_lag:
+            await self._advanced.wait()
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self.error = error
+        self._notify()
+
+    async def subscribe(self, start: int = 0) -> AsyncIterator[str]:
+        """
+        Replay item sejak `start`, lalu ikuti item baru sampai ditutup.
+        ReplayExpired kalau item berikutnya sudah keluar dari jendela replay.
+        """
+        reader = next(self._next_reader)
+        position = start
+        self._positions[reader] = position
+        try:
+            while True:
+                while position < self.end:
+                    if position < self.base:
+                        raise ReplayExpired(f"Item {position} sudah dibuang (tersisa sejak {self.base}).")
+                    yield self.items[position - self.base]
+                    position += 1
+                    self._positions[reader] = position
+                    self._notify_advanced()
+                if self.closed:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            self._positions.pop(reader, None)
+            self._notify_advanced()
+
+
+class TokenCoalescer:
+    """
+    Menggabungkan delta token menjadi satu frame `event: token` per jendela
+    waktu `window` detik atau per `max_chars` karakter, mana yang lebih dulu.
+    Token pertama langsung dikirim (TTFT tidak bertambah); pemanggil wajib
+    `flush()` sebelum frame non-token (emosi, timing, done) supaya urutan terjaga.
+    """
+
+    def __init__(self, broadcast: Broadcast, *, window: float, max_chars: int, max_lag: int = 0) -> None:
+        self.broadcast = broadcast
+        self.window = window
+        self.max_chars = max_chars
+        self.max_lag = max_lag
+        self._buffer: List[str] = []
+        self._size = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._started = False
+
+    async def add(self, token: str) -> None:
+        self._buffer.append(token)
+        self._size += len(token)
+        SSE_TOKEN_DELTAS.inc()
+        if not self._started or self.window <= 0 or self._size >= self.max_chars:
+            self._started = True
+            await self.flush()
+        elif self._timer is None:
+            # Upstream yang mendadak diam tidak boleh menahan token lebih lama dari jendela
+            self._timer = asyncio.get_running_loop().call_later(self.window, self.flush_nowait)
+
+    def _take(self) -> str:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        text = "".join(self._buffer)
+        self._buffer.clear()
+        self._size = 0
+        return text
+
+    def _frame(self, text: str) -> str:
+        SSE_TOKEN_FRAMES.inc()
+        return f"event: token\ndata: {text}\n\n"
+
+    async def flush(self) -> None:
+        text = self._take()
+        if not text:
+            return
+        if self.max_lag > 0:
+            await self.broadcast.publish_with_backpressure(self._frame(text), self.max_lag)
+        else:
+            self.broadcast.publish(self._frame(text))
+
+    def flush_nowait(self) -> None:
+        """Kirim sisa buffer tanpa menunggu backpressure (timer, jalur error/batal)."""
+        text = self._take()
+        if text:
+            self.broadcast.publish(self._frame(text))
+
+
+HEARTBEAT_FRAME = ":\n\n"
+
+
+class HeartbeatHub:
+    """
+    Satu timer untuk heartbeat semua koneksi SSE, bukan satu task per koneksi.
+    Heartbeat hanya dimasukkan ke antrean yang sedang kosong (koneksi diam).
+    """
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._queues: Set["asyncio.Queue[str]"] = set()
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    def register(self, queue: "asyncio.Queue[str]") -> None:
+        self._queues.add(queue)
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._run())
+
+    def unregister(self, queue: "asyncio.Queue[str]") -> None:
+        self._queues.discard(queue)
+
+    async def _run(self) -> None:
+        # Berhenti sendiri saat tidak ada koneksi; register berikutnya menyalakan lagi
+        while self._queues:
+            await asyncio.sleep(self.interval)
+            for queue in list(self._queues):
+                if queue.empty():
+                    queue.put_nowait(HEARTBEAT_FRAME)
+
+    def __len__(self) -> int:
+        return len(self._queues)
+
+
+class _Flight:
+    __slots__ = ("broadcast", "task", "subscribers")
+
+    def __init__(self) -> None:
+        self.broadcast = Broadcast()
+        self.task: Optional["asyncio.Task[None]"] = None
+        self.subscribers = 0
+
+
+class SingleFlight:
+    def __init__(self) -> None:
+        self._flights: Dict[str, _Flight] = {}
+        self.started = 0
+        self.joined = 0
+
+    @contextlib.asynccontextmanager
+    async def join(
+        self,
+        key: str,
+        factory: Callable[[], AsyncIterator[str]],
+        on_complete: Optional[Callable[[str], Awaitable[None]]] = None,
+        max_lag: int = 0,
+    ) -> AsyncIterator[Tuple[Broadcast, bool]]:
+        """
+        Bergabung ke stream untuk `key`. Pemanggil pertama (owner) memicu `factory`
+        di task terpisah; pemanggil berikutnya hanya berlangganan. Kalau semua
+        subscriber pergi sebelum selesai, stream upstream dibatalkan; kalau stream
+        sudah selesai, `on_complete` tetap dibiarkan jalan sampai tuntas.
+        """
+        flight = self._flights.get(key)
+        owner = flight is None
+        if flight is None:
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._pump(key, flight, factory, on_complete, max_lag))
+            self.started += 1
+        else:
+            self.joined += 1
+            logger.info("Single-flight: menumpang stream yang sedang berjalan (%s).", key[:12])
+
+        flight.subscribers += 1
+        try:
+            yield flight.broadcast, owner
+        finally:
+            flight.subscribers -= 1
+            if (
+                flight.subscribers == 0
+                and flight.task is not None
+                and not flight.task.done()
+                and not flight.broadcast.closed
+            ):
+                flight.task.cancel()
+
+    async def _pump(
+        self,
+        key: str,
+        flight: _Flight,
+        factory: Callable[[], AsyncIterator[str]],
+        on_complete: Optional[Callable[[str], Awaitable[None]]],
+        max_lag: int,
+    ) -> None:
+        try:
+            async for item in factory():
+                if max_lag > 0:
+                    await flight.broadcast.publish_with_backpressure(item, max_lag)
+                else:
+                    flight.broadcast.publish(item)
+            flight.broadcast.close()
+            if on_complete is not None:
+                # Flight baru dilepas setelah callback (mis. isi cache) selesai; yang datang
+                # di sela-selanya tetap dapat replay penuh dari broadcast yang sudah tertutup.
+                # Subscriber terakhir yang pergi di titik ini tidak lagi membatalkan task (lihat join)
+                try:
+                    await on_complete("".join(flight.broadcast.items))
+                except Exception as e:
+                    logger.warning("Single-flight: callback selesai gagal: %s", e)
+        except asyncio.CancelledError:
+            flight.broadcast.close(asyncio.CancelledError())
+            raise
+        except Exception as e:
+            flight.broadcast.close(e)
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._flights), "started": self.started, "joined": self.joined}
+
+
+class ResumableStream:
+    """Satu jawaban /chat: buffer frame SSE (terbatas `max_bytes`) + task yang mengisinya."""
+
+    __slots__ = ("stream_id", "broadcast", "task", "readers", "expires_at", "_abandon_handle")
+
+    def __init__(self, stream_id: str, max_bytes: int = 0) -> None:
+        self.stream_id = stream_id
+        self.broadcast = Broadcast(max_bytes)
+        self.task: "asyncio.Task[None]"
+        self.readers = 0
+        self.expires_at: Optional[float] = None
+        self._abandon_handle: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.broadcast.closed
+
+
+class StreamRegistry:
+    """
+    Registry stream yang bisa dilanjutkan. Stream yang selesai disimpan
+    selama `ttl` detik; jumlah total dibatasi `max_streams` (yang tertua
+    dibuang duluan). Stream yang kehilangan semua pembaca dibatalkan setelah
+    `grace` detik kalau tidak ada yang menyambung lagi. Buffer replay tiap
+    stream dibatasi `buffer_bytes`; frame tertua dibuang lebih dulu.
+    """
+
+    def __init__(self, max_streams: int, ttl: float, grace: float, buffer_bytes: int = 0) -> None:
+        self.max_streams = max_streams
+        self.ttl = ttl
+        self.grace = grace
+        self.buffer_bytes = buffer_bytes
+        self._streams: "OrderedDict[str, ResumableStream]" = OrderedDict()
+        self.resumed = 0
+        self.abandoned = 0
+
+    def start(self, produce: Callable[[Broadcast], Awaitable[None]]) -> ResumableStream:
+        """
+        Mulai stream baru. Koneksi yang memulainya langsung dihitung sebagai
+        pembaca, supaya stream tidak dianggap yatim sebelum respons sempat dikirim.
+        """
+        record = ResumableStream(uuid.uuid4().hex, self.buffer_bytes)
+        record.readers = 1
+        record.task = asyncio.create_task(self._run(record, produce))
+        self._streams[record.stream_id] = record
+        self._evict()
+        return record
+
+    async def _run(self, record: ResumableStream, produce: Callable[[Broadcast], Awaitable[None]]) -> None:
+        try:
+            await produce(record.broadcast)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.warning("Stream %s gagal: %s", record.stream_id[:12], e)
+        finally:
+            record.broadcast.close()
+            record.expires_at = time.monotonic() + self.ttl
+            if record._abandon_handle is not None:
+                record._abandon_handle.cancel()
+
+    def get(self, stream_id: str) -> Optional[ResumableStream]:
+        self._evict()
+        return self._streams.get(stream_id)
+
+    def attach(self, record: ResumableStream) -> None:
+        """Koneksi lanjutan mulai membaca; batalkan rencana pembatalan stream."""
+        record.readers += 1
+        self.resumed += 1
+        if record._abandon_handle is not None:
+            record._abandon_handle.cancel()
+            record._abandon_handle = None
+
+    def detach(self, record: ResumableStream) -> None:
+        record.readers = max(0, record.readers - 1)
+        if record.readers or record.finished:
+            return
+        if self.grace <= 0:
+            self._abandon(record)
+        elif record._abandon_handle is None:
+            loop = asyncio.get_running_loop()
+            record._abandon_handle = loop.call_later(self.grace, self._abandon, record)
+
+    def _abandon(self, record: ResumableStream) -> None:
+        record._abandon_handle = None
+        if record.readers == 0 and not record.task.done():
+            self.abandoned += 1
+            record.task.cancel()
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        for stream_id in [
+            sid for sid, rec in self._streams.items()
+            if rec.expires_at is not None and rec.expires_at <= now
+        ]:
+            del self._streams[stream_id]
+        while len(self._streams) > self.max_streams:
+            # Dibuang dari registry hanya berarti tidak bisa dilanjutkan; generasinya jalan terus
+            self._streams.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        live = sum(1 for rec in self._streams.values() if not rec.finished)
+        return {
+            "live": live,
+            "retained": len(self._streams) - live,
+            "resumed": self.resumed,
+            "abandoned": self.abandoned,
+        }
+
+
+class StreamStats:
+    """Statistik stream SSE: yang selesai vs dibatalkan karena klien putus."""
+
+    def __init__(self) -> None:
+        self.completed = 0
+        self.cancelled = 0
+        self.tokens_before_cancel = 0
+        self.tokens_saved_estimate = 0
+        self._avg_reply_tokens = 0.0
+
+    def record_completed(self, tokens: int) -> None:
+        self.completed += 1
+        if self._avg_reply_tokens:
+            self._avg_reply_tokens = 0.9 * self._avg_reply_tokens + 0.1 * tokens
+        else:
+            self._avg_reply_tokens = float(tokens)
+
+    def record_cancelled(self, tokens_streamed: int) -> int:
+        """Catat pembatalan; return estimasi token yang tidak jadi dibayar."""
+        saved = max(0, int(self._avg_reply_tokens) - tokens_streamed)
+        self.cancelled += 1
+        self.tokens_before_cancel += tokens_streamed
+        self.tokens_saved_estimate += saved
+        return saved
+
+    def snapshot(self) -> Dict[str, int]:
+        return {
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "tokens_before_cancel": self.tokens_before_cancel,
+            "tokens_saved_estimate": self.tokens_saved_estimate,
+        }
+
+
+@lru_cache(maxsize=1)
+def get_stream_stats() -> StreamStats:
+    """Statistik stream tunggal per proses."""
+    return StreamStats()
+
+
+@lru_cache(maxsize=1)
+def get_stream_registry() -> StreamRegistry:
+    """Registry stream yang bisa dilanjutkan, sesuai konfigurasi."""
+    settings = get_settings()
+    return StreamRegistry(
+        max_streams=settings.stream_resume_max_streams,
+        ttl=settings.stream_resume_ttl,
+        grace=settings.stream_resume_grace,
+        buffer_bytes=settings.stream_resume_buffer_bytes,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_heartbeat_hub() -> HeartbeatHub:
+    """Timer heartbeat bersama untuk semua koneksi SSE."""
+    return HeartbeatHub(get_settings().stream_heartbeat_interval)
+
+
+@lru_cache(maxsize=1)
+def get_single_flight() -> SingleFlight:
+    """Registry single-flight tunggal untuk generasi chat."""
+    return SingleFlight()
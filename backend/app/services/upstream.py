@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Klien HTTP bersama untuk Gemini.
+Satu httpx.AsyncClient per event loop supaya koneksi TCP/TLS ke Gemini dipakai
+ulang antar request, ditambah warm-up: kalau koneksi sudah lama menganggur,
+buka lebih dulu (paralel dengan tahap pra-generasi lain) sebelum request stream.
+"""
+
+import asyncio
+import logging
+import time
+import weakref
+from typing import Optional
+
+import httpx
+
+from ..config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Koneksi keep-alive di pool ditutup httpx setelah menganggur selama ini (detik)
+KEEPALIVE_EXPIRY = 30.0
+
+
+class _LoopClient:
+    __slots__ = ("client", "last_used", "warming")
+
+    def __init__(self, client: httpx.AsyncClient) -> None:
+        self.client = client
+        self.last_used = 0.0
+        self.warming: Optional["asyncio.Future[None]"] = None
+
+
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopClient]" = weakref.WeakKeyDictionary()
+
+
+def _entry() -> _LoopClient:
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(loop)
+    if entry is None or entry.client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=get_settings().request_timeout,
+            limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=KEEPALIVE_EXPIRY),
+        )
+        entry = _clients[loop] = _LoopClient(client)
+    return entry
+
+
+def get_upstream_client() -> httpx.AsyncClient:
+    """Klien bersama untuk event loop yang sedang berjalan (jangan ditutup pemanggil)."""
+    return _entry().client
+
+
+def mark_upstream_used() -> None:
+    _entry().last_used = time.monotonic()
+
+
+async def warm_upstream() -> bool:
+    """
+    Buka koneksi ke GEMINI_API_ROOT kalau pool kemungkinan sudah kosong.
+    Return True kalau benar-benar melakukan warm-up. Warm-up yang sedang
+    berjalan ditumpangi, bukan diulang.
+    """
+    entry = _entry()
+    if time.monotonic() - entry.last_used < KEEPALIVE_EXPIRY / 2:
+        return False
+    if entry.warming is None or entry.warming.done():
+        entry.warming = asyncio.ensure_future(_warm(entry))
+    await asyncio.shield(entry.warming)
+    return True
+
+
+async def _warm(entry: _LoopClient) -> None:
+    try:
+        # Status apa pun tidak masalah; yang dicari handshake TCP/TLS-nya
+        await entry.client.head(get_settings().gemini_api_root)
+        entry.last_used = time.monotonic()
+    except httpx.HTTPError as e:
+        logger.debug("Warm-up koneksi Gemini gagal: %s", e)
+
+
+async def close_upstream_client() -> None:
+    """Tutup klien milik event loop ini (dipanggil saat shutdown)."""
+    entry = _clients.pop(asyncio.get_running_loop(), None)
+    if entry is not None:
+        await entry.client.aclose()
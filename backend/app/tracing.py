@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentasi span ringan per request.
+Trace aktif disimpan di contextvar, jadi ikut terbawa ke task (asyncio.create_task)
+dan thread (asyncio.to_thread / app.executors) yang dibuat dari request tersebut. Hasilnya bisa
+dipakai sebagai header Server-Timing, event SSE penutup, dan log JSON terstruktur.
+"""
+
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Optional
+
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+_current_trace: "contextvars.ContextVar[Optional[Trace]]" = contextvars.ContextVar(
+    "current_trace", default=None
+)
+
+
+class Span:
+    __slots__ = ("name", "offset", "duration", "attrs")
+
+    def __init__(self, name: str, offset: float, attrs: Dict[str, Any]) -> None:
+        self.name = name
+        self.offset = offset      # detik sejak trace dimulai
+        self.duration = 0.0       # detik
+        self.attrs = attrs
+
+    def to_dict(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            "name": self.name,
+            "start_ms": round(self.offset * 1000, 2),
+            "dur_ms": round(self.duration * 1000, 2),
+        }
+        if self.attrs:
+            data["attrs"] = self.attrs
+        return data
+
+
+class Trace:
+    def __init__(self, request_id: str, name: str) -> None:
+        self.request_id = request_id
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans: List[Span] = []
+        self.finished = False
+        self._lock = threading.Lock()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def mark(self, name: str, **attrs: Any) -> None:
+        """Titik waktu tanpa durasi (mis. token pertama), dicatat sebagai offset."""
+        self.add(Span(name, self.elapsed(), attrs))
+
+    def totals(self) -> Dict[str, float]:
+        """Durasi per nama span dalam ms; mark dilaporkan sebagai offset-nya."""
+        totals: Dict[str, float] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            value = span.duration if span.duration else span.offset
+            if span.duration or span.name not in totals:
+                totals[span.name] = totals.get(span.name, 0.0) + value * 1000
+        return {name: round(ms, 2) for name, ms in totals.items()}
+
+    def server_timing(self) -> str:
+        """Nilai header Server-Timing untuk span yang sudah selesai saat ini."""
+        entries = [f"{name};dur={ms}" for name, ms in self.totals().items()]
+        entries.append(f"total;dur={round(self.elapsed() * 1000, 2)}")
+        return ", ".join(entries)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "request_id": self.request_id,
+            "total_ms": round(self.elapsed() * 1000, 2),
+            "stages": self.totals(),
+        }
+
+    def finish(self, **attrs: Any) -> None:
+        """
+        Tutup trace dan tulis satu baris log (sekali saja). Record dikirim sebagai
+        field terstruktur `trace`, jadi formatter yang meng-encode-nya, sekali.
+        """
+        if self.finished:
+            return
+        self.finished = True
+        settings = get_settings()
+        total_ms = self.elapsed() * 1000
+        if not settings.trace_log_enabled or total_ms < settings.trace_log_min_ms:
+            return
+        with self._lock:
+            spans = [s.to_dict() for s in self.spans]
+        record = {
+            "trace": self.name,
+            "request_id": self.request_id,
+            "total_ms": round(total_ms, 2),
+            "spans": spans,
+            **attrs,
+        }
+        logger.info("Trace %s selesai dalam %.2f ms.", self.name, total_ms, extra={"trace": record})
+
+
+def start_trace(name: str, request_id: Optional[str] = None) -> Trace:
+    """Mulai trace baru dan jadikan trace aktif di konteks saat ini."""
+    trace = Trace(request_id or uuid.uuid4().hex[:16], name)
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextlib.contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Optional[Span]]:
+    """Ukur satu tahap. Tanpa trace aktif, ini no-op."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    started = time.perf_counter()
+    record = Span(name, started - trace.started, attrs)
+    try:
+        yield record
+    except BaseException as e:
+        record.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        record.duration = time.perf_counter() - started
+        trace.add(record)
+
+
+def record_span(name: str, started: float, **attrs: Any) -> None:
+    """Catat span yang mulai di `started` (perf_counter) dan berakhir sekarang."""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    record = Span(name, started - trace.started, attrs)
+    record.duration = time.perf_counter() - started
+    trace.add(record)
+
+
+def mark(name: str, **attrs: Any) -> None:
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.mark(name, **attrs)
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark subsistem memori (SQLite + FAISS) pada skala realistis.
+
+Mengukur, untuk tiap kombinasi ukuran x konfigurasi indeks:
+- waktu rebuild indeks dari database,
+- throughput upsert_memory,
+- latensi search_memory (p50/p99),
+- recall@k dibanding pencarian eksak,
+- RSS proses.
+
+Default memakai embedder stub deterministik (offline, tanpa unduh model) supaya
+hasil antar-run bisa dibandingkan. Contoh (dari folder backend/):
+
+    python -m benchmarks.bench_memory --sizes 10000,100000 --index "Flat;HNSW32" \
+        --output bench-results.json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import resource
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+# --- Kosakata sintetis: beberapa topik supaya query punya tetangga yang bermakna ---
+TOPICS = {
+    "makanan": ["nasi", "goreng", "bakso", "sate", "pedas", "manis", "kopi", "teh", "martabak", "soto"],
+    "hobi": ["gitar", "main", "game", "anime", "baca", "novel", "lari", "futsal", "gambar", "musik"],
+    "kerja": ["kantor", "rapat", "deadline", "laporan", "bos", "proyek", "lembur", "gaji", "klien", "email"],
+    "kuliah": ["dosen", "tugas", "ujian", "skripsi", "kampus", "kelas", "nilai", "praktikum", "jurnal", "semester"],
+    "keluarga": ["ibu", "ayah", "adik", "kakak", "rumah", "mudik", "lebaran", "kucing", "nenek", "sepupu"],
+    "perjalanan": ["pantai", "gunung", "bandung", "bali", "kereta", "pesawat", "hotel", "tiket", "liburan", "jogja"],
+}
+FILLER = ["aku", "suka", "banget", "kemarin", "besok", "pengen", "lagi", "sama", "yang", "sering", "jarang", "pas"]
+
+
+class StubEmbedder:
+    """
+    Embedder deterministik: jumlah vektor acak (di-seed dari hash kata) per kata,
+    lalu dinormalisasi. Teks yang berbagi kata jadi berdekatan, mirip model asli
+    secara kasar, tapi cepat dan tanpa jaringan.
+    """
+
+    def __init__(self, dimension: int = 384) -> None:
+        self.dimension = dimension
+        self._word_vectors: Dict[str, np.ndarray] = {}
+
+    def _word(self, word: str) -> np.ndarray:
+        vector = self._word_vectors.get(word)
+        if vector is None:
+            seed = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+            vector = np.random.default_rng(seed).standard_normal(self.dimension).astype(np.float32)
+            self._word_vectors[word] = vector
+        return vector
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def encode(self, texts: Sequence[str], convert_to_tensor: bool = False, show_progress_bar: bool = False, **_: Any) -> np.ndarray:
+        out = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                out[row] += self._word(word)
+            norm = float(np.linalg.norm(out[row]))
+            if norm:
+                out[row] /= norm
+        return out
+
+
+def _memory_text(rng: random.Random, serial: int) -> str:
+    topic = rng.choice(list(TOPICS))
+    words = rng.sample(TOPICS[topic], 4) + rng.sample(FILLER, 3)
+    rng.shuffle(words)
+    # Nomor seri menjaga teks tetap unik (kolom UNIQUE(type, text))
+    return " ".join(words) + f" catatan{serial}"
+
+
+def _query_from(text: str, rng: random.Random) -> str:
+    """Parafrase kasar: sebagian kata dari memori asli + satu kata pengisi."""
+    words = [w for w in text.split() if not w.startswith("catatan")]
+    return " ".join(rng.sample(words, max(2, len(words) // 2)) + [rng.choice(FILLER)])
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[rank]
+
+
+def _rss_mb() -> Dict[str, float]:
+    current = 0.0
+    try:
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux melaporkan KiB, macOS byte
+    peak_mb = peak / 2**20 if sys.platform == "darwin" else peak / 1024
+    return {"rss_mb": round(current, 1), "peak_rss_mb": round(peak_mb, 1)}
+
+
+def _exact_top_k(embedder: StubEmbedder, texts: List[str], queries: np.ndarray, k: int, chunk: int = 50_000) -> np.ndarray:
+    """Ground truth: L2 eksak (id SQLite = indeks + 1), dihitung per potongan supaya RAM aman."""
+    best_d = np.full((len(queries), k), np.inf, dtype=np.float32)
+    best_i = np.full((len(queries), k), -1, dtype=np.int64)
+    for start in range(0, len(texts), chunk):
+        block = embedder.encode(texts[start:start + chunk])
+        dist = (queries ** 2).sum(1)[:, None] - 2 * queries @ block.T + (block ** 2).sum(1)[None, :]
+        ids = np.arange(start + 1, start + 1 + len(block), dtype=np.int64)
+        all_d = np.concatenate([best_d, dist.astype(np.float32)], axis=1)
+        all_i = np.concatenate([best_i, np.broadcast_to(ids, dist.shape)], axis=1)
+        order = np.argsort(all_d, axis=1)[:, :k]
+        best_d = np.take_along_axis(all_d, order, axis=1)
+        best_i = np.take_along_axis(all_i, order, axis=1)
+    return best_i
+
+
+def _configure(db_path: Path, index_factory: str) -> None:
+    os.environ["MEMORY_DB_PATH"] = str(db_path)
+    os.environ["MEMORY_INDEX_FACTORY"] = index_factory
+    from app import config
+
+    config.get_settings.cache_clear()  # type: ignore[attr-defined]
+
+
+def run_case(
+    size: int,
+    index_factory: str,
+    *,
+    embedder: Any,
+    stub: Optional[StubEmbedder],
+    queries: int,
+    upserts: int,
+    top_k: int,
+    seed: int,
+    workdir: Path,
+) -> Dict[str, Any]:
+    from app.services import memory
+
+    rng = random.Random(seed)
+    db_path = workdir / f"bench-{size}-{index_factory.replace(',', '_')}.db"
+    _configure(db_path, index_factory)
+
+    # Reset state modul memori, lalu pakai embedder benchmark
+    memory.index = None
+    memory.is_initialized = False
+    memory.embedding_model = embedder
+    memory.embedding_model_name = None
+    memory.index_meta = None
+    memory.init_memory_system()
+
+    texts = [_memory_text(rng, i) for i in range(size)]
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany("INSERT INTO memories(type, text) VALUES('fact', ?)", ((t,) for t in texts))
+        conn.commit()
+
+    started = time.perf_counter()
+    memory._lazy_init_model_and_index()
+    rebuild_s = time.perf_counter() - started
+
+    query_rows = rng.sample(range(size), min(queries, size))
+    query_texts = [_query_from(texts[i], rng) for i in query_rows]
+    latencies: List[float] = []
+    found: List[List[int]] = []
+    for query in query_texts:
+        started = time.perf_counter()
+        hits = memory.search_memory(query, top_k)
+        latencies.append(time.perf_counter() - started)
+        found.append([row["id"] for row in hits])
+
+    recall: Optional[float] = None
+    if stub is not None:
+        truth = _exact_top_k(stub, texts, stub.encode(query_texts), top_k)
+        overlaps = [len(set(f) & set(t.tolist())) / top_k for f, t in zip(found, truth)]
+        recall = round(statistics.fmean(overlaps), 4) if overlaps else None
+
+    started = time.perf_counter()
+    for i in range(upserts):
+        memory.upsert_memory("fact", _memory_text(rng, size + i))
+    upsert_s = time.perf_counter() - started
+
+    result: Dict[str, Any] = {
+        "size": size,
+        "index_factory": index_factory,
+        "index_vectors": int(memory.index.ntotal) if memory.index is not None else 0,
+        "rebuild_s": round(rebuild_s, 3),
+        "upserts": upserts,
+        "upsert_per_s": round(upserts / upsert_s, 1) if upsert_s else None,
+        "search_queries": len(latencies),
+        "search_p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+        "search_p99_ms": round(_percentile(latencies, 99) * 1000, 3),
+        f"recall_at_{top_k}": recall,
+        **_rss_mb(),
+    }
+    for suffix in ("", "-wal", "-shm"):
+        Path(str(db_path) + suffix).unlink(missing_ok=True)
+    (db_path.parent / memory.INDEX_FILE).unlink(missing_ok=True)
+    (db_path.parent / memory.META_FILE).unlink(missing_ok=True)
+    return result
+
+
+def main(argv: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="Benchmark memori (SQLite + FAISS).")
+    parser.add_argument("--sizes", default="10000", help="Jumlah memori, dipisah koma (mis. 10000,100000,1000000).")
+    parser.add_argument(
+        "--index", default="Flat",
+        help="String faiss.index_factory, dipisah ';' (mis. 'Flat;HNSW32;IVF1024,Flat').",
+    )
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--upserts", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--embedder", choices=("stub", "minilm"), default="stub")
+    parser.add_argument("--dim", type=int, default=384, help="Dimensi embedder stub.")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", type=Path, help="Simpan hasil sebagai JSON di path ini.")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    factories = [f.strip() for f in args.index.split(";") if f.strip()]
+
+    stub: Optional[StubEmbedder] = None
+    if args.embedder == "stub":
+        stub = StubEmbedder(args.dim)
+        embedder: Any = stub
+    else:
+        from app.config import get_settings
+        from sentence_transformers import SentenceTransformer
+
+        embedder = SentenceTransformer(get_settings().embedding_model)
+
+    results: List[Dict[str, Any]] = []
+    with tempfile.TemporaryDirectory(prefix="bench-memory-") as tmp:
+        for size in sizes:
+            for factory in factories:
+                result = run_case(
+                    size, factory, embedder=embedder, stub=stub, queries=args.queries,
+                    upserts=args.upserts, top_k=args.top_k, seed=args.seed, workdir=Path(tmp),
+                )
+                results.append(result)
+                print(json.dumps(result), flush=True)
+
+    import faiss
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "faiss": getattr(faiss, "__version__", "unknown"),
+            "embedder": args.embedder,
+            "dim": embedder.get_sentence_embedding_dimension(),
+            "seed": args.seed,
+            "top_k": args.top_k,
+        },
+        "results": results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Hasil disimpan ke {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
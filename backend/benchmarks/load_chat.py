@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Generator beban untuk /chat (SSE).
+
+Menjalankan N sesi /chat bersamaan lalu melaporkan throughput, distribusi TTFT
+dan jeda antar-token, error rate per jenis, serta lag event loop (server dari
+/metrics, klien dari loop generator sendiri). Pasangkan dengan
+benchmarks.mock_gemini supaya bisa jalan di laptop tanpa kuota Gemini:
+
+    python -m benchmarks.mock_gemini --port 8765 &
+    GEMINI_API_ROOT=http://127.0.0.1:8765 GEMINI_API_KEY=mock uvicorn app.main:app --port 8000 &
+    python -m benchmarks.load_chat --url http://127.0.0.1:8000 --concurrency 32 --requests 500
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import re
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import httpx
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+# Tanpa kata pemicu pencarian web (lihat call_gemini_stream) supaya beban murni chat
+PROMPTS = [
+    "Halo Linda, hari ini aku capek banget habis kerja.",
+    "Ceritain dong lagu favorit kamu minggu ini.",
+    "Aku lagi belajar masak nasi goreng, ada tips?",
+    "Menurut kamu enaknya liburan ke pantai atau gunung?",
+    "Temenin aku ngobrol bentar sebelum tidur ya.",
+]
+
+_LOOP_LAG_RE = re.compile(r"^linda_event_loop_lag_seconds\s+(\S+)$", re.MULTILINE)
+
+
+def _percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p90": None, "p99": None, "max": None}
+    ordered = sorted(values)
+
+    def pick(pct: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))] * 1000, 2)
+
+    return {"p50": pick(50), "p90": pick(90), "p99": pick(99), "max": round(ordered[-1] * 1000, 2)}
+
+
+async def run_session(
+    client: httpx.AsyncClient, base_url: str, payload: Dict[str, Any], headers: Dict[str, str]
+) -> Dict[str, Any]:
+    """Satu request /chat sampai event done; return TTFT, jeda antar-token, dan error (kalau ada)."""
+    started = time.perf_counter()
+    result: Dict[str, Any] = {"error": None, "ttft": None, "gaps": [], "tokens": 0}
+    last_token: Optional[float] = None
+    event = "message"
+    done = False
+    try:
+        async with client.stream("POST", f"{base_url}/chat", json=payload, headers=headers) as response:
+            if response.status_code != 200:
+                await response.aread()
+                result["error"] = f"http_{response.status_code}"
+                return result
+            async for line in response.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line == "":
+                    event = "message"
+                elif line.startswith("data:"):
+                    now = time.perf_counter()
+                    if event == "token":
+                        if last_token is None:
+                            result["ttft"] = now - started
+                        else:
+                            result["gaps"].append(now - last_token)
+                        last_token = now
+                        result["tokens"] += 1
+                    elif event == "error":
+                        result["error"] = "sse_error"
+                    elif event == "done":
+                        done = True
+    except httpx.TimeoutException:
+        result["error"] = "timeout"
+    except httpx.HTTPError:
+        result["error"] = "connection"
+    if result["error"] is None and not done:
+        result["error"] = "incomplete"
+    result["duration"] = time.perf_counter() - started
+    return result
+
+
+async def _watch_client_loop(samples: List[float], stop: asyncio.Event, interval: float = 0.1) -> None:
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - started - interval))
+
+
+async def _scrape_server_loop(
+    client: httpx.AsyncClient, base_url: str, samples: List[float], stop: asyncio.Event, interval: float
+) -> None:
+    while not stop.is_set():
+        try:
+            response = await client.get(f"{base_url}/metrics")
+            match = _LOOP_LAG_RE.search(response.text)
+            if match:
+                samples.append(float(match.group(1)))
+        except httpx.HTTPError:
+            pass
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(stop.wait(), interval)
+
+
+async def run_load(
+    base_url: str,
+    *,
+    concurrency: int = 8,
+    requests: int = 50,
+    api_key: Optional[str] = None,
+    unique_prompts: bool = True,
+    timeout: float = 60.0,
+    metrics_interval: float = 1.0,
+) -> Dict[str, Any]:
+    base_url = base_url.rstrip("/")
+    headers = {"X-Gemini-Api-Key": api_key} if api_key else {}
+    queue: "asyncio.Queue[int]" = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(i)
+    results: List[Dict[str, Any]] = []
+
+    limits = httpx.Limits(max_connections=concurrency + 2, max_keepalive_connections=concurrency + 2)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+
+        async def worker() -> None:
+            while True:
+                try:
+                    i = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                text = PROMPTS[i % len(PROMPTS)]
+                if unique_prompts:
+                    # Nomor unik melewati response cache & single-flight, jadi tiap sesi benar-benar generate
+                    text = f"{text} (sesi {i})"
+                payload = {"messages": [{"role": "user", "content": text}], "persona": "ceria"}
+                results.append(await run_session(client, base_url, payload, headers))
+
+        stop = asyncio.Event()
+        client_lag: List[float] = []
+        server_lag: List[float] = []
+        watchers = [
+            asyncio.create_task(_watch_client_loop(client_lag, stop)),
+            asyncio.create_task(_scrape_server_loop(client, base_url, server_lag, stop, metrics_interval)),
+        ]
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+        stop.set()
+        await asyncio.gather(*watchers, return_exceptions=True)
+
+    errors = Counter(r["error"] for r in results if r["error"])
+    ok = [r for r in results if not r["error"]]
+    tokens = sum(r["tokens"] for r in results)
+    return {
+        "requests": len(results),
+        "concurrency": concurrency,
+        "wall_s": round(wall, 3),
+        "completed": len(ok),
+        "requests_per_s": round(len(ok) / wall, 2) if wall else None,
+        "tokens_per_s": round(tokens / wall, 1) if wall else None,
+        "error_rate": round(sum(errors.values()) / len(results), 4) if results else 0.0,
+        "errors": dict(errors),
+        "ttft_ms": _percentiles([r["ttft"] for r in results if r["ttft"] is not None]),
+        "inter_token_ms": _percentiles([gap for r in results for gap in r["gaps"]]),
+        "duration_ms": _percentiles([r["duration"] for r in ok]),
+        "server_loop_lag_ms": _percentiles(server_lag),
+        "client_loop_lag_ms": _percentiles(client_lag),
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="Uji beban /chat (SSE).")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Base URL backend.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Jumlah sesi yang berjalan bersamaan.")
+    parser.add_argument("--requests", type=int, default=50, help="Total request /chat.")
+    parser.add_argument("--api-key", help="Dikirim sebagai X-Gemini-Api-Key (kosong = pool key server).")
+    parser.add_argument(
+        "--repeat-prompts", action="store_true",
+        help="Pakai prompt yang sama berulang (menguji cache & single-flight, bukan generasi).",
+    )
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--output", type=Path, help="Simpan laporan JSON di path ini.")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_load(
+        args.url,
+        concurrency=args.concurrency,
+        requests=args.requests,
+        api_key=args.api_key,
+        unique_prompts=not args.repeat_prompts,
+        timeout=args.timeout,
+    ))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+"""
+Mock lokal API Gemini (streamGenerateContent, generateContent, list models,
+cachedContents).
+
+Memutar ulang fixture SSE hasil rekaman dengan jeda token yang realistis, dan
+bisa menyuntikkan 404/429/5xx atau token pertama yang lambat. Backend diarahkan
+ke sini lewat GEMINI_API_ROOT. Contoh (dari folder backend/):
+
+    python -m benchmarks.mock_gemini --port 8765 --first-token-delay 0.4 \
+        --token-interval 0.03 --fail gemini-2.5-flash=429:0.1
+    GEMINI_API_ROOT=http://127.0.0.1:8765 GEMINI_API_KEY=mock uvicorn app.main:app
+
+Konfigurasi bisa diubah saat jalan lewat POST /_mock/config, hitungan request
+dibaca di GET /_mock/stats. `prompt_chars`/`cached_chars` di stats mencatat
+input yang diproses per request vs yang dibaca dari cache; dengan
+--prefill-per-kchar, input yang tidak dicache ikut menambah jeda token pertama.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+DEFAULT_FIXTURE = FIXTURES_DIR / "gemini_stream.sse"
+
+# Teks cadangan kalau fixture tidak ada; dipecah per kata seperti chunk Gemini
+FALLBACK_REPLY = (
+    "Hai! Aku Linda. Hari ini aku lagi santai, habis dengerin lagu sambil minum teh. "
+    "Kamu sendiri gimana, ada cerita seru? Aku siap dengerin kok."
+)
+
+
+def load_fixture(path: Path) -> List[str]:
+    """Ambil potongan teks dari rekaman SSE Gemini (baris `data: {...}`)."""
+    chunks: List[str] = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if not line.startswith("data:"):
+            continue
+        try:
+            data = json.loads(line[len("data:"):].strip())
+        except json.JSONDecodeError:
+            continue
+        for candidate in data.get("candidates", []):
+            for part in candidate.get("content", {}).get("parts", []):
+                if part.get("text"):
+                    chunks.append(part["text"])
+    return chunks
+
+
+def _split_words(text: str, words_per_chunk: int = 3) -> List[str]:
+    words = re.findall(r"\S+\s*", text)
+    return ["".join(words[i:i + words_per_chunk]) for i in range(0, len(words), words_per_chunk)]
+
+
+class MockConfig:
+    """Perilaku mock. Semua jeda dalam detik, semua rate dalam 0..1."""
+
+    def __init__(
+        self,
+        chunks: Optional[List[str]] = None,
+        first_token_delay: float = 0.3,
+        token_interval: float = 0.03,
+        jitter: float = 0.3,
+        slow_first_token_rate: float = 0.0,
+        slow_first_token_delay: float = 3.0,
+        failures: Optional[Dict[str, List[Tuple[int, float]]]] = None,
+        retry_after: float = 1.0,
+        seed: Optional[int] = None,
+        prefill_per_kchar: float = 0.0,
+        cache_min_chars: int = 0,
+    ) -> None:
+        self.chunks = chunks or _split_words(FALLBACK_REPLY)
+        self.first_token_delay = first_token_delay
+        self.token_interval = token_interval
+        self.jitter = jitter
+        self.slow_first_token_rate = slow_first_token_rate
+        self.slow_first_token_delay = slow_first_token_delay
+        # model (atau "*") -> [(status, peluang)], dicek berurutan
+        self.failures: Dict[str, List[Tuple[int, float]]] = failures or {}
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        # Biaya "prefill": detik tambahan per 1000 karakter input yang tidak dicache
+        self.prefill_per_kchar = prefill_per_kchar
+        # Seperti minimum token cache Gemini: systemInstruction lebih pendek dari ini ditolak
+        self.cache_min_chars = cache_min_chars
+
+    def update(self, values: Dict[str, Any]) -> None:
+        for name, value in values.items():
+            if name == "failures":
+                value = parse_failures(value) if isinstance(value, list) else {
+                    model: [(int(s), float(p)) for s, p in rules] for model, rules in value.items()
+                }
+            if name == "chunks" and isinstance(value, str):
+                value = _split_words(value)
+            if not hasattr(self, name) or name == "rng":
+                raise ValueError(f"Opsi mock tidak dikenal: {name}")
+            setattr(self, name, value)
+
+    def pick_failure(self, model: str) -> Optional[int]:
+        for rule_model in (model, "*"):
+            for status, probability in self.failures.get(rule_model, []):
+                if self.rng.random() < probability:
+                    return status
+        return None
+
+    def delay(self, base: float) -> float:
+        if base <= 0:
+            return 0.0
+        return max(0.0, self.rng.gauss(base, base * self.jitter))
+
+
+def parse_failures(specs: Sequence[str]) -> Dict[str, List[Tuple[int, float]]]:
+    """`MODEL=STATUS[:PELUANG]`, mis. `gemini-2.5-flash=404` atau `*=503:0.05`."""
+    failures: Dict[str, List[Tuple[int, float]]] = {}
+    for spec in specs:
+        model, _, rule = spec.partition("=")
+        status, _, probability = rule.partition(":")
+        if not model or not status:
+            raise ValueError(f"Format --fail salah: {spec!r} (pakai MODEL=STATUS[:PELUANG])")
+        failures.setdefault(model.strip(), []).append((int(status), float(probability or 1.0)))
+    return failures
+
+
+def _error_body(status: int, message: Optional[str] = None) -> Dict[str, Any]:
+    reasons = {
+        400: "INVALID_ARGUMENT", 403: "PERMISSION_DENIED", 404: "NOT_FOUND",
+        429: "RESOURCE_EXHAUSTED", 500: "INTERNAL", 503: "UNAVAILABLE",
+    }
+    return {"error": {
+        "code": status, "message": message or f"Mock error {status}", "status": reasons.get(status, "UNKNOWN"),
+    }}
+
+
+def _chunk_payload(text: str, finish: bool = False, usage: Optional[Dict[str, int]] = None) -> str:
+    candidate: Dict[str, Any] = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+    if finish:
+        candidate["finishReason"] = "STOP"
+    body: Dict[str, Any] = {"candidates": [candidate]}
+    if finish and usage:
+        body["usageMetadata"] = usage
+    return json.dumps(body, ensure_ascii=False)
+
+
+def _instruction_text(body: Dict[str, Any]) -> str:
+    instruction = body.get("systemInstruction") or body.get("system_instruction") or {}
+    return "".join(part.get("text", "") for part in instruction.get("parts", []))
+
+
+def _input_chars(body: Dict[str, Any]) -> int:
+    contents = sum(
+        len(part.get("text", "")) for content in body.get("contents", []) for part in content.get("parts", [])
+    )
+    return len(_instruction_text(body)) + contents
+
+
+def _expire_time(ttl_seconds: float) -> str:
+    return (datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _parse_ttl(value: Any, default: float = 3600.0) -> float:
+    if isinstance(value, str) and value.endswith("s"):
+        return float(value[:-1])
+    return default
+
+
+def create_app(config: Optional[MockConfig] = None) -> FastAPI:
+    config = config or MockConfig()
+    app = FastAPI(title="Mock Gemini")
+    stats: Dict[str, int] = {
+        "stream": 0, "generate": 0, "list": 0, "injected_errors": 0, "slow_first_token": 0,
+        "cache_create": 0, "cache_refresh": 0, "cache_rejected": 0, "cached_requests": 0,
+        "prompt_chars": 0, "cached_chars": 0,
+    }
+    # name -> {"key", "model", "text", "expires"}; mensimulasikan cachedContents per API key
+    caches: Dict[str, Dict[str, Any]] = {}
+    app.state.config = config
+    app.state.stats = stats
+    app.state.caches = caches
+
+    def _check_key(request: Request) -> Optional[JSONResponse]:
+        key = request.query_params.get("key", "")
+        if not key or key.startswith("bad"):
+            return JSONResponse(
+                {"error": {"code": 400, "message": "API key not valid.", "status": "INVALID_ARGUMENT"}},
+                status_code=400,
+            )
+        return None
+
+    def _injected(model: str) -> Optional[JSONResponse]:
+        status = config.pick_failure(model)
+        if status is None:
+            return None
+        stats["injected_errors"] += 1
+        headers = {"Retry-After": str(int(config.retry_after))} if status == 429 else None
+        return JSONResponse(_error_body(status), status_code=status, headers=headers)
+
+    def _live_cache(name: str, key: str) -> Tuple[Optional[Dict[str, Any]], Optional[JSONResponse]]:
+        cache = caches.get(name)
+        if cache is None or cache["expires"] <= time.monotonic():
+            caches.pop(name, None)
+            return None, JSONResponse(_error_body(404, f"CachedContent not found: {name}"), status_code=404)
+        if cache["key"] != key:
+            return None, JSONResponse(_error_body(403, "CachedContent belongs to another project."), status_code=403)
+        return cache, None
+
+    def _account_input(body: Dict[str, Any], key: str) -> Tuple[Optional[JSONResponse], float, Dict[str, int]]:
+        """Validasi cachedContent, catat karakter input, dan hitung jeda prefill."""
+        cached_chars = 0
+        name = body.get("cachedContent")
+        if name:
+            if _instruction_text(body):
+                return JSONResponse(_error_body(
+                    400, "CachedContent can not be used with GenerateContent request setting system_instruction.",
+                ), status_code=400), 0.0, {}
+            cache, rejected = _live_cache(name, key)
+            if rejected is not None:
+                stats["cache_rejected"] += 1
+                return rejected, 0.0, {}
+            cached_chars = len(cache["text"])
+            stats["cached_requests"] += 1
+        uncached = _input_chars(body)
+        stats["prompt_chars"] += uncached
+        stats["cached_chars"] += cached_chars
+        usage = {
+            "promptTokenCount": (uncached + cached_chars) // 4,
+            "cachedContentTokenCount": cached_chars // 4,
+        }
+        return None, config.prefill_per_kchar * uncached / 1000, usage
+
+    @app.post("/{version}/cachedContents")
+    async def create_cache(version: str, request: Request):
+        rejected = _check_key(request)
+        if rejected is not None:
+            return rejected
+        if version != "v1beta":
+            return JSONResponse(_error_body(404), status_code=404)
+        body = await request.json()
+        text = _instruction_text(body)
+        if len(text) < config.cache_min_chars:
+            return JSONResponse(_error_body(
+                400, f"Cached content is too small. min_total_token_count={config.cache_min_chars // 4}",
+            ), status_code=400)
+        ttl = _parse_ttl(body.get("ttl"))
+        name = f"cachedContents/{uuid.uuid4().hex[:16]}"
+        caches[name] = {
+            "key": request.query_params["key"], "model": body.get("model"), "text": text,
+            "expires": time.monotonic() + ttl,
+        }
+        stats["cache_create"] += 1
+        return {
+            "name": name, "model": body.get("model"), "displayName": body.get("displayName", ""),
+            "expireTime": _expire_time(ttl), "usageMetadata": {"totalTokenCount": len(text) // 4},
+        }
+
+    @app.patch("/{version}/cachedContents/{cache_id}")
+    async def update_cache(version: str, cache_id: str, request: Request):
+        rejected = _check_key(request)
+        if rejected is not None:
+            return rejected
+        cache, rejected = _live_cache(f"cachedContents/{cache_id}", request.query_params["key"])
+        if rejected is not None:
+            return rejected
+        ttl = _parse_ttl((await request.json()).get("ttl"))
+        cache["expires"] = time.monotonic() + ttl
+        stats["cache_refresh"] += 1
+        return {"name": f"cachedContents/{cache_id}", "model": cache["model"], "expireTime": _expire_time(ttl)}
+
+    @app.delete("/{version}/cachedContents/{cache_id}")
+    async def delete_cache(version: str, cache_id: str, request: Request):
+        rejected = _check_key(request)
+        if rejected is not None:
+            return rejected
+        if caches.pop(f"cachedContents/{cache_id}", None) is None:
+            return JSONResponse(_error_body(404), status_code=404)
+        return {}
+
+    @app.get("/{version}/models")
+    async def list_models(version: str, request: Request):
+        stats["list"] += 1
+        rejected = _check_key(request)
+        if rejected is not None:
+            return rejected
+        return {"models": [{"name": "models/gemini-2.5-flash"}, {"name": "models/gemini-1.5-flash"}]}
+
+    @app.post("/{version}/models/{target}")
+    async def generate(version: str, target: str, request: Request):
+        model, _, action = target.partition(":")
+        rejected = _check_key(request)
+        if rejected is not None:
+            return rejected
+        body = await request.json()
+        rejected, prefill, usage = _account_input(body, request.query_params["key"])
+        if rejected is not None:
+            return rejected
+
+        if action == "generateContent":
+            stats["generate"] += 1
+            failure = _injected(model)
+            if failure is not None:
+                return failure
+            await asyncio.sleep(config.delay(config.first_token_delay) + prefill)
+            prompt = " ".join(
+                part.get("text", "")
+                for content in body.get("contents", [])
+                for part in content.get("parts", [])
+            )
+            if '"emotion"' in prompt:
+                text = json.dumps({"emotion": "happy", "intensity": 0.6, "color": "#FFD166", "glow": "#FFE29A"})
+            else:
+                text = "".join(config.chunks)
+            return json.loads(_chunk_payload(text, finish=True, usage=usage))
+
+        if action != "streamGenerateContent":
+            return JSONResponse(_error_body(404), status_code=404)
+
+        stats["stream"] += 1
+        failure = _injected(model)
+        if failure is not None:
+            return failure
+
+        first_delay = config.first_token_delay
+        if config.slow_first_token_rate and config.rng.random() < config.slow_first_token_rate:
+            stats["slow_first_token"] += 1
+            first_delay = config.slow_first_token_delay
+
+        async def replay():
+            await asyncio.sleep(config.delay(first_delay) + prefill)
+            last = len(config.chunks) - 1
+            for i, chunk in enumerate(config.chunks):
+                if i:
+                    await asyncio.sleep(config.delay(config.token_interval))
+                yield f"data: {_chunk_payload(chunk, finish=i == last, usage=usage)}\r\n\r\n"
+
+        return StreamingResponse(replay(), media_type="text/event-stream")
+
+    @app.get("/_mock/stats")
+    async def mock_stats():
+        return stats
+
+    @app.post("/_mock/config")
+    async def mock_config(request: Request):
+        try:
+            config.update(await request.json())
+        except (ValueError, TypeError) as e:
+            return JSONResponse({"detail": str(e)}, status_code=400)
+        return {"ok": True}
+
+    return app
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Mock lokal API Gemini untuk uji beban.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fixture", type=Path, default=DEFAULT_FIXTURE, help="Rekaman SSE Gemini yang diputar ulang.")
+    parser.add_argument("--first-token-delay", type=float, default=0.3)
+    parser.add_argument("--token-interval", type=float, default=0.03)
+    parser.add_argument("--jitter", type=float, default=0.3, help="Simpangan relatif jeda (0 = tetap).")
+    parser.add_argument("--slow-first-token-rate", type=float, default=0.0)
+    parser.add_argument("--slow-first-token-delay", type=float, default=3.0)
+    parser.add_argument(
+        "--fail", action="append", default=[],
+        help="Suntik error: MODEL=STATUS[:PELUANG], boleh berulang (mis. '*=503:0.05').",
+    )
+    parser.add_argument(
+        "--prefill-per-kchar", type=float, default=0.0,
+        help="Jeda tambahan token pertama per 1000 karakter input yang tidak dicache.",
+    )
+    parser.add_argument(
+        "--cache-min-chars", type=int, default=0,
+        help="systemInstruction lebih pendek dari ini ditolak saat membuat cachedContents.",
+    )
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    chunks = load_fixture(args.fixture) if args.fixture.exists() else None
+    config = MockConfig(
+        chunks=chunks,
+        first_token_delay=args.first_token_delay,
+        token_interval=args.token_interval,
+        jitter=args.jitter,
+        slow_first_token_rate=args.slow_first_token_rate,
+        slow_first_token_delay=args.slow_first_token_delay,
+        failures=parse_failures(args.fail),
+        seed=args.seed,
+        prefill_per_kchar=args.prefill_per_kchar,
+        cache_min_chars=args.cache_min_chars,
+    )
+
+    import uvicorn
+
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
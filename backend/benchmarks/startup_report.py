@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Laporan waktu startup ala `python -X importtime`.
+
+Mengimpor modul (default app.main) di proses baru dengan -X importtime, lalu
+melaporkan total waktu impor, modul termahal, dan dependensi berat yang ikut
+termuat padahal seharusnya malas. Contoh (dari folder backend/):
+
+    python -m benchmarks.startup_report --top 15 --budget-ms 1000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# Harus tetap tidak termuat setelah `import app.main`
+HEAVY_MODULES = ("torch", "transformers", "sentence_transformers", "faiss", "numpy", "PIL", "duckduckgo_search")
+
+
+def measure_imports(module: str = "app.main") -> Dict[str, Any]:
+    """Jalankan `python -X importtime -c "import <module>"` dan parse hasilnya (mikrodetik)."""
+    probe = (
+        f"import sys, json; import {module}; "
+        f"print(json.dumps([m for m in {list(HEAVY_MODULES)!r} if m in sys.modules]))"
+    )
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    modules: List[Dict[str, Any]] = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append({
+            "name": name.strip(),
+            "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+            "self_us": int(self_us),
+            "cumulative_us": int(cumulative_us),
+        })
+    target = next((m for m in modules if m["name"] == module), None)
+    return {
+        "module": module,
+        "total_ms": round(target["cumulative_us"] / 1000, 1) if target else None,
+        "heavy_loaded": json.loads(proc.stdout.strip().splitlines()[-1]),
+        "modules": modules,
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Laporan waktu impor startup.")
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--top", type=int, default=15, help="Jumlah modul termahal (cumulative) yang ditampilkan.")
+    parser.add_argument("--budget-ms", type=float, help="Gagal (exit 1) kalau total impor melebihi ini.")
+    args = parser.parse_args(argv)
+
+    report = measure_imports(args.module)
+    print(f"Impor {report['module']}: {report['total_ms']} ms")
+    print(f"Dependensi berat yang termuat: {', '.join(report['heavy_loaded']) or '-'}")
+    # Hanya modul pihak ketiga/aplikasi level atas, supaya daftar tidak didominasi submodul
+    top_level = [m for m in report["modules"] if m["depth"] <= 1 and m["name"] != args.module]
+    for item in sorted(top_level, key=lambda m: m["cumulative_us"], reverse=True)[: args.top]:
+        print(f"  {item['cumulative_us'] / 1000:9.1f} ms  {item['name']}")
+
+    over_budget = args.budget_ms is not None and (report["total_ms"] or 0) > args.budget_ms
+    if over_budget:
+        print(f"Melebihi budget {args.budget_ms} ms!")
+    return 1 if over_budget or report["heavy_loaded"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
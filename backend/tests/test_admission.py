@@ -0,0 +1,74 @@
+import asyncio
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import pytest
+
+from app.services.admission import AdmissionController, AdmissionRejected, Priority
+
+
+def test_higher_priority_waiter_is_served_first():
+    async def scenario():
+        controller = AdmissionController(global_limit=1, per_key_limit=1, max_queue=10, queue_timeout=5)
+        holder = await controller.acquire(Priority.CHAT)
+        order = []
+
+        async def wait_for(priority):
+            ticket = await controller.acquire(priority)
+            order.append(priority)
+            ticket.release()
+
+        tasks = [
+            asyncio.create_task(wait_for(Priority.BULK_WRITE)),
+            asyncio.create_task(wait_for(Priority.EMOTION)),
+            asyncio.create_task(wait_for(Priority.CHAT)),
+        ]
+        await asyncio.sleep(0)
+        holder.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == [Priority.CHAT, Priority.EMOTION, Priority.BULK_WRITE]
+
+
+def test_per_key_limit_does_not_block_other_keys():
+    async def scenario():
+        controller = AdmissionController(global_limit=10, per_key_limit=1, max_queue=10, queue_timeout=0.05)
+        await controller.acquire(Priority.CHAT, "key-a")
+        other = await controller.acquire(Priority.CHAT, "key-b")
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire(Priority.CHAT, "key-a")
+        return other
+
+    assert asyncio.run(scenario()).key is not None
+
+
+def test_full_queue_fast_fails_and_evicts_lower_priority():
+    async def scenario():
+        controller = AdmissionController(global_limit=1, per_key_limit=1, max_queue=1, queue_timeout=5)
+        holder = await controller.acquire(Priority.CHAT)
+        bulk = asyncio.create_task(controller.acquire(Priority.BULK_WRITE))
+        await asyncio.sleep(0)
+
+        # Prioritas sama/lebih rendah langsung ditolak dengan Retry-After
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire(Priority.BULK_WRITE)
+        assert rejected.value.retry_after >= 1
+
+        # Chat menggeser bulk write dari antrean
+        chat = asyncio.create_task(controller.acquire(Priority.CHAT))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected):
+            await bulk
+        holder.release()
+        ticket = await chat
+        ticket.release()
+        return controller.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["active"] == 0
+    assert stats["rejected"] == 2
@@ -0,0 +1,39 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import pytest
+
+from benchmarks import bench_memory
+
+
+@pytest.fixture()
+def isolated_memory(monkeypatch):
+    from app import config
+    from app.services import memory
+
+    monkeypatch.setattr(memory, "embedding_model", None)
+    monkeypatch.setattr(memory, "index", None)
+    monkeypatch.setattr(memory, "is_initialized", False)
+    monkeypatch.delenv("MEMORY_DB_PATH", raising=False)
+    monkeypatch.delenv("MEMORY_INDEX_FACTORY", raising=False)
+    yield memory
+    config.get_settings.cache_clear()  # type: ignore[attr-defined]
+
+
+def test_benchmark_reports_each_size_and_index(isolated_memory, tmp_path):
+    output = tmp_path / "bench.json"
+    report = bench_memory.main([
+        "--sizes", "300", "--index", "Flat;HNSW16", "--queries", "20",
+        "--upserts", "5", "--dim", "32", "--output", str(output),
+    ])
+
+    assert output.exists()
+    assert [(r["size"], r["index_factory"]) for r in report["results"]] == [(300, "Flat"), (300, "HNSW16")]
+    flat = report["results"][0]
+    assert flat["index_vectors"] == 305
+    assert flat["recall_at_5"] == 1.0
+    assert flat["search_p99_ms"] >= flat["search_p50_ms"] > 0
@@ -0,0 +1,57 @@
+import asyncio
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.schemas import Message
+from app.services.cache import ResponseCache, build_cache_key
+
+
+def test_cache_key_covers_context_and_hides_image_payload():
+    history = [Message(role="user", content="Halo")]
+    base = build_cache_key("ceria", "persona", history)
+
+    assert base != build_cache_key("ceria", "persona + memori", history)
+    assert base != build_cache_key("tsundere", "persona", history)
+    with_image = build_cache_key("ceria", "persona", history, "A" * 100_000)
+    assert len(with_image) == len(base) == 64
+
+
+def test_l1_is_bounded_by_bytes_and_ttl():
+    cache = ResponseCache(max_bytes=300, ttl=60)
+
+    async def scenario():
+        for i in range(5):
+            await cache.put(f"key-{i}", "x" * 100)
+        assert cache.stats()["bytes"] <= 300
+        assert await cache.get("key-0") is None
+        assert await cache.get("key-4") == "x" * 100
+
+        cache.ttl = -1
+        await cache.put("stale", "y")
+        assert await cache.get("stale") is None
+
+    asyncio.run(scenario())
+    stats = cache.stats()
+    assert stats["evictions"] >= 2
+    assert 0 < stats["hit_ratio"] < 1
+
+
+def test_sqlite_l2_survives_restart_and_is_shared(tmp_path):
+    path = tmp_path / "response_cache.db"
+
+    async def scenario():
+        writer = ResponseCache(max_bytes=10_000, ttl=60, l2_path=path)
+        await writer.put("shared", "jawaban tersimpan")
+
+        reader = ResponseCache(max_bytes=10_000, ttl=60, l2_path=path)
+        first = await reader.get("shared")
+        second = await reader.get("shared")
+        return first, second, reader.stats()
+
+    first, second, stats = asyncio.run(scenario())
+    assert first == second == "jawaban tersimpan"
+    assert stats["l2_hits"] == 1 and stats["l1_hits"] == 1
@@ -0,0 +1,652 @@
+import asyncio
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import pytest
+
+
+def _parse_events(body: str):
+    events = []
+    for block in body.split("\n\n"):
+        if not block.strip() or block.startswith(":"):
+            continue
+        name, data = "message", []
+        for line in block.split("\n"):
+            if line.startswith("event:"):
+                name = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data.append(line[len("data:"):].strip())
+        events.append((name, "\n".join(data)))
+    return events
+
+
+@pytest.fixture()
+def chat_app(tmp_path, monkeypatch):
+    monkeypatch.setenv("MEMORY_DB_PATH", str(tmp_path / "memory.db"))
+    monkeypatch.setenv("EMOTION_LOCAL_EMBEDDINGS", "false")
+    monkeypatch.setenv("INTENT_LOCAL_EMBEDDINGS", "false")
+    monkeypatch.setenv("DISCONNECT_POLL_INTERVAL", "0.02")
+    monkeypatch.setenv("STREAM_RESUME_GRACE", "0.5")
+    monkeypatch.setenv("UPSTREAM_WARMUP", "false")
+
+    from app import config
+
+    config.get_settings.cache_clear()  # type: ignore[attr-defined]
+    from app import main
+    from app.services import admission, cache, emotion, streams
+
+    admission.get_admission_controller.cache_clear()
+    cache.get_response_cache.cache_clear()
+    streams.get_single_flight.cache_clear()
+    streams.get_stream_stats.cache_clear()
+    streams.get_stream_registry.cache_clear()
+    emotion.clear_emotion_cache()
+
+    upstream_calls = []
+
+    async def fake_stream(messages, system_prompt, **kwargs):
+        upstream_calls.append(messages[-1].content)
+        for token in ["Hehe ", "makasih ", "ya ^^ :D"]:
+            yield token
+
+    web_searches = []
+
+    async def fake_search(query):
+        # Pencarian web sungguhan (DuckDuckGo) membuat tes lambat dan bergantung jaringan
+        web_searches.append(query)
+        return ""
+
+    monkeypatch.setattr(main, "call_gemini_stream", fake_stream)
+    monkeypatch.setattr(main, "fetch_search_context", fake_search)
+    main.upstream_calls = upstream_calls  # type: ignore[attr-defined]
+    main.web_searches = web_searches  # type: ignore[attr-defined]
+    yield main
+    config.get_settings.cache_clear()  # type: ignore[attr-defined]
+
+
+def _client(main):
+    from fastapi.testclient import TestClient
+
+    return TestClient(main.app)
+
+
+def test_chat_emits_emotion_before_done(chat_app):
+    response = _client(chat_app).post(
+        "/chat",
+        json={"messages": [{"role": "user", "content": "Halo"}], "persona": "ceria", "emit_emotion": True},
+    )
+    events = _parse_events(response.text)
+    names = [name for name, _ in events]
+
+    assert names[-3:] == ["emotion", "timing", "done"]
+    assert '"emotion":"happy"' in events[-3][1]
+    assert "".join(data for name, data in events if name == "token").startswith("Hehe")
+
+
+def test_chat_without_flag_has_no_emotion_event(chat_app):
+    response = _client(chat_app).post(
+        "/chat", json={"messages": [{"role": "user", "content": "Halo lagi"}], "persona": "ceria"}
+    )
+    names = [name for name, _ in _parse_events(response.text)]
+    assert "emotion" not in names
+    assert names[-1] == "done"
+
+
+def test_chat_releases_admission_slot_and_rejects_when_saturated(chat_app):
+    from app.services.admission import get_admission_controller
+
+    client = _client(chat_app)
+    client.post("/chat", json={"messages": [{"role": "user", "content": "Halo"}]})
+    controller = get_admission_controller()
+    assert controller.stats()["active"] == 0
+
+    controller.max_queue = 0
+    held = [controller._grant(None) for _ in range(controller.global_limit)]
+    response = client.post("/chat", json={"messages": [{"role": "user", "content": "Halo"}]})
+    for ticket in held:
+        ticket.release()
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_cache_key_follows_history_not_just_last_message(chat_app):
+    client = _client(chat_app)
+    first = [{"role": "user", "content": "Halo"}]
+    other_history = [
+        {"role": "user", "content": "Aku lagi sedih banget hari ini, kerjaan numpuk."},
+        {"role": "assistant", "content": "Yaampun, sini cerita pelan-pelan ya, aku dengerin kok."},
+        {"role": "user", "content": "Halo"},
+    ]
+    client.post("/chat", json={"messages": first})
+    client.post("/chat", json={"messages": first})
+    client.post("/chat", json={"messages": other_history})
+
+    assert len(chat_app.upstream_calls) == 2
+
+
+def test_multipart_upload_streams_binary_image(chat_app, monkeypatch):
+    import base64
+    import io
+    import json
+
+    from PIL import Image
+
+    seen = []
+
+    async def image_stream(messages, system_prompt, **kwargs):
+        seen.append(kwargs.get("image_part"))
+        yield "Kucing lucu!"
+
+    monkeypatch.setattr(chat_app, "call_gemini_stream", image_stream)
+    buffer = io.BytesIO()
+    Image.new("RGB", (4, 4), "red").save(buffer, format="PNG")
+    png = buffer.getvalue()
+    body = {"messages": [{"role": "user", "content": "Ini gambar apa?"}]}
+
+    client = _client(chat_app)
+    response = client.post(
+        "/chat/upload",
+        data={"payload": json.dumps(body)},
+        files={"image": ("kucing.png", png, "application/octet-stream")},
+    )
+    assert response.status_code == 200
+    assert _parse_events(response.text)[-1][0] == "done"
+    # MIME diambil dari isi file, bukan content-type yang dikirim klien
+    assert seen == [{"inlineData": {"data": base64.b64encode(png).decode(), "mimeType": "image/png"}}]
+
+    both = client.post(
+        "/chat/upload",
+        data={"payload": json.dumps({**body, "image_base64": "AAAA"})},
+        files={"image": ("kucing.png", png, "image/png")},
+    )
+    invalid = client.post("/chat/upload", data={"payload": "{}"})
+    assert both.status_code == 400
+    assert invalid.status_code == 422
+
+    monkeypatch.setenv("IMAGE_UPLOAD_MAX_BYTES", "16")
+    from app import config
+    config.get_settings.cache_clear()  # type: ignore[attr-defined]
+    too_big = client.post(
+        "/chat/upload", data={"payload": json.dumps(body)}, files={"image": ("kucing.png", png, "image/png")},
+    )
+    assert too_big.status_code == 413
+    assert chat_app.get_admission_controller().stats()["active"] == 0
+
+
+def test_upload_limit_is_enforced_while_receiving(monkeypatch):
+    from starlette.requests import Request
+
+    from app.services import images
+
+    monkeypatch.setattr(images, "FORM_OVERHEAD_BYTES", 1024)
+    head = (
+        b'--batas\r\nContent-Disposition: form-data; name="image"; filename="besar.png"\r\n'
+        b"Content-Type: image/png\r\n\r\n"
+    )
+    chunks = [head] + [b"x" * 4096] * 100
+    received = []
+
+    async def receive():
+        received.append(chunks[len(received)])
+        return {"type": "http.request", "body": received[-1], "more_body": len(received) < len(chunks)}
+
+    def request(*headers):
+        content_type = (b"content-type", b"multipart/form-data; boundary=batas")
+        return Request({"type": "http", "method": "POST", "headers": [content_type, *headers]}, receive)
+
+    async def scenario():
+        # Content-Length yang kebesaran ditolak sebelum body dibaca sama sekali
+        with pytest.raises(images.ImageTooLarge):
+            await images.read_upload_form(
+                request((b"content-length", b"409600")), max_bytes=8192, spool_bytes=1024,
+            )
+        assert received == []
+        # Tanpa Content-Length (chunked): berhenti begitu batas terlewati, bukan setelah 400 KB
+        with pytest.raises(images.ImageTooLarge):
+            await images.read_upload_form(request(), max_bytes=8192, spool_bytes=1024)
+
+    asyncio.run(scenario())
+    assert len(received) <= 4
+
+
+def test_identical_concurrent_requests_share_one_upstream_stream(chat_app, monkeypatch):
+    import httpx
+
+    calls = []
+
+    async def slow_stream(messages, system_prompt, **kwargs):
+        calls.append(messages[-1].content)
+        for token in ["Satu ", "dua ", "tiga"]:
+            await asyncio.sleep(0.05)
+            yield token
+
+    monkeypatch.setattr(chat_app, "call_gemini_stream", slow_stream)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=chat_app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            body = {"messages": [{"role": "user", "content": "Selamat pagi"}]}
+            return await asyncio.gather(*(client.post("/chat", json=body) for _ in range(3)))
+
+    responses = asyncio.run(scenario())
+    assert len(calls) == 1
+    for response in responses:
+        tokens = [data for name, data in _parse_events(response.text) if name == "token"]
+        assert "".join(tokens).replace(" ", "") == "Satuduatiga"
+
+
+def test_concurrent_requests_with_different_keys_do_not_share_a_stream(chat_app, monkeypatch):
+    import httpx
+
+    keys = []
+
+    async def slow_stream(messages, system_prompt, api_key=None, **kwargs):
+        keys.append(api_key)
+        for token in ["Satu ", "dua"]:
+            await asyncio.sleep(0.05)
+            yield token
+
+    monkeypatch.setattr(chat_app, "call_gemini_stream", slow_stream)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=chat_app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            body = {"messages": [{"role": "user", "content": "Selamat pagi"}]}
+            return await asyncio.gather(
+                client.post("/chat", json=body, headers={"X-Gemini-Api-Key": "key-a"}),
+                client.post("/chat", json=body, headers={"X-Gemini-Api-Key": "key-b"}),
+                client.post("/chat", json=body),
+            )
+
+    responses = asyncio.run(scenario())
+    assert sorted(keys, key=str) == sorted(["key-a", "key-b", None], key=str)
+    assert all(response.status_code == 200 for response in responses)
+
+
+async def _post_chat_until_disconnect(app, payload, disconnect_after):
+    """Panggil /chat lewat ASGI mentah dan putuskan klien setelah N pesan terkirim."""
+    import json
+
+    body = json.dumps(payload).encode()
+    disconnect = asyncio.Event()
+    sent = []
+    first_receive = True
+
+    async def receive():
+        nonlocal first_receive
+        if first_receive:
+            first_receive = False
+            return {"type": "http.request", "body": body, "more_body": False}
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+        if len(sent) == disconnect_after:
+            disconnect.set()
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"},
+        "http_version": "1.1", "method": "POST", "scheme": "http", "path": "/chat",
+        "raw_path": b"/chat", "query_string": b"", "root_path": "",
+        "headers": [(b"content-type", b"application/json")],
+        "client": ("test", 1), "server": ("test", 80),
+    }
+    await asyncio.wait_for(app(scope, receive, send), timeout=5)
+    headers = dict(sent[0]["headers"])
+    text = b"".join(m.get("body", b"") for m in sent[1:]).decode()
+    return headers[b"x-stream-id"].decode(), text
+
+
+def test_client_disconnect_cancels_upstream_generation(chat_app, monkeypatch):
+    from app.services.streams import get_stream_stats
+
+    upstream_closed = asyncio.Event()
+
+    async def endless_stream(messages, system_prompt, **kwargs):
+        try:
+            while True:
+                await asyncio.sleep(0.01)
+                yield "bla "
+        finally:
+            upstream_closed.set()
+
+    monkeypatch.setattr(chat_app, "call_gemini_stream", endless_stream)
+
+    async def scenario():
+        payload = {"messages": [{"role": "user", "content": "Cerita panjang dong"}]}
+        await _post_chat_until_disconnect(chat_app.app, payload, disconnect_after=4)
+        await asyncio.wait_for(upstream_closed.wait(), timeout=5)
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    stats = get_stream_stats().snapshot()
+    assert stats["cancelled"] == 1
+    assert stats["tokens_before_cancel"] > 0
+    assert chat_app.get_admission_controller().stats()["active"] == 0
+
+
+def test_reconnect_with_last_event_id_resumes_without_new_generation(chat_app, monkeypatch):
+    import httpx
+
+    calls = []
+    words = [f"kata{i} " for i in range(12)]
+
+    async def slow_stream(messages, system_prompt, **kwargs):
+        calls.append(messages[-1].content)
+        for word in words:
+            await asyncio.sleep(0.02)
+            yield word
+
+    monkeypatch.setattr(chat_app, "call_gemini_stream", slow_stream)
+
+    async def scenario():
+        payload = {"messages": [{"role": "user", "content": "Ceritain sesuatu"}]}
+        stream_id, first_part = await _post_chat_until_disconnect(chat_app.app, payload, disconnect_after=4)
+        ids = [int(line[len("id:"):]) for line in first_part.split("\n") if line.startswith("id:")]
+        assert ids, first_part
+
+        transport = httpx.ASGITransport(app=chat_app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            resumed = await client.get(f"/chat/stream/{stream_id}", headers={"Last-Event-ID": str(ids[-1])})
+            missing = await client.get("/chat/stream/tidak-ada")
+        return first_part, resumed, missing
+
+    first_part, resumed, missing = asyncio.run(scenario())
+    assert resumed.status_code == 200
+    assert missing.status_code == 404
+    tokens = [data for name, data in _parse_events(first_part) + _parse_events(resumed.text) if name == "token"]
+    assert "".join(tokens).replace(" ", "") == "".join(words).replace(" ", "")
+    assert _parse_events(resumed.text)[-1][0] == "done"
+    assert len(calls) == 1
+
+
+def test_resume_outside_bounded_replay_window_is_gone(chat_app, monkeypatch):
+    import httpx
+    from app.services import streams
+
+    words = [f"kata{i} " for i in range(12)]
+
+    async def slow_stream(messages, system_prompt, **kwargs):
+        for word in words:
+            await asyncio.sleep(0.02)
+            yield word
+
+    monkeypatch.setattr(chat_app, "call_gemini_stream", slow_stream)
+    monkeypatch.setenv("STREAM_RESUME_BUFFER_BYTES", "120")
+    chat_app.get_settings.cache_clear()
+    streams.get_stream_registry.cache_clear()
+
+    async def scenario():
+        payload = {"messages": [{"role": "user", "content": "Ceritain yang panjang"}]}
+        stream_id, _ = await _post_chat_until_disconnect(chat_app.app, payload, disconnect_after=2)
+        await asyncio.sleep(0.4)  # Generasi selesai tanpa pembaca; frame awal terbuang
+
+        transport = httpx.ASGITransport(app=chat_app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            expired = await client.get(f"/chat/stream/{stream_id}", headers={"Last-Event-ID": "0"})
+            record = streams.get_stream_registry().get(stream_id)
+            # Last-Event-ID menunjuk frame terakhir yang diterima, jadi base - 1 = mulai tepat di base
+            tail = await client.get(
+                f"/chat/stream/{stream_id}", headers={"Last-Event-ID": str(record.broadcast.base - 1)},
+            )
+        return expired, tail, record
+
+    expired, tail, record = asyncio.run(scenario())
+    assert expired.status_code == 410
+    assert record.broadcast.base > 1
+    retained = sum(len(frame.encode("utf-8")) for frame in record.broadcast.items)
+    assert retained <= 120 or len(record.broadcast.items) == 1
+    assert tail.status_code == 200
+    assert _parse_events(tail.text)[-1][0] == "done"
+
+
+def test_reader_behind_bounded_window_gets_replay_expired():
+    from app.services.streams import Broadcast, ReplayExpired
+
+    async def scenario():
+        broadcast = Broadcast(max_bytes=10)
+        reader = broadcast.subscribe()
+        for i in range(10):
+            broadcast.publish(f"{i:03d}")
+        broadcast.close()
+        with pytest.raises(ReplayExpired):
+            await reader.__anext__()
+        return [item async for item in broadcast.subscribe(broadcast.base)], broadcast.base
+
+    items, base = asyncio.run(scenario())
+    assert items == ["007", "008", "009"]
+    assert base == 7
+
+
+def test_slow_reader_holds_back_the_publisher():
+    from app.services.streams import Broadcast
+
+    async def scenario():
+        broadcast = Broadcast()
+        published = 0
+
+        async def publisher():
+            nonlocal published
+            for i in range(50):
+                await broadcast.publish_with_backpressure(str(i), max_lag=5)
+                published += 1
+            broadcast.close()
+
+        reader = broadcast.subscribe()
+        task = asyncio.create_task(publisher())
+        first = await reader.__anext__()
+        await asyncio.sleep(0.05)
+        # Pembaca berhenti di item pertama: publisher tertahan di batas lag
+        assert published <= 6
+        rest = [item async for item in reader]
+        await task
+        return [first] + rest
+
+    items = asyncio.run(scenario())
+    assert items == [str(i) for i in range(50)]
+
+
+def test_single_flight_completion_callback_survives_last_subscriber_leaving():
+    from app.services.streams import SingleFlight
+
+    async def scenario():
+        flights = SingleFlight()
+        written = []
+
+        async def upstream():
+            yield "Halo "
+            yield "dunia"
+
+        async def on_complete(text):
+            # Callback nyata (isi cache) menunggu sesuatu dulu sebelum menulis
+            await asyncio.sleep(0.05)
+            written.append(text)
+
+        async with flights.join("k", upstream, on_complete) as (broadcast, _):
+            received = [item async for item in broadcast.subscribe()]
+        await asyncio.sleep(0.1)
+        return received, written, flights.stats()["in_flight"]
+
+    received, written, in_flight = asyncio.run(scenario())
+    assert received == ["Halo ", "dunia"]
+    assert written == ["Halo dunia"]
+    assert in_flight == 0
+
+
+def test_chat_reports_stage_timings(chat_app, caplog):
+    import json
+    import logging
+
+    client = _client(chat_app)
+    with caplog.at_level(logging.INFO, logger="app.tracing"):
+        response = client.post(
+            "/chat",
+            json={"messages": [{"role": "user", "content": "Halo timing"}]},
+            headers={"X-Request-ID": "req-123"},
+        )
+
+    assert response.headers["X-Request-Id"] == "req-123"
+    assert "validate;dur=" in response.headers["Server-Timing"]
+    assert "total;dur=" in response.headers["Server-Timing"]
+
+    events = _parse_events(response.text)
+    names = [name for name, _ in events]
+    assert names[-2:] == ["timing", "done"]
+    timing = json.loads(events[-2][1])
+    assert timing["request_id"] == "req-123"
+    assert {"validate", "generation", "first_token"} <= set(timing["stages"])
+
+    logged = [r.trace for r in caplog.records if r.name == "app.tracing"]
+    assert logged and logged[-1]["request_id"] == "req-123"
+    assert any(s["name"] == "generation" for s in logged[-1]["spans"])
+
+
+def test_coalescer_sends_first_token_then_merges_by_window():
+    from app.services.streams import Broadcast, TokenCoalescer
+
+    async def scenario():
+        broadcast = Broadcast()
+        coalescer = TokenCoalescer(broadcast, window=0.05, max_chars=10)
+        await coalescer.add("Ha")
+        first = list(broadcast.items)
+        for token in ["lo", " ", "ka"]:
+            await coalescer.add(token)
+        buffered = len(broadcast.items)
+        await asyncio.sleep(0.1)  # Jendela habis: timer mengirim sisa buffer
+        timed = list(broadcast.items)
+        await coalescer.add("mu apa kabar")  # Lewat max_chars: langsung terkirim
+        await coalescer.add("?")
+        await coalescer.flush()
+        return first, buffered, timed, list(broadcast.items)
+
+    first, buffered, timed, items = asyncio.run(scenario())
+    assert first == ["event: token\ndata: Ha\n\n"]
+    assert buffered == 1
+    assert timed[-1] == "event: token\ndata: lo ka\n\n"
+    assert items[2:] == ["event: token\ndata: mu apa kabar\n\n", "event: token\ndata: ?\n\n"]
+
+
+def test_heartbeat_hub_uses_one_timer_for_idle_streams():
+    from app.services.streams import HEARTBEAT_FRAME, HeartbeatHub
+
+    async def scenario():
+        hub = HeartbeatHub(interval=0.02)
+        idle, busy = asyncio.Queue(), asyncio.Queue()
+        busy.put_nowait("data")
+        hub.register(idle)
+        hub.register(busy)
+        task = hub._task
+        await asyncio.sleep(0.05)
+        hub.unregister(idle)
+        hub.unregister(busy)
+        await asyncio.sleep(0.05)
+        return idle, busy, task
+
+    idle, busy, task = asyncio.run(scenario())
+    assert idle.get_nowait() == HEARTBEAT_FRAME
+    assert busy.qsize() == 1  # Antrean yang masih berisi data tidak dapat heartbeat
+    assert task.done()  # Timer berhenti sendiri setelah koneksi terakhir pergi
+
+
+def test_semantic_cache_replays_paraphrased_chitchat(chat_app, monkeypatch):
+    from benchmarks.bench_memory import StubEmbedder
+    from app.services import memory, semantic_cache
+
+    model = StubEmbedder(32)
+    monkeypatch.setenv("SEMANTIC_CACHE", "true")
+    monkeypatch.setenv("SEMANTIC_CACHE_THRESHOLD", "0.7")
+    chat_app.get_settings.cache_clear()
+    semantic_cache.get_semantic_cache.cache_clear()
+    monkeypatch.setattr(memory, "get_embedding_model", lambda: model)
+
+    client = _client(chat_app)
+
+    def ask(content, persona="ceria", history=()):
+        messages = [*history, {"role": "user", "content": content}]
+        response = client.post(
+            "/chat", json={"messages": messages, "persona": persona, "use_memory": False},
+        )
+        # Batas frame token bisa berbeda antara upstream dan replay; bandingkan tanpa spasi
+        return "".join(data for name, data in _parse_events(response.text) if name == "token").replace(" ", "")
+
+    first = ask("hai kamu lagi apa")
+    assert ask("hai kamu lagi ngapain") == first
+    assert chat_app.upstream_calls == ["hai kamu lagi apa"]
+
+    # Persona lain dan pertanyaan yang butuh web tidak ikut memakai jawaban itu
+    ask("hai kamu lagi ngapain", persona="tsundere")
+    ask("cari berita terbaru hari ini")
+    assert len(chat_app.upstream_calls) == 3
+    assert chat_app.web_searches == ["cari berita terbaru hari ini"]
+    # Secara bawaan giliran sebelumnya ikut konteks: sapaan yang sama setelah kabar sedih bukan hit
+    sad = [
+        {"role": "user", "content": "aku sedih"},
+        {"role": "assistant", "content": "Aku ikut sedih dengarnya..."},
+    ]
+    ask("hai kamu lagi ngapain", history=sad)
+    assert len(chat_app.upstream_calls) == 4
+    stats = semantic_cache.get_semantic_cache().stats()
+    assert (stats["hits"], stats["misses"]) == (1, 3)
+    semantic_cache.get_semantic_cache.cache_clear()
+
+
+def test_slow_semantic_lookup_does_not_hold_back_the_answer(chat_app, monkeypatch):
+    import time
+
+    from benchmarks.bench_memory import StubEmbedder
+    from app.services import memory, semantic_cache
+
+    class SlowEmbedder(StubEmbedder):
+        def encode(self, *args, **kwargs):
+            time.sleep(0.5)
+            return super().encode(*args, **kwargs)
+
+    monkeypatch.setenv("SEMANTIC_CACHE", "true")
+    monkeypatch.setenv("INTENT_BUDGET", "0.05")
+    chat_app.get_settings.cache_clear()
+    semantic_cache.get_semantic_cache.cache_clear()
+    monkeypatch.setattr(memory, "get_embedding_model", lambda: SlowEmbedder(32))
+
+    started = time.monotonic()
+    response = _client(chat_app).post(
+        "/chat", json={"messages": [{"role": "user", "content": "hai kamu lagi apa"}], "use_memory": False},
+    )
+    elapsed = time.monotonic() - started
+    tokens = "".join(data for name, data in _parse_events(response.text) if name == "token")
+    assert tokens.replace(" ", "") == "Hehemakasihya^^:D"
+    assert chat_app.upstream_calls == ["hai kamu lagi apa"]
+    assert elapsed < 0.45
+    semantic_cache.get_semantic_cache.cache_clear()
+
+
+def test_client_deadline_reaches_upstream_and_fails_in_persona(chat_app, monkeypatch):
+    from app.deadline import current_deadline, time_left
+
+    budgets = []
+
+    async def slow_chain(messages, system_prompt, **kwargs):
+        budgets.append(current_deadline().budget)
+        await asyncio.sleep(1.2)
+        time_left(5.0)  # Model berikutnya dalam rantai fallback
+        yield "tidak sampai"
+
+    monkeypatch.setattr(chat_app, "call_gemini_stream", slow_chain)
+    response = _client(chat_app).post(
+        "/chat",
+        json={"messages": [{"role": "user", "content": "Halo deadline"}], "persona": "tsundere"},
+        headers={"X-Request-Timeout": "1"},
+    )
+    events = _parse_events(response.text)
+    names = [name for name, _ in events]
+
+    assert budgets == [1.0]
+    assert "token" not in names
+    assert "Kelamaan" in dict(events)["error"]
+    assert names[-1] == "done"
+    assert chat_app.get_admission_controller().stats()["active"] == 0
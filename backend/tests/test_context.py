@@ -0,0 +1,144 @@
+import asyncio
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import pytest
+
+
+@pytest.fixture()
+def context_module(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    monkeypatch.setenv("SUMMARY_TOKEN_BUDGET", "200")
+
+    from app import config
+    from app.services import context, keypool
+
+    config.get_settings.cache_clear()  # type: ignore[attr-defined]
+    keypool.get_key_pool.cache_clear()
+    context.clear_summary_cache()
+    yield context
+    config.get_settings.cache_clear()  # type: ignore[attr-defined]
+
+
+def _conversation(turns: int):
+    from app.schemas import Message
+
+    messages = []
+    for i in range(turns):
+        messages.append(Message(role="user", content=f"Pertanyaan nomor {i} " + "x" * 200))
+        messages.append(Message(role="assistant", content=f"Jawaban nomor {i} " + "y" * 200))
+    messages.append(Message(role="user", content="Pesan terakhir"))
+    return messages
+
+
+def test_short_history_is_sent_verbatim(context_module):
+    messages = _conversation(2)
+    result = context_module.compact_history(messages, token_budget=10_000)
+    assert result.messages == messages
+    assert result.summary is None
+    assert result.dropped == 0
+
+
+def test_long_history_stays_within_budget(context_module):
+    messages = _conversation(40)
+    result = context_module.compact_history(messages, token_budget=500)
+
+    assert result.messages[-1].content == "Pesan terakhir"
+    assert result.messages[0].role == "user"
+    assert result.dropped > 0
+    assert result.summary
+    verbatim = sum(context_module.estimate_message_tokens(m) for m in result.messages)
+    assert verbatim <= 500
+
+
+def test_background_refresh_feeds_later_requests(context_module, monkeypatch):
+    calls = []
+
+    async def fake_summarize(previous, messages, api_key):
+        calls.append(len(messages))
+        return "RINGKASAN-CACHED"
+
+    monkeypatch.setattr(context_module, "summarize_messages", fake_summarize)
+    messages = _conversation(40)
+
+    async def scenario():
+        first = context_module.compact_history(messages, token_budget=500)
+        assert "RINGKASAN-CACHED" not in (first.summary or "")
+        await asyncio.gather(*context_module._background_tasks)
+        return context_module.compact_history(messages, token_budget=500)
+
+    second = asyncio.run(scenario())
+    assert calls and len(calls) == 1
+    assert second.summary.startswith("RINGKASAN-CACHED")
+
+
+def test_growing_chat_refreshes_summary_in_batches(context_module, monkeypatch):
+    from app.schemas import Message
+
+    calls = []
+
+    async def fake_summarize(previous, messages, api_key):
+        calls.append(len(messages))
+        return f"RINGKASAN-{len(calls)}"
+
+    monkeypatch.setattr(context_module, "summarize_messages", fake_summarize)
+    messages = _conversation(40)
+
+    def add_turn(i):
+        messages[-1:] = [
+            Message(role="user", content=f"Lanjut {i} " + "x" * 200),
+            Message(role="assistant", content=f"Oke {i} " + "y" * 200),
+            Message(role="user", content="Pesan terakhir"),
+        ]
+
+    async def scenario():
+        context_module.compact_history(messages, token_budget=500)
+        # Giliran yang masuk saat pembaruan masih jalan tidak menambah panggilan
+        add_turn(0)
+        context_module.compact_history(messages, token_budget=500)
+        await asyncio.gather(*context_module._background_tasks)
+        assert calls == [calls[0]]
+
+        # Ekor di bawah ambang (2 pesan pendek per giliran) cukup pakai potongan lokal
+        add_turn(1)
+        context_module.compact_history(messages, token_budget=500)
+        assert not context_module._background_tasks
+        for i in range(2, 5):
+            add_turn(i)
+            context_module.compact_history(messages, token_budget=500)
+        await asyncio.gather(*context_module._background_tasks)
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
+
+
+def test_conversations_sharing_a_greeting_refresh_independently(context_module, monkeypatch):
+    from app.schemas import Message
+
+    calls = []
+
+    async def fake_summarize(previous, messages, api_key):
+        calls.append(messages[1].content)
+        return "RINGKASAN"
+
+    monkeypatch.setattr(context_module, "summarize_messages", fake_summarize)
+
+    def conversation(topic):
+        messages = [Message(role="user", content="halo"), Message(role="assistant", content="Hai juga!")]
+        for i in range(40):
+            messages.append(Message(role="user", content=f"{topic} {i} " + "x" * 200))
+            messages.append(Message(role="assistant", content=f"Soal {topic} {i} " + "y" * 200))
+        messages.append(Message(role="user", content="Pesan terakhir"))
+        return messages
+
+    async def scenario():
+        context_module.compact_history(conversation("kucing"), token_budget=500)
+        context_module.compact_history(conversation("gitar"), token_budget=500)
+        await asyncio.gather(*context_module._background_tasks)
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
@@ -0,0 +1,58 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app import config as app_config
+from app.deadline import DeadlineExceeded, current_deadline, resolve_budget, start_deadline, time_left
+from app.metrics import DEADLINE_EXCEEDED
+
+
+def test_time_left_is_capped_and_inherited_by_tasks():
+    async def scenario():
+        assert time_left(5.0) == 5.0  # Tanpa deadline: batas tahap apa adanya
+        start_deadline(1.0)
+        own = time_left(5.0)
+        inherited = await asyncio.create_task(asyncio.to_thread(time_left, 5.0))
+        return own, inherited
+
+    own, inherited = asyncio.run(scenario())
+    assert 0.9 < own <= 1.0
+    assert 0.8 < inherited <= own
+    assert current_deadline() is None  # asyncio.run memakai salinan konteks sendiri
+
+
+def test_spent_deadline_fails_fast_and_is_counted():
+    before = DEADLINE_EXCEEDED.value(stage="upstream")
+
+    async def scenario():
+        start_deadline(0.05)
+        await asyncio.sleep(0.1)
+        time_left(5.0, stage="upstream")
+
+    with pytest.raises(DeadlineExceeded) as info:
+        asyncio.run(scenario())
+    assert isinstance(info.value, TimeoutError)
+    assert info.value.stage == "upstream"
+    assert DEADLINE_EXCEEDED.value(stage="upstream") == before + 1
+
+
+def test_client_budget_is_clamped(monkeypatch):
+    monkeypatch.setenv("REQUEST_DEADLINE", "30")
+    monkeypatch.setenv("REQUEST_DEADLINE_MAX", "90")
+    app_config.get_settings.cache_clear()  # type: ignore[attr-defined]
+    try:
+        assert resolve_budget(None) == 30
+        assert resolve_budget("bukan-angka") == 30
+        assert resolve_budget("12.5") == 12.5
+        assert resolve_budget("600") == 90
+        assert resolve_budget("0.5") == 1.0
+        for malformed in ("0", "-5", "nan", "NaN", "inf", "-inf"):
+            assert resolve_budget(malformed) == 30, malformed
+    finally:
+        app_config.get_settings.cache_clear()  # type: ignore[attr-defined]
@@ -0,0 +1,144 @@
+import asyncio
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import pytest
+
+
+@pytest.fixture()
+def emotion_module(monkeypatch):
+    # Tanpa model embedding: cukup leksikon supaya test jalan offline
+    monkeypatch.setenv("EMOTION_LOCAL_EMBEDDINGS", "false")
+    monkeypatch.setenv("EMOTION_CONFIDENCE_THRESHOLD", "0.5")
+
+    from app import config
+    from app.services import emotion
+
+    config.get_settings.cache_clear()  # type: ignore[attr-defined]
+    emotion.clear_emotion_cache()
+    yield emotion
+    config.get_settings.cache_clear()  # type: ignore[attr-defined]
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("Hehe makasih ya ^^ :D", "happy"),
+        ("Huhuhu aku sedih banget hiks", "sad"),
+        ("B-bukan karena aku peduli ya! (>__<)", "tsun"),
+        ("WAHHH kerennn wkwkwk!!!", "excited"),
+    ],
+)
+def test_lexicon_recognises_persona_emoticons(emotion_module, text, expected):
+    result, confidence = emotion_module.classify_emotion_local(text, "ceria")
+    assert result.emotion == expected
+    assert confidence >= 0.5
+
+
+def test_low_confidence_falls_back_to_gemini_and_caches(emotion_module, monkeypatch):
+    calls = []
+
+    async def fake_gemini(text, persona, api_key):
+        calls.append(text)
+        return emotion_module.build_emotion("calm")
+
+    monkeypatch.setattr(emotion_module, "classify_emotion_gemini", fake_gemini)
+
+    async def scenario():
+        first = await emotion_module.resolve_emotion("Ini jawaban biasa.", "netral", "key")
+        second = await emotion_module.resolve_emotion("Ini jawaban biasa.", "netral", "key")
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first.emotion == second.emotion == "calm"
+    assert len(calls) == 1
+
+
+def test_failed_gemini_fallback_is_not_cached(emotion_module, monkeypatch):
+    calls = []
+
+    async def flaky_gemini(text, persona, api_key):
+        calls.append(text)
+        return None if len(calls) == 1 else emotion_module.build_emotion("calm")
+
+    monkeypatch.setattr(emotion_module, "classify_emotion_gemini", flaky_gemini)
+
+    async def scenario():
+        first = await emotion_module.resolve_emotion("Ini jawaban biasa.", "netral", "key")
+        second = await emotion_module.resolve_emotion("Ini jawaban biasa.", "netral", "key")
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first.emotion == "neutral"
+    # Kegagalan pertama tidak mengunci tebakan lokal: request berikutnya mencoba Gemini lagi
+    assert second.emotion == "calm"
+    assert len(calls) == 2
+
+
+def test_confident_local_result_skips_gemini(emotion_module, monkeypatch):
+    async def fail_gemini(text, persona, api_key):
+        raise AssertionError("Gemini tidak boleh dipanggil")
+
+    monkeypatch.setattr(emotion_module, "classify_emotion_gemini", fail_gemini)
+    result = asyncio.run(emotion_module.resolve_emotion("Hehe ^^ :D makasih", "ceria", "key"))
+    assert result.emotion == "happy"
+    assert result.glow == emotion_module.EMOTION_STYLES["happy"]["glow"]
+
+
+def test_failed_model_load_backs_off_to_lexicon(emotion_module, monkeypatch):
+    from app import config
+    from app.services import memory
+
+    attempts = []
+
+    def unreachable_hub(name):
+        attempts.append(name)
+        raise OSError("huggingface.co tidak bisa dihubungi")
+
+    monkeypatch.setattr(memory, "_construct_model", unreachable_hub)
+    monkeypatch.setattr(memory, "embedding_model", None)
+    monkeypatch.setattr(memory, "_load_failures", {})
+    monkeypatch.setenv("EMOTION_LOCAL_EMBEDDINGS", "true")
+    monkeypatch.setenv("EMBEDDING_MODEL", "model-rusak")
+    config.get_settings.cache_clear()  # type: ignore[attr-defined]
+
+    for text in ("Hehe makasih ya ^^ :D", "Huhuhu aku sedih banget hiks", "Hehe makasih ya ^^ :D"):
+        result, _ = emotion_module.classify_emotion_local(text, "ceria")
+    assert result.emotion == "happy"  # Leksikon tetap jalan
+    assert attempts == ["model-rusak"]
+
+    # Masa jeda lewat: dicoba sekali lagi, jedanya berlipat
+    memory._load_failures["model-rusak"] = (1, 0.0)
+    emotion_module.classify_emotion_local("Biasa saja.", "ceria")
+    assert attempts == ["model-rusak", "model-rusak"]
+    assert memory._load_failures["model-rusak"][0] == 2
+
+
+def test_gemini_fallback_reuses_the_shared_upstream_client(emotion_module, monkeypatch):
+    import json
+
+    import httpx
+
+    seen = []
+
+    def handler(request):
+        seen.append(request.url.path)
+        reply = {"emotion": "sad", "blink": True, "wink": False, "headSwaySpeed": 0.6, "glow": "#60a5fa"}
+        return httpx.Response(200, json={"candidates": [{"content": {"parts": [{"text": json.dumps(reply)}]}}]})
+
+    async def scenario():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr(emotion_module, "get_upstream_client", lambda: client)
+        result = await emotion_module.classify_emotion_gemini("Aku sedih", "ceria", "key")
+        # Klien bersama tidak boleh ditutup oleh pemanggil
+        assert not client.is_closed
+        await client.aclose()
+        return result
+
+    result = asyncio.run(scenario())
+    assert result is not None and result.emotion == "sad"
+    assert seen == ["/v1beta/models/gemini-2.5-flash:generateContent"]
@@ -0,0 +1,66 @@
+import asyncio
+import contextvars
+import sys
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.executors import NamedExecutor
+from app.metrics import EXECUTOR_QUEUE_DEPTH, EXECUTOR_WAIT_SECONDS
+
+
+def test_saturated_pool_does_not_starve_another():
+    cpu = NamedExecutor("test-cpu", 1)
+    io = NamedExecutor("test-io", 1)
+    release = threading.Event()
+
+    async def scenario():
+        blocked = [asyncio.ensure_future(cpu.run(release.wait)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        depth = EXECUTOR_QUEUE_DEPTH.value(executor="test-cpu")
+        stats = cpu.stats()
+        started = time.monotonic()
+        assert await io.run(lambda: "ok") == "ok"
+        io_elapsed = time.monotonic() - started
+        release.set()
+        await asyncio.gather(*blocked)
+        return depth, stats, io_elapsed
+
+    depth, stats, io_elapsed = asyncio.run(scenario())
+    assert depth == 2
+    assert stats == {"workers": 1, "queued": 2, "active": 1, "completed": 0}
+    assert io_elapsed < 0.5
+    assert cpu.stats()["completed"] == 3
+    assert EXECUTOR_QUEUE_DEPTH.value(executor="test-cpu") == 0
+    assert 'linda_executor_wait_seconds_count{executor="test-cpu"} 3' in "\n".join(EXECUTOR_WAIT_SECONDS.render())
+    cpu.shutdown()
+    io.shutdown()
+
+
+def test_context_is_carried_and_cancelled_jobs_leave_the_queue():
+    pool = NamedExecutor("test-ctx", 1)
+    marker: contextvars.ContextVar[str] = contextvars.ContextVar("marker", default="-")
+    release = threading.Event()
+
+    async def scenario():
+        marker.set("req-1")
+        seen = await pool.run(marker.get)
+        running = asyncio.ensure_future(pool.run(release.wait))
+        queued = asyncio.ensure_future(pool.run(lambda: "tidak pernah"))
+        await asyncio.sleep(0.05)
+        queued.cancel()
+        await asyncio.sleep(0)
+        depth = pool.stats()["queued"]
+        release.set()
+        await running
+        return seen, depth
+
+    seen, depth = asyncio.run(scenario())
+    assert seen == "req-1"
+    assert depth == 0
+    assert EXECUTOR_QUEUE_DEPTH.value(executor="test-ctx") == 0
+    pool.shutdown()
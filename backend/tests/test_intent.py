@@ -0,0 +1,111 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture()
+def intent_module(monkeypatch):
+    monkeypatch.setenv("INTENT_LOCAL_EMBEDDINGS", "false")
+    monkeypatch.setenv("INTENT_WEB_THRESHOLD", "0.4")
+
+    from app import config
+    from app.services import intent
+
+    config.get_settings.cache_clear()  # type: ignore[attr-defined]
+    intent.clear_intent_cache()
+    monkeypatch.setattr(intent._classifier, "_matrix", None)
+    yield intent
+    intent.clear_intent_cache()
+    config.get_settings.cache_clear()  # type: ignore[attr-defined]
+
+
+@pytest.mark.parametrize(
+    "text, web",
+    [
+        ("Berita terbaru soal pemilu apa?", True),
+        ("Tolong cariin resep rendang dong", True),
+        ("Berapa skor pertandingan semalam?", True),
+        # Dulu ikut memicu pencarian karena "info"/"cari" cocok sebagai substring
+        ("Aku kuliah jurusan informatika", False),
+        ("Hai Linda, makasih ya hehe", False),
+        ("Jelasin rekursi dong", False),
+    ],
+)
+def test_lexicon_uses_word_boundaries(intent_module, text, web):
+    assert intent_module.route_intent(text).web is web
+
+
+def test_chitchat_skips_memory_but_recall_keeps_it(intent_module):
+    assert not intent_module.route_intent("hai halo hehe makasih").memory
+    decision = intent_module.route_intent("Kamu masih ingat namaku?")
+    assert decision.label == "memory" and decision.memory
+
+
+class _KeywordModel:
+    """Embedding palsu: dimensi per intent dari kata kunci, cukup untuk menguji penggabungan & cache."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, texts, convert_to_tensor=False):
+        self.calls += 1
+        rows = []
+        for text in texts:
+            lowered = text.lower()
+            rows.append([
+                1.0 if any(w in lowered for w in ("menang", "harga", "berita", "presiden", "cuaca", "rilis", "latest")) else 0.1,
+                1.0 if any(w in lowered for w in ("ingat", "inget", "cerita", "bilang", "remember", "kesukaanku")) else 0.1,
+                1.0 if not any(w in lowered for w in ("menang", "harga", "ingat", "inget", "bilang")) else 0.1,
+            ])
+        return np.asarray(rows, dtype=np.float32)
+
+
+def test_embedding_route_catches_time_sensitive_question_and_caches(intent_module, monkeypatch):
+    from app.services import memory
+
+    model = _KeywordModel()
+    monkeypatch.setenv("INTENT_LOCAL_EMBEDDINGS", "true")
+    intent_module.get_settings.cache_clear()
+    monkeypatch.setattr(memory, "get_embedding_model", lambda: model)
+
+    # Tanpa kata pemicu leksikon sama sekali
+    first = intent_module.route_intent("Siapa yang menang tadi?")
+    assert first.source == "embedding" and first.web
+    calls = model.calls
+    again = intent_module.route_intent("  siapa yang MENANG tadi? ")
+    assert again == first
+    assert model.calls == calls
+
+
+def test_failed_model_load_routes_lexically_until_model_recovers(intent_module, monkeypatch):
+    from app.services import memory
+
+    attempts = []
+
+    def unreachable_hub(name):
+        attempts.append(name)
+        raise OSError("huggingface.co tidak bisa dihubungi")
+
+    monkeypatch.setattr(memory, "_construct_model", unreachable_hub)
+    monkeypatch.setattr(memory, "embedding_model", None)
+    monkeypatch.setattr(memory, "_load_failures", {})
+    monkeypatch.setenv("INTENT_LOCAL_EMBEDDINGS", "true")
+    monkeypatch.setenv("EMBEDDING_MODEL", "model-rusak")
+    intent_module.get_settings.cache_clear()
+
+    for _ in range(3):
+        decision = intent_module.route_intent("Siapa yang menang tadi?")
+        assert decision.source == "lexicon"
+    assert attempts == ["model-rusak"]
+
+    # Keputusan leksikon darurat tidak di-cache: begitu model ada, router embedding dipakai
+    model = _KeywordModel()
+    monkeypatch.setattr(memory, "embedding_model", model)
+    recovered = intent_module.route_intent("Siapa yang menang tadi?")
+    assert recovered.source == "embedding" and recovered.web
@@ -0,0 +1,68 @@
+import asyncio
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import httpx
+import pytest
+
+from app.services.keypool import KeyPool, KeyPoolExhausted, parse_retry_after
+
+
+def test_requests_are_spread_across_keys():
+    pool = KeyPool(["key-a", "key-b", "key-c"], requests_per_minute=60, burst=2)
+    picked = [pool.try_acquire("gemini-2.5-flash")[0] for _ in range(6)]
+    assert sorted(picked) == ["key-a", "key-a", "key-b", "key-b", "key-c", "key-c"]
+
+    key, wait = pool.try_acquire("gemini-2.5-flash")
+    assert key is None and wait > 0
+    # Bucket model lain masih penuh
+    assert pool.try_acquire("gemini-1.5-flash")[0] is not None
+
+
+def test_throttled_key_is_routed_around_and_backs_off():
+    pool = KeyPool(["key-a", "key-b"], requests_per_minute=60, burst=5)
+    pool.report_throttled("key-a", "m", retry_after=120)
+
+    picked = {pool.try_acquire("m")[0] for _ in range(5)}
+    assert picked == {"key-b"}
+    stats = {row["key"]: row for row in pool.stats() if row["model"] == "m"}
+    assert stats["...ey-a"]["rate_per_minute"] == 30
+    assert stats["...ey-a"]["cooldown_seconds"] > 100
+
+    # Sukses memulihkan rate, tapi KEY_POOL_RPM tetap plafonnya
+    for _ in range(100):
+        pool.report_success("key-a", "m")
+    stats = {row["key"]: row for row in pool.stats() if row["model"] == "m"}
+    assert stats["...ey-a"]["rate_per_minute"] == 60
+
+
+def test_without_configured_rate_only_upstream_throttling_limits_a_key():
+    pool = KeyPool(["key-a"], requests_per_minute=0, burst=5)
+    assert all(pool.try_acquire("m")[0] == "key-a" for _ in range(100))
+
+    pool.report_throttled("key-a", "m", retry_after=30)
+    key, wait = pool.try_acquire("m")
+    assert key is None and 29 < wait <= 30
+
+
+def test_acquire_fails_fast_when_wait_exceeds_budget():
+    pool = KeyPool(["key-a"], requests_per_minute=60, burst=1)
+    pool.report_throttled("key-a", "m", retry_after=60)
+    with pytest.raises(KeyPoolExhausted):
+        asyncio.run(pool.acquire("m", max_wait=1))
+
+
+def test_parse_retry_after_reads_header_and_rpc_retry_info():
+    request = httpx.Request("POST", "https://example.test")
+    with_header = httpx.Response(429, headers={"Retry-After": "7"}, request=request)
+    with_body = httpx.Response(
+        429,
+        json={"error": {"details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "37s"}]}},
+        request=request,
+    )
+    assert asyncio.run(parse_retry_after(with_header)) == 7
+    assert asyncio.run(parse_retry_after(with_body)) == 37
@@ -0,0 +1,197 @@
+import asyncio
+import contextlib
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import pytest
+import uvicorn
+
+from benchmarks import load_chat, mock_gemini
+
+
+@contextlib.contextmanager
+def _serve(app):
+    """Jalankan app ASGI di uvicorn (thread terpisah) pada port bebas."""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning", lifespan="on"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started and time.monotonic() < deadline:
+        time.sleep(0.02)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+        sock.close()
+
+
+@pytest.fixture()
+def mock_upstream(tmp_path, monkeypatch):
+    config = mock_gemini.MockConfig(
+        chunks=mock_gemini.load_fixture(mock_gemini.DEFAULT_FIXTURE),
+        first_token_delay=0.01,
+        token_interval=0.005,
+        seed=7,
+    )
+    mock_app = mock_gemini.create_app(config)
+    with _serve(mock_app) as url:
+        monkeypatch.setenv("GEMINI_API_ROOT", url)
+        monkeypatch.setenv("MEMORY_DB_PATH", str(tmp_path / "memory.db"))
+        monkeypatch.setenv("EMOTION_LOCAL_EMBEDDINGS", "false")
+        monkeypatch.setenv("INTENT_LOCAL_EMBEDDINGS", "false")
+
+        from app import config as app_config
+        from app.services import admission, cache, streams
+
+        app_config.get_settings.cache_clear()  # type: ignore[attr-defined]
+        admission.get_admission_controller.cache_clear()
+        cache.get_response_cache.cache_clear()
+        streams.get_single_flight.cache_clear()
+        streams.get_stream_registry.cache_clear()
+        yield mock_app
+        app_config.get_settings.cache_clear()  # type: ignore[attr-defined]
+
+
+def test_stream_falls_back_past_injected_404(mock_upstream):
+    from app.schemas import Message
+    from app.services.llm import call_gemini_stream
+
+    mock_upstream.state.config.update({"failures": ["gemini-2.5-flash=404"]})
+
+    async def collect():
+        messages = [Message(role="user", content="Halo Linda")]
+        return "".join([t async for t in call_gemini_stream(messages, "persona", api_key="mock")])
+
+    text = asyncio.run(collect())
+    assert text == "".join(mock_upstream.state.config.chunks).lstrip()
+    assert mock_upstream.state.stats["injected_errors"] == 1
+    assert mock_upstream.state.stats["stream"] == 2
+
+
+def test_load_generator_reports_streaming_latency(mock_upstream):
+    from app import main
+
+    with _serve(main.app) as url:
+        report = asyncio.run(load_chat.run_load(url, concurrency=4, requests=8, api_key="mock", metrics_interval=0.2))
+
+    assert report["completed"] == 8
+    assert report["errors"] == {}
+    assert report["ttft_ms"]["p50"] is not None
+    assert report["inter_token_ms"]["p50"] is not None
+    assert mock_upstream.state.stats["stream"] == 8
+
+
+@pytest.fixture()
+def cached_upstream(mock_upstream, monkeypatch):
+    monkeypatch.setenv("GEMINI_CONTEXT_CACHE", "true")
+    monkeypatch.setenv("GEMINI_CONTEXT_CACHE_MIN_CHARS", "100")
+
+    from app import config as app_config
+    from app.services import prompt_cache
+
+    app_config.get_settings.cache_clear()  # type: ignore[attr-defined]
+    prompt_cache.get_prompt_cache.cache_clear()
+    yield mock_upstream
+    prompt_cache.get_prompt_cache.cache_clear()
+
+
+async def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        await asyncio.sleep(0.01)
+
+
+def test_persona_prompt_served_from_context_cache(cached_upstream):
+    from app.schemas import Message
+    from app.services.llm import call_gemini_stream
+    from app.services.prompt_cache import get_prompt_cache
+
+    persona = "Kamu adalah Linda. " * 40
+    stats = cached_upstream.state.stats
+    expected = "".join(cached_upstream.state.config.chunks).lstrip()
+
+    async def ask(content):
+        messages = [Message(role="user", content=content)]
+        chunks = call_gemini_stream(
+            messages, persona + "\n[MEMORI]: -", search_context="", api_key="mock", persona_prompt=persona,
+        )
+        return "".join([t async for t in chunks])
+
+    async def scenario():
+        # Giliran pertama tetap inline; handle dibuat di background
+        assert await ask("Halo Linda") == expected
+        assert stats["cached_requests"] == 0
+        await _wait_for(lambda: get_prompt_cache().stats()["handles"] == 1)
+        inline_chars = stats["prompt_chars"]
+
+        # Giliran berikutnya merujuk handle: persona tidak dikirim ulang
+        assert await ask("Halo lagi") == expected
+        assert stats["cached_requests"] == 1
+        assert stats["cached_chars"] == len(persona)
+        assert stats["prompt_chars"] - inline_chars < inline_chars - len(persona) + 100
+
+        # Handle hilang di sisi Gemini: jawaban tetap keluar lewat teks inline, lalu dibuat ulang
+        cached_upstream.state.caches.clear()
+        assert await ask("Masih di sana?") == expected
+        assert stats["cache_rejected"] == 1
+        await _wait_for(lambda: get_prompt_cache().stats()["handles"] == 1)
+        assert stats["cache_create"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_small_persona_stays_inline(cached_upstream):
+    from app.schemas import Message
+    from app.services.llm import call_gemini_stream
+    from app.services.prompt_cache import get_prompt_cache
+
+    cached_upstream.state.config.update({"cache_min_chars": 10_000})
+    persona = "Kamu adalah Linda. " * 10
+    stats = cached_upstream.state.stats
+
+    async def ask():
+        messages = [Message(role="user", content="Halo Linda")]
+        chunks = call_gemini_stream(messages, persona, search_context="", api_key="mock", persona_prompt=persona)
+        return "".join([t async for t in chunks])
+
+    async def scenario():
+        await ask()
+        # Pembuatan ditolak (terlalu pendek) lalu ditahan; request berikutnya tidak mencoba lagi
+        await _wait_for(lambda: get_prompt_cache().stats()["blocked"] == 1)
+        await ask()
+        assert stats["cached_requests"] == 0
+        assert stats["cache_create"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_spent_deadline_stops_the_model_fallback_chain(mock_upstream):
+    from app.deadline import DeadlineExceeded, start_deadline
+    from app.schemas import Message
+    from app.services.llm import call_gemini_stream
+
+    # Tanpa deadline: 5 model x first token 3 detik (atau REQUEST_TIMEOUT) sebelum menyerah
+    mock_upstream.state.config.update({"first_token_delay": 3.0, "jitter": 0.0})
+
+    async def collect():
+        start_deadline(0.5)
+        messages = [Message(role="user", content="Halo Linda")]
+        return "".join([t async for t in call_gemini_stream(messages, "persona", api_key="mock")])
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(collect())
+    assert time.monotonic() - started < 1.5
+    assert mock_upstream.state.stats["stream"] == 1
@@ -0,0 +1,85 @@
+import contextvars
+import json
+import logging
+import queue
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.logging_setup import (
+    DroppingQueueHandler,
+    JsonFormatter,
+    RequestIdFilter,
+    SamplingFilter,
+    TextFormatter,
+    parse_sample_rates,
+)
+from app.metrics import LOG_RECORDS_DROPPED
+
+
+def _record(name: str, level: int = logging.INFO, msg: str = "halo %s", args=("dunia",)) -> logging.LogRecord:
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+
+def test_sampling_and_rate_limit_only_touch_low_levels():
+    sampler = SamplingFilter(parse_sample_rates("app.services=0, app.main = 1"), rate_limit=0)
+    assert not sampler.filter(_record("app.services.cache"))
+    assert sampler.filter(_record("app.services.cache", logging.WARNING))
+    assert sampler.filter(_record("app.main"))
+
+    limiter = SamplingFilter({}, rate_limit=2)
+    results = [limiter.filter(_record("app.main")) for _ in range(3)]
+    assert results == [True, True, False]
+    assert limiter.filter(_record("app.main", logging.ERROR))
+    assert limiter.filter(_record("app.tracing"))
+
+
+def test_full_queue_drops_instead_of_blocking():
+    before = LOG_RECORDS_DROPPED.value(reason="queue_full")
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    for _ in range(3):
+        handler.handle(_record("app.main"))
+
+    assert handler.queue.qsize() == 1
+    assert LOG_RECORDS_DROPPED.value(reason="queue_full") - before == 2
+
+
+def test_json_lines_carry_request_id_of_active_trace():
+    from app.tracing import start_trace
+
+    def emit() -> logging.LogRecord:
+        start_trace("chat", "req-123")
+        record = _record("app.main")
+        RequestIdFilter().filter(record)
+        return record
+
+    line = json.loads(JsonFormatter().format(contextvars.copy_context().run(emit)))
+    assert line["request_id"] == "req-123"
+    assert line["msg"] == "halo dunia"
+    assert line["level"] == "INFO"
+
+    outside = _record("app.main")
+    RequestIdFilter().filter(outside)
+    assert json.loads(JsonFormatter().format(outside))["request_id"] == "-"
+
+
+def test_trace_record_is_encoded_once_as_a_nested_object(caplog):
+    from app.tracing import start_trace
+
+    def finish() -> None:
+        start_trace("chat", "req-456").finish(outcome="completed")
+
+    with caplog.at_level(logging.INFO, logger="app.tracing"):
+        contextvars.copy_context().run(finish)
+    record = next(r for r in caplog.records if r.name == "app.tracing")
+
+    line = json.loads(JsonFormatter().format(record))
+    assert line["trace"]["request_id"] == "req-456"
+    assert line["trace"]["outcome"] == "completed"
+    assert '\\"' not in JsonFormatter().format(record)
+
+    text = TextFormatter("%(message)s").format(record)
+    assert json.loads(text[text.index("{"):])["trace"] == "chat"
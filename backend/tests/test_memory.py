@@ -1,6 +1,9 @@
 import importlib
+import json
 import os
 import sys
+import threading
+import time
 from pathlib import Path
 
 ROOT = Path(__file__).resolve().parents[1]
@@ -41,3 +44,90 @@ def test_search_returns_recent_matches(memory_module):
     assert results
     assert results[0]["type"] == "preference"
     assert "musik" in results[0]["text"].lower()
+
+
+def _restart(module):
+    module.embedding_model = None
+    module.embedding_model_name = None
+    module.index = None
+    module.index_meta = None
+    module.is_initialized = False
+
+
+@pytest.fixture()
+def stub_models(memory_module, monkeypatch):
+    from benchmarks.bench_memory import StubEmbedder
+
+    models = {"model-a": StubEmbedder(16), "model-b": StubEmbedder(24)}
+    gates = {name: threading.Event() for name in models}
+    gates["model-a"].set()
+
+    def load(name):
+        gates[name].wait(timeout=10)
+        return models[name]
+
+    monkeypatch.setattr(memory_module, "_load_model", load)
+    monkeypatch.setenv("EMBEDDING_MODEL", "model-a")
+    monkeypatch.setenv("MEMORY_INDEX_FACTORY", "Flat")
+    _restart(memory_module)
+    yield gates
+    if memory_module._migration is not None:
+        memory_module._migration.cancelled.set()
+    gates["model-b"].set()
+
+
+def _use_model(monkeypatch, name):
+    from app import config
+
+    monkeypatch.setenv("EMBEDDING_MODEL", name)
+    config.get_settings.cache_clear()  # type: ignore[attr-defined]
+
+
+def test_index_records_model_metadata(memory_module, stub_models, monkeypatch):
+    _use_model(monkeypatch, "model-a")
+    memory_module.upsert_memory("fact", "Pengguna suka kopi hitam tiap pagi.")
+
+    meta = json.loads((memory_module._get_db_path().parent / memory_module.META_FILE).read_text())
+    assert meta["model"] == "model-a"
+    assert meta["dimension"] == 16
+    assert (memory_module._get_db_path().parent / meta["file"]).exists()
+
+
+def test_model_change_migrates_in_background(memory_module, stub_models, monkeypatch):
+    _use_model(monkeypatch, "model-a")
+    for i in range(29):
+        memory_module.upsert_memory("fact", f"Catatan nomor {i} tentang kopi dan musik lo-fi.")
+    memory_module.upsert_memory("preference", "Suka mendaki gunung saat libur panjang.")
+    old_file = memory_module._get_index_path()
+
+    _restart(memory_module)
+    _use_model(monkeypatch, "model-b")
+    monkeypatch.setenv("MEMORY_MIGRATION_BATCH", "8")
+
+    # Model baru belum selesai dimuat: search tetap dilayani indeks + model lama
+    results = memory_module.search_memory("mendaki gunung", top_k=1)
+    assert results[0]["type"] == "preference"
+    stats = memory_module.memory_stats()
+    assert (stats["model"], stats["dimension"], stats["migration"]["state"]) == ("model-a", 16, "running")
+
+    added = memory_module.upsert_memory("todo", "Todo: servis sepeda sebelum akhir bulan.")
+    stub_models["model-b"].set()
+
+    deadline = time.monotonic() + 10
+    while memory_module.memory_stats()["migration"]["state"] == "running":
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    stats = memory_module.memory_stats()
+    assert stats["migration"]["state"] == "done"
+    assert (stats["model"], stats["dimension"], stats["vectors"]) == ("model-b", 24, 31)
+    assert memory_module.search_memory("servis sepeda", top_k=1)[0]["id"] == added["id"]
+    meta = json.loads((memory_module._get_db_path().parent / memory_module.META_FILE).read_text())
+    assert (meta["model"], meta["dimension"]) == ("model-b", 24)
+    assert not old_file.exists()
+
+    # Restart dengan model yang sama: indeks hasil migrasi langsung dipakai
+    _restart(memory_module)
+    assert memory_module.search_memory("mendaki gunung", top_k=1)[0]["type"] == "preference"
+    assert memory_module._migration.state == "done"
+    assert memory_module.memory_stats()["dimension"] == 24
@@ -0,0 +1,102 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import pytest
+
+from app.metrics import MetricsRegistry
+
+
+def test_registry_renders_text_exposition_format():
+    registry = MetricsRegistry()
+    requests = registry.counter("demo_requests_total", "Contoh counter.", ["route"])
+    queue = registry.gauge("demo_queue_depth", "Contoh gauge.")
+    latency = registry.histogram("demo_latency_seconds", "Contoh histogram.", buckets=(0.1, 1.0))
+    registry.gauge("demo_callback", "Dihitung saat scrape.", function=lambda: 42)
+
+    requests.inc(route='/chat "x"')
+    requests.inc(2, route="/emotion")
+    queue.set(3)
+    queue.dec()
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    text = registry.render()
+    assert "# TYPE demo_requests_total counter" in text
+    assert 'demo_requests_total{route="/chat \\"x\\""} 1' in text
+    assert 'demo_requests_total{route="/emotion"} 2' in text
+    assert "demo_queue_depth 2" in text
+    assert 'demo_latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'demo_latency_seconds_bucket{le="1"} 2' in text
+    assert 'demo_latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "demo_latency_seconds_count 3" in text
+    assert "demo_callback 42" in text
+
+    with pytest.raises(ValueError):
+        requests.inc(method="GET")
+    with pytest.raises(ValueError):
+        registry.counter("demo_requests_total", "Duplikat.")
+
+
+def test_metrics_endpoint_reports_chat_pipeline(tmp_path, monkeypatch):
+    monkeypatch.setenv("MEMORY_DB_PATH", str(tmp_path / "memory.db"))
+    monkeypatch.setenv("UPSTREAM_WARMUP", "false")
+    monkeypatch.setenv("INTENT_LOCAL_EMBEDDINGS", "false")
+
+    from app import config
+
+    config.get_settings.cache_clear()  # type: ignore[attr-defined]
+    from fastapi.testclient import TestClient
+
+    from app import main
+    from app.metrics import CHAT_REQUESTS, CHAT_TIME_TO_FIRST_TOKEN
+    from app.services import admission, cache, streams
+
+    admission.get_admission_controller.cache_clear()
+    cache.get_response_cache.cache_clear()
+    streams.get_stream_registry.cache_clear()
+
+    async def fake_stream(messages, system_prompt, **kwargs):
+        yield "Halo juga!"
+
+    monkeypatch.setattr(main, "call_gemini_stream", fake_stream)
+    completed_before = CHAT_REQUESTS.value(outcome="completed")
+    ttft_before = CHAT_TIME_TO_FIRST_TOKEN.count(source="upstream")
+
+    client = TestClient(main.app)
+    client.post("/chat", json={"messages": [{"role": "user", "content": "Halo metrik"}]})
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert CHAT_REQUESTS.value(outcome="completed") == completed_before + 1
+    assert CHAT_TIME_TO_FIRST_TOKEN.count(source="upstream") == ttft_before + 1
+    assert 'linda_response_cache_lookups_total{result="miss"}' in response.text
+    assert "linda_sse_open_connections 0" in response.text
+    assert "linda_admission_active 0" in response.text
+    config.get_settings.cache_clear()  # type: ignore[attr-defined]
+
+
+def test_collector_modules_survive_reload_and_metrics_must_render_samples():
+    import importlib
+
+    from app.metrics import _Metric
+    from app.services import admission, cache
+
+    for module in (cache, admission):
+        # Kembalikan objek lama sesudahnya: modul lain (main) masih memegang kelas & fungsi aslinya
+        original = dict(vars(module))
+        try:
+            importlib.reload(module)
+        finally:
+            vars(module).update(original)
+
+    class Incomplete(_Metric):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete("linda_incomplete", "Tanpa _samples.")
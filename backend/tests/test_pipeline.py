@@ -0,0 +1,72 @@
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.metrics import PREGEN_STAGE_SKIPPED
+from app.services.pipeline import StageGraph
+
+
+def _sleeper(seconds: float, value):
+    async def run():
+        await asyncio.sleep(seconds)
+        return value
+    return run
+
+
+def test_stages_run_concurrently():
+    async def scenario():
+        graph = StageGraph(deadline=2)
+        graph.add("a", _sleeper(0.2, "A"))
+        graph.add("b", _sleeper(0.2, "B"))
+        graph.add("c", _sleeper(0.2, "C"), optional=False)
+        started = time.monotonic()
+        results = [await graph.result(name) for name in ("a", "b", "c")]
+        return results, time.monotonic() - started, graph.statuses()
+
+    results, elapsed, statuses = asyncio.run(scenario())
+    assert results == ["A", "B", "C"]
+    assert elapsed < 0.5  # Sekitar tahap terlama, bukan jumlahnya (0.6 detik)
+    assert statuses == {"a": "ok", "b": "ok", "c": "ok"}
+
+
+def test_optional_stage_past_budget_is_skipped():
+    before = PREGEN_STAGE_SKIPPED.value(stage="lambat", reason="timeout")
+
+    async def scenario():
+        graph = StageGraph(deadline=2)
+        graph.add("lambat", _sleeper(1.0, "telat"), budget=0.05, default="kosong")
+        started = time.monotonic()
+        value = await graph.result("lambat")
+        return value, time.monotonic() - started, graph.statuses()
+
+    value, elapsed, statuses = asyncio.run(scenario())
+    assert value == "kosong"
+    assert elapsed < 0.5
+    assert statuses["lambat"] == "timeout"
+    assert PREGEN_STAGE_SKIPPED.value(stage="lambat", reason="timeout") == before + 1
+
+
+def test_errors_and_cancellation():
+    async def boom():
+        raise RuntimeError("rusak")
+
+    async def scenario():
+        graph = StageGraph(deadline=2)
+        graph.add("opsional", boom, default=[])
+        graph.add("wajib", boom, optional=False)
+        graph.add("batal", _sleeper(1.0, "x"), default="dibatalkan")
+        graph.cancel("batal")
+        assert await graph.result("opsional") == []
+        assert await graph.result("batal") == "dibatalkan"
+        assert await graph.result("tidak-ada", "bawaan") == "bawaan"
+        with pytest.raises(RuntimeError):
+            await graph.result("wajib")
+
+    asyncio.run(scenario())
@@ -0,0 +1,88 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import pytest
+
+HEADERS = {"X-Admin-Token": "rahasia"}
+
+
+@pytest.fixture()
+def admin_client(tmp_path, monkeypatch):
+    monkeypatch.setenv("MEMORY_DB_PATH", str(tmp_path / "memory.db"))
+    monkeypatch.setenv("ADMIN_ENDPOINTS", "true")
+    monkeypatch.setenv("ADMIN_TOKEN", "rahasia")
+
+    from fastapi.testclient import TestClient
+
+    from app import config, main
+
+    config.get_settings.cache_clear()  # type: ignore[attr-defined]
+    yield TestClient(main.app)
+    config.get_settings.cache_clear()  # type: ignore[attr-defined]
+
+
+def test_admin_endpoints_hidden_by_default_and_need_token(admin_client, monkeypatch):
+    from app import config
+
+    assert admin_client.get("/admin/tasks").status_code == 403
+    assert admin_client.get("/admin/tasks", headers={"X-Admin-Token": "salah"}).status_code == 403
+
+    monkeypatch.delenv("ADMIN_ENDPOINTS")
+    config.get_settings.cache_clear()  # type: ignore[attr-defined]
+    assert admin_client.get("/admin/tasks", headers=HEADERS).status_code == 404
+
+
+def test_cpu_profile_returns_folded_stacks(admin_client):
+    response = admin_client.get("/admin/profile/cpu", params={"seconds": 0.2, "interval_ms": 5}, headers=HEADERS)
+    assert response.status_code == 200
+    lines = response.text.strip().splitlines()
+    assert lines
+    stack, count = lines[0].rsplit(" ", 1)
+    assert int(count) >= 1
+    assert any(line.startswith("MainThread;") for line in lines)
+    assert "linda-profiler" not in response.text
+
+    too_long = admin_client.get("/admin/profile/cpu", params={"seconds": 3600}, headers=HEADERS)
+    assert too_long.status_code == 400
+
+
+def test_allocation_diff_and_task_counts(admin_client):
+    assert admin_client.get("/admin/allocations", headers=HEADERS).status_code == 409
+
+    started = admin_client.post("/admin/allocations/start", params={"frames": 5}, headers=HEADERS).json()
+    assert started["tracing"] is True
+    diff = admin_client.get("/admin/allocations", params={"limit": 5}, headers=HEADERS).json()
+    assert len(diff["top"]) <= 5
+    assert all({"site", "size_diff", "count_diff"} <= set(row) for row in diff["top"])
+    assert admin_client.delete("/admin/allocations", headers=HEADERS).json() == {"tracing": False, "stopped": True}
+
+    tasks = admin_client.get("/admin/tasks", headers=HEADERS).json()
+    assert tasks["total"] >= 1
+    assert sum(row["count"] for row in tasks["by_coroutine"]) == tasks["total"]
+
+
+def test_allocation_snapshots_run_off_the_event_loop(admin_client, monkeypatch):
+    import asyncio
+
+    from app.profiling import AllocationTracker
+
+    on_loop = []
+    original = AllocationTracker._snapshot
+
+    def spy(self):
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(True)
+        except RuntimeError:
+            on_loop.append(False)
+        return original(self)
+
+    monkeypatch.setattr(AllocationTracker, "_snapshot", spy)
+    admin_client.post("/admin/allocations/start", headers=HEADERS)
+    admin_client.get("/admin/allocations", headers=HEADERS)
+    admin_client.delete("/admin/allocations", headers=HEADERS)
+    assert on_loop == [False, False]
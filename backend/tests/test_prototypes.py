@@ -0,0 +1,63 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import numpy as np
+
+
+class _AxisModel:
+    """Embedding palsu: satu dimensi per kata kunci, cukup untuk memisahkan dua label."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, texts, convert_to_tensor=False):
+        self.calls += 1
+        return np.asarray(
+            [[1.0 if "kucing" in t else 0.0, 1.0 if "hujan" in t else 0.0] for t in texts],
+            dtype=np.float32,
+        )
+
+
+def _classifier(enabled=True):
+    from app.services.prototypes import PrototypeClassifier
+
+    return PrototypeClassifier(
+        "uji",
+        ("hewan", "cuaca"),
+        {"cuaca": ["hujan deras"], "hewan": ["kucing lucu"]},
+        [(r"\bmeong\b", "hewan", 1.0)],
+        enabled=lambda: enabled,
+        lexicon_weight=0.5,
+    )
+
+
+def test_lexicon_probs_follow_label_order_and_never_reach_certainty():
+    classifier = _classifier()
+    probs = classifier.lexicon_probs("meong meong")
+    assert probs is not None and probs.argmax() == 0
+    assert probs[0] < 1.0
+    assert classifier.lexicon_probs("tidak ada sinyal") is None
+
+
+def test_embedding_probs_reuse_centroids_and_blend_with_lexicon(monkeypatch):
+    from app.services import memory
+
+    model = _AxisModel()
+    monkeypatch.setattr(memory, "get_embedding_model", lambda: model)
+    classifier = _classifier()
+
+    emb = classifier.embedding_probs("hujan lagi")
+    assert emb is not None and emb.argmax() == 1
+    calls = model.calls
+    classifier.embedding_probs("kucing tidur")
+    # Centroid prototipe dihitung sekali per model; berikutnya hanya teksnya yang di-encode
+    assert model.calls == calls + 1
+
+    blended = classifier.blend(classifier.lexicon_probs("meong"), emb)
+    assert np.allclose(blended, 0.5 * classifier.lexicon_probs("meong") + 0.5 * emb)
+    assert classifier.blend(None, emb) is emb
+    assert _classifier(enabled=False).embedding_probs("hujan lagi") is None
@@ -0,0 +1,63 @@
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import pytest
+
+from app.schemas import Message
+from app.services.semantic_cache import SemanticCache, semantic_context_key
+from benchmarks.bench_memory import StubEmbedder
+
+
+@pytest.fixture()
+def stub_model(monkeypatch):
+    from app.services import memory
+
+    model = StubEmbedder(32)
+    monkeypatch.setattr(memory, "get_embedding_model", lambda: model)
+    return model
+
+
+def _fill(cache, persona, context, text, reply):
+    probe = cache.lookup(persona, context, text)
+    assert probe.hit is None
+    cache.put(probe, reply)
+
+
+def test_lookup_matches_within_threshold_and_context(stub_model):
+    cache = SemanticCache(threshold=0.7, ttl=60, max_entries=10, max_chars=120)
+    greeting = semantic_context_key("ceria", [Message(role="user", content="hai")], 0)
+    _fill(cache, "ceria", greeting, "hai kamu lagi apa", "Lagi nungguin kamu dong!")
+
+    hit = cache.lookup("ceria", greeting, "hai   kamu lagi ngapain").hit
+    assert hit.text == "Lagi nungguin kamu dong!"
+    assert 0.7 <= hit.similarity < 1.0
+    assert cache.lookup("ceria", greeting, "jelaskan teori relativitas umum").hit is None
+    assert cache.lookup("ceria", "konteks-lain", "hai kamu lagi apa").hit is None
+    assert cache.lookup("ceria", greeting, "x" * 121) is None
+
+    # Giliran sebelumnya ikut menentukan konteks kalau SEMANTIC_CACHE_CONTEXT_TURNS > 0
+    history = [Message(role="assistant", content="Kamu kemana aja?"), Message(role="user", content="hai")]
+    assert semantic_context_key("ceria", history, 0) == greeting
+    assert semantic_context_key("ceria", history, 1) != greeting
+
+
+def test_entries_expire_and_evict_least_recently_hit(stub_model, monkeypatch):
+    cache = SemanticCache(threshold=0.99, ttl=60, max_entries=2, max_chars=120)
+    _fill(cache, "ceria", "ctx", "selamat pagi", "Pagi juga!")
+    _fill(cache, "ceria", "ctx", "selamat malam", "Malam juga!")
+    assert cache.lookup("ceria", "ctx", "selamat pagi").hit is not None
+
+    _fill(cache, "ceria", "ctx", "selamat siang", "Siang juga!")
+    assert cache.lookup("ceria", "ctx", "selamat malam").hit is None
+    assert cache.lookup("ceria", "ctx", "selamat pagi").hit is not None
+    assert cache.stats()["evictions"] == 1
+
+    later = time.time() + 61
+    monkeypatch.setattr(time, "time", lambda: later)
+    assert cache.lookup("ceria", "ctx", "selamat siang").hit is None
+    assert cache.stats()["entries"] == {"ceria": 0}
@@ -0,0 +1,22 @@
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from benchmarks.startup_report import measure_imports
+
+# Budget impor `app.main` (ms); bisa dilonggarkan di mesin CI yang lambat
+IMPORT_BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "1000"))
+
+
+def test_app_import_defers_heavy_dependencies_and_fits_budget():
+    report = measure_imports("app.main")
+
+    assert report["heavy_loaded"] == []
+    assert report["total_ms"] is not None
+    assert report["total_ms"] < IMPORT_BUDGET_MS, sorted(
+        report["modules"], key=lambda m: m["self_us"], reverse=True
+    )[:10]
@@ -185,7 +185,7 @@ export default function App() {
     try {
       const headers = { "Content-Type": "application/json", "Accept": "text/event-stream", "X-Gemini-Api-Key": apiKey };
       const res = await fetch(CHAT_URL, {
-        method: "POST", headers, body: JSON.stringify({ messages: history, persona: styleName, image_base64: currentImageBase64 }),
+        method: "POST", headers, body: JSON.stringify({ messages: history, persona: styleName, image_base64: currentImageBase64, emit_emotion: true }),
       });
 
       if (!res.ok) {
@@ -198,33 +198,58 @@ export default function App() {
       if (res.ok && res.body) {
         const id = crypto.randomUUID();
         setMessages((m) => [...m, { id, role: "assistant", content: "" }]);
-        const reader = res.body.getReader();
+        const streamId = res.headers.get("X-Stream-Id");
         const decoder = new TextDecoder("utf-8");
-        let buffer = "";
-        while (true) {
-          const { value, done } = await reader.read();
-          if (done) break;
-          buffer += decoder.decode(value, { stream: true });
-          const blocks = buffer.split("\n\n");
-          buffer = blocks.pop() || "";
-          for (const blk of blocks) {
-            let eventType = "message";
-            const dataLines: string[] = [];
-            for (const line of blk.split("\n")) {
-              if (!line.trim()) continue;
-              if (line.startsWith("event:")) eventType = line.slice(6).trim();
-              else if (line.startsWith("data:")) dataLines.push(line.slice(5).trim());
-            }
-            const data = dataLines.join("\n");
-            if (!data) continue;
-            if (eventType === "token") {
-              finalText += data;
-              setMessages((m) => m.map((msg) => msg.id === id ? { ...msg, content: (msg.content || "") + data } : msg));
+        let gotEmotion = false;
+        let sawDone = false;
+        let lastEventId: string | null = null;
+        let body: ReadableStream<Uint8Array> | null = res.body;
+        for (let attempt = 0; body; attempt++) {
+          const reader = body.getReader();
+          body = null;
+          let buffer = "";
+          try {
+            while (true) {
+              const { value, done } = await reader.read();
+              if (done) break;
+              buffer += decoder.decode(value, { stream: true });
+              const blocks = buffer.split("\n\n");
+              buffer = blocks.pop() || "";
+              for (const blk of blocks) {
+                let eventType = "message";
+                const dataLines: string[] = [];
+                for (const line of blk.split("\n")) {
+                  if (!line.trim()) continue;
+                  if (line.startsWith("id:")) lastEventId = line.slice(3).trim();
+                  else if (line.startsWith("event:")) eventType = line.slice(6).trim();
+                  else if (line.startsWith("data:")) dataLines.push(line.slice(5).trim());
+                }
+                const data = dataLines.join("\n");
+                if (!data) continue;
+                if (eventType === "token") {
+                  finalText += data;
+                  setMessages((m) => m.map((msg) => msg.id === id ? { ...msg, content: (msg.content || "") + data } : msg));
+                } else if (eventType === "emotion") {
+                  try { applyEmotion(JSON.parse(data), setAvatar); gotEmotion = true; } catch {}
+                } else if (eventType === "done") {
+                  sawDone = true;
+                }
+              }
             }
+          } catch (readErr) {
+            // Koneksi putus di tengah jawaban: sambung lagi dari event terakhir, tanpa generasi ulang
+            if (sawDone || !streamId || attempt >= 2) throw readErr;
+            await new Promise((r) => setTimeout(r, 500 * (attempt + 1)));
+            const resumed = await fetch(`${CHAT_URL}/stream/${streamId}`, {
+              headers: lastEventId ? { "Last-Event-ID": lastEventId } : {},
+            });
+            if (!resumed.ok || !resumed.body) throw readErr;
+            body = resumed.body;
           }
         }
         setTyping(false); setSending(false);
-        if (finalText.trim()) await updateEmotion(finalText.trim(), persona, setAvatar, apiKey);
+        // Fallback ke /emotion hanya kalau server tidak mengirim event emotion
+        if (!gotEmotion && finalText.trim()) await updateEmotion(finalText.trim(), persona, setAvatar, apiKey);
         return;
       }
     } catch (err) {
@@ -347,7 +372,10 @@ async function updateEmotion(text: string, persona: string, setAvatar: Dispatch<
       body: JSON.stringify({ text, persona }),
     });
     if (!res.ok) return;
-    const j = await res.json();
-    setAvatar({ emotion: (j.emotion as Emotion) ?? "neutral", blink: j.blink ?? true, wink: j.wink ?? false, headSwaySpeed: j.headSwaySpeed ?? 1.0, glow: j.glow ?? "#a78bfa" });
+    applyEmotion(await res.json(), setAvatar);
   } catch {}
+}
+
+function applyEmotion(j: any, setAvatar: Dispatch<SetStateAction<AvatarState>>) {
+  setAvatar({ emotion: (j.emotion as Emotion) ?? "neutral", blink: j.blink ?? true, wink: j.wink ?? false, headSwaySpeed: j.headSwaySpeed ?? 1.0, glow: j.glow ?? "#a78bfa" });
 }
\ No newline at end of file
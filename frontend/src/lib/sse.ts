@@ -2,19 +2,21 @@ type ChatPayload = {
   messages: Array<{ role: "system" | "user" | "assistant"; content: string }>;
   persona?: string;
   use_memory: boolean;
+  emit_emotion?: boolean;
 };
 
 type StreamHandlers = {
   onToken: (token: string) => void;
   onDone: () => void;
   onError: (message: string) => void;
+  onEmotion?: (emotion: Record<string, unknown>) => void;
 };
 
 export const streamChat = (
   payload: ChatPayload,
   handlers: StreamHandlers,
 ) => {
-  const { onToken, onDone, onError } = handlers;
+  const { onToken, onDone, onError, onEmotion } = handlers;
   const controller = new AbortController();
 
   (async () => {
@@ -62,6 +64,12 @@ export const streamChat = (
             onDone();
           } else if (parsed.event === "error") {
             onError(parsed.data);
+          } else if (parsed.event === "emotion" && onEmotion) {
+            try {
+              onEmotion(JSON.parse(parsed.data));
+            } catch {
+              // Payload emosi rusak: abaikan, avatar tetap pakai state lama
+            }
           }
         }
       }